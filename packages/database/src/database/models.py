@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import List, Optional
 
+from sqlalchemy import JSON, Column
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -55,6 +56,10 @@ class ApiKey(SQLModel, table=True):
     deleted: bool = Field(default=False)
     credits_consumed: float = Field(default=0.0)
     last_used: Optional[datetime] = None
+    # {"policy": "cheapest" | "fastest" | "throughput" | "balanced",
+    #  "max_cost": USD per 1M tokens, "latency_target_ms": p90 TTFT for
+    #  streams, p90 response time for non-stream requests}
+    routing_policy: Optional[dict] = Field(default=None, sa_column=Column(JSON))
 
     user: User = Relationship(back_populates="api_keys")
     organization: Organization = Relationship(back_populates="api_keys")
@@ -77,6 +82,12 @@ class RequestLog(SQLModel, table=True):
     is_cached: bool = Field(default=False)
     timestamp: datetime = Field(default_factory=datetime.utcnow, index=True)
 
+    # Streaming only: measured when the stream finishes
+    ttft_ms: Optional[int] = None  # request start -> first chunk
+    stream_duration_ms: Optional[int] = None  # request start -> last chunk
+    chunk_count: Optional[int] = None
+    tokens_per_sec: Optional[float] = None  # completion tokens / generation time
+
 
 class EvaluationPair(SQLModel, table=True):
     """The Data Flywheel: Stores Primary vs Shadow response for RLHF."""
@@ -91,6 +102,17 @@ class EvaluationPair(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class ShadowTarget(SQLModel, table=True):
+    """A model to shadow a primary model with, for EvaluationPair collection."""
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    model_slug: str = Field(index=True)  # primary model, or "*" for every model
+    shadow_model: str  # LiteLLM model string, e.g. "groq/llama3-8b-8192"
+    sample_rate: float = Field(default=0.01)  # share of requests shadowed
+    enabled: bool = Field(default=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class Company(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
@@ -10,6 +10,7 @@ from database.models import (
 )
 from database.session import engine
 from shared.auth_utils import hash_password
+from shared.events import publish_invalidation
 from sqlmodel import select
 
 
@@ -829,6 +830,9 @@ async def seed_data():
 
         await conn.run_sync(sync_seed)
 
+    # Running gateways rebuild their in-memory routing tables
+    await publish_invalidation("catalog")
+
 
 if __name__ == "__main__":
     asyncio.run(seed_data())
@@ -1,5 +1,6 @@
 import os
 
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
@@ -10,6 +11,10 @@ DATABASE_URL = os.getenv(
 
 engine = create_async_engine(DATABASE_URL, echo=True, future=True)
 
+# What a query can fail with: SQLAlchemy wraps driver errors, but failing to
+# reach the server surfaces as OSError (including connect timeouts)
+DB_ERRORS = (SQLAlchemyError, OSError)
+
 
 async def get_session() -> AsyncSession:
     async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
@@ -1,47 +1,477 @@
+import asyncio
+import hashlib
+import json
 import os
+import time
+from typing import NamedTuple
 
+import redis.asyncio as redis
+from redisvl.exceptions import RedisVLError
 from redisvl.extensions.cache.llm import SemanticCache
-from redisvl.utils.vectorize.text.huggingface import HFTextVectorizer
+from redisvl.query.filter import Tag
+
+from shared.embeddings import EmbeddingBatcher
+from shared.instrumentation import meter
+from shared.lru import TTLCache
+from shared.vector_index import LocalVectorIndex
+from shared.vectorizers import CACHE_VECTORIZER, build_vectorizer
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# L1: in-process exact match (0 entries disables it)
+CACHE_L1_SIZE = int(os.getenv("CACHE_L1_SIZE", "10000"))
+CACHE_L1_TTL = float(os.getenv("CACHE_L1_TTL", "300"))
+# L2: exact match in Redis, shared by all replicas (0 disables it)
+CACHE_L2_TTL = int(os.getenv("CACHE_L2_TTL", "3600"))
+EXACT_KEY_PREFIX = "himmi:exact:"
+
+# Semantic tier namespaces: one per model slug, and per org when isolated
+CACHE_ISOLATE_ORGS = os.getenv("CACHE_ISOLATE_ORGS", "true").lower() == "true"
+CACHE_SEMANTIC_TTL = int(os.getenv("CACHE_SEMANTIC_TTL", "86400"))
+CACHE_SEMANTIC_MAX_ENTRIES = int(os.getenv("CACHE_SEMANTIC_MAX_ENTRIES", "5000"))
+CACHE_DISTANCE_THRESHOLD = float(os.getenv("CACHE_DISTANCE_THRESHOLD", "0.04"))
+# Per-model overrides of the three settings above, e.g.
+# {"openai/gpt-4o": {"ttl": 3600, "max_entries": 1000, "distance_threshold": 0.02}}
+CACHE_MODEL_OVERRIDES: dict[str, dict] = json.loads(
+    os.getenv("CACHE_MODEL_OVERRIDES") or "{}"
+)
+# Access-ordered entry keys per namespace, used for LRU eviction
+LRU_KEY_PREFIX = "himmi:cache:lru:"
+
+# In-process vector index: "fallback" (used while Redis is unreachable),
+# "front" (checked before Redis, holds the hottest entries) or "off"
+CACHE_LOCAL_INDEX = os.getenv("CACHE_LOCAL_INDEX", "fallback").lower()
+CACHE_LOCAL_MAX_ENTRIES = int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", "20000"))
+# Snapshot manifest path; empty keeps the index memory-only
+CACHE_LOCAL_SNAPSHOT = os.getenv("CACHE_LOCAL_SNAPSHOT", "")
+CACHE_LOCAL_SNAPSHOT_INTERVAL = float(os.getenv("CACHE_LOCAL_SNAPSHOT_INTERVAL", "300"))
+
+TIERS = ("l1", "l2", "local", "semantic")
+
+_lookups = meter.create_counter(
+    "cache.lookups", description="Response cache lookups by tier and result"
+)
+_lookup_latency = meter.create_histogram(
+    "cache.lookup_latency", unit="ms", description="Response cache lookup time by tier"
+)
+_evictions = meter.create_counter(
+    "cache.semantic.evictions", description="Semantic entries evicted by LRU bounds"
+)
 
 cache = None
+embedder: EmbeddingBatcher | None = None
+local_index: LocalVectorIndex | None = None
 
 try:
-    # Initialize local embedding model via RedisVL vectorizer
-    # Using 'all-MiniLM-L6-v2' (384 dims)
-    vectorizer = HFTextVectorizer(model="sentence-transformers/all-MiniLM-L6-v2")
-
-    # Initialize Redis Semantic Cache
-    cache = SemanticCache(
-        name="himmi_cache",
-        redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0"),
-        distance_threshold=0.04,
-        vectorizer=vectorizer,
+    # Local embedding model ('all-MiniLM-L6-v2', 384 dims) on the backend
+    # chosen by CACHE_VECTORIZER (torch, onnx or onnx-int8)
+    vectorizer = build_vectorizer()
+
+    # Prompts are embedded here, batched off the event loop, and the
+    # vectors handed to the semantic tiers
+    embedder = EmbeddingBatcher(
+        lambda texts: vectorizer.embed_many(texts, batch_size=len(texts))
     )
+    print(f"Semantic cache embeddings: {CACHE_VECTORIZER} ({vectorizer.dims} dims)")
 except Exception as e:
-    print(
-        f"Warning: Failed to initialize Redis Semantic Cache ({e}). Caching disabled."
+    print(f"Warning: Failed to load the cache embedding model ({e}). Caching disabled.")
+
+if embedder is not None:
+    try:
+        # Initialize Redis Semantic Cache
+        cache = SemanticCache(
+            name="himmi_cache_ns",
+            redis_url=REDIS_URL,
+            distance_threshold=CACHE_DISTANCE_THRESHOLD,
+            vectorizer=vectorizer,
+            # Entries are tagged with their namespace and conversation history
+            filterable_fields=[
+                {"name": "model", "type": "tag"},
+                {"name": "org", "type": "tag"},
+                {"name": "context", "type": "tag"},
+            ],
+        )
+    except Exception as e:
+        print(f"Warning: Failed to initialize Redis Semantic Cache ({e}).")
+        cache = None
+
+    if CACHE_LOCAL_INDEX in ("fallback", "front"):
+        local_index = LocalVectorIndex(
+            dims=vectorizer.dims,
+            max_entries=CACHE_LOCAL_MAX_ENTRIES,
+            snapshot_path=CACHE_LOCAL_SNAPSHOT or None,
+        )
+        print(
+            "In-process semantic index: HNSW graphs for large namespaces"
+            if local_index.ann == "hnswlib"
+            else "In-process semantic index: brute-force NumPy search "
+            "(install shared[fast-cache] for HNSW graphs)"
+        )
+    if cache is None:
+        print(
+            "Semantic caching uses the in-process index only."
+            if local_index
+            else "Semantic caching disabled."
+        )
+
+exact_cache = TTLCache(maxsize=CACHE_L1_SIZE, ttl=CACHE_L1_TTL)
+
+_client: redis.Redis | None = None
+_background: set = set()
+
+
+class CacheHit(NamedTuple):
+    response: str
+    tier: str
+
+
+class Namespace(NamedTuple):
+    """A model's (and optionally an org's) slice of the semantic tier."""
+
+    model: str
+    org: str  # "shared" when entries are shared across orgs
+    ttl: int
+    max_entries: int
+    distance_threshold: float
+
+    @property
+    def lru_key(self) -> str:
+        return f"{LRU_KEY_PREFIX}{self.model}:{self.org}"
+
+
+def namespace(model: str, org_id: int | None = None) -> Namespace:
+    overrides = CACHE_MODEL_OVERRIDES.get(model, {})
+    return Namespace(
+        model=model,
+        org=str(org_id) if CACHE_ISOLATE_ORGS and org_id is not None else "shared",
+        ttl=int(overrides.get("ttl", CACHE_SEMANTIC_TTL)),
+        max_entries=int(overrides.get("max_entries", CACHE_SEMANTIC_MAX_ENTRIES)),
+        distance_threshold=float(
+            overrides.get("distance_threshold", CACHE_DISTANCE_THRESHOLD)
+        ),
+    )
+
+
+def context_fingerprint(messages: list[dict]) -> str:
+    """Hash of everything before the last message (system prompt, history).
+
+    The semantic tier only matches prompts asked in the same conversation
+    context; the last message is what gets embedded.
+    """
+    return _digest(messages[:-1])[:32]
+
+
+class _TierStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.total_ms = 0.0
+
+    def record(self, result: str, elapsed_ms: float):
+        if result == "hit":
+            self.hits += 1
+        elif result == "miss":
+            self.misses += 1
+        else:
+            self.errors += 1
+        self.total_ms += elapsed_ms
+
+    def as_dict(self) -> dict:
+        lookups = self.hits + self.misses + self.errors
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "avg_latency_ms": (self.total_ms / lookups) if lookups else 0.0,
+        }
+
+
+_tier_stats: dict[str, _TierStats] = {tier: _TierStats() for tier in TIERS}
+
+
+def _get_client() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.from_url(REDIS_URL)
+    return _client
+
+
+def _digest(value) -> str:
+    payload = json.dumps(
+        value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cache_key(
+    model: str,
+    messages: list[dict],
+    params: dict | None = None,
+    org_id: int | None = None,
+) -> str:
+    """Exact-match key: a hash of the namespace, the full conversation and
+    the generation parameters that change the output."""
+    org = namespace(model, org_id).org
+    return _digest(
+        {"model": model, "org": org, "messages": messages, "params": params or {}}
     )
-    cache = None
 
 
-async def check_cache(prompt: str):
-    if not cache:
+def _record(tier: str, result: str, started: float):
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    _tier_stats[tier].record(result, elapsed_ms)
+    _lookups.add(1, {"tier": tier, "result": result})
+    _lookup_latency.record(elapsed_ms, {"tier": tier})
+
+
+async def _get_exact(key: str) -> str | None:
+    started = time.perf_counter()
+    try:
+        value = await _get_client().get(EXACT_KEY_PREFIX + key)
+    except redis.RedisError as e:
+        _record("l2", "error", started)
+        print(f"Exact cache check failed: {e}")
         return None
+    _record("l2", "miss" if value is None else "hit", started)
+    return None if value is None else value.decode()
+
+
+async def _set_exact(key: str, response: str):
     try:
-        # acheck performs async vectorization and search
-        results = await cache.acheck(prompt=prompt)
-        if results:
-            return results[0]["response"]
+        await _get_client().set(EXACT_KEY_PREFIX + key, response, ex=CACHE_L2_TTL)
+    except redis.RedisError as e:
+        print(f"Exact cache store failed: {e}")
+
+
+def _in_background(coro):
+    # Off the request path: the caller already has its answer
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+def _semantic_filter(ns: Namespace, context: str):
+    return (
+        (Tag("model") == ns.model)
+        & (Tag("org") == ns.org)
+        & (Tag("context") == context)
+    )
+
+
+async def _check_semantic(
+    prompt: str, vector: list[float], ns: Namespace, context: str
+) -> tuple[str | None, bool]:
+    """Redis semantic lookup. Returns (response, whether Redis answered)."""
+    started = time.perf_counter()
+    try:
+        results = await cache.acheck(
+            prompt=prompt,
+            vector=vector,
+            filter_expression=_semantic_filter(ns, context),
+            distance_threshold=ns.distance_threshold,
+        )
     except Exception as e:
+        _record("semantic", "error", started)
         print(f"Cache check failed: {e}")
+        return None, False
+    _record("semantic", "hit" if results else "miss", started)
+    if not results:
+        return None, True
+    _in_background(_touch(ns, results[0]["key"]))
+    return results[0]["response"], True
+
+
+def _check_local(vector: list[float], ns: Namespace, context: str) -> str | None:
+    started = time.perf_counter()
+    hit = local_index.search(_local_tag(ns, context), vector, ns.distance_threshold)
+    _record("local", "miss" if hit is None else "hit", started)
+    return None if hit is None else hit.response
+
+
+def _local_tag(ns: Namespace, context: str) -> str:
+    return f"{ns.model}|{ns.org}|{context}"
+
+
+async def _lookup_semantic(prompt: str, ns: Namespace, context: str) -> CacheHit | None:
+    """Local index (as front, or when Redis is down), then Redis semantic."""
+    try:
+        vector = await embedder.embed(prompt)
+    except Exception as e:  # noqa: BLE001 - backend-specific (torch/onnx) errors
+        # A cache that cannot embed is a miss, never a failed request
+        print(f"Cache embedding failed: {e}")
+        return None
+
+    front = local_index is not None and CACHE_LOCAL_INDEX == "front"
+    if local_index is not None and (front or cache is None):
+        response = _check_local(vector, ns, context)
+        if response is not None:
+            return CacheHit(response, "local")
+    if cache is None:
+        return None
+
+    response, available = await _check_semantic(prompt, vector, ns, context)
+    if response is not None:
+        if front:
+            local_index.add(_local_tag(ns, context), prompt, vector, response, ns.ttl)
+        return CacheHit(response, "semantic")
+    if not available and local_index is not None and not front:
+        # Redis went away after startup: serve what the fallback holds
+        response = _check_local(vector, ns, context)
+        if response is not None:
+            return CacheHit(response, "local")
     return None
 
 
-async def store_cache(prompt: str, response: str):
-    if not cache:
+async def _touch(ns: Namespace, entry_key: str):
+    """Marks an entry as recently used and extends its TTL (sliding expiry)."""
+    try:
+        async with _get_client().pipeline(transaction=False) as pipe:
+            pipe.zadd(ns.lru_key, {entry_key: time.time()})
+            pipe.expire(entry_key, ns.ttl)
+            pipe.expire(ns.lru_key, ns.ttl)
+            await pipe.execute()
+    except redis.RedisError as e:
+        print(f"Cache LRU update failed: {e}")
+
+
+async def _track_and_evict(ns: Namespace, entry_key: str) -> int:
+    """Adds a stored entry to its namespace's LRU set and evicts past
+    `max_entries`. Returns the number of entries evicted."""
+    now = time.time()
+    client = _get_client()
+    async with client.pipeline(transaction=False) as pipe:
+        # Untouched for a full TTL means the entry itself has expired
+        pipe.zremrangebyscore(ns.lru_key, 0, now - ns.ttl)
+        pipe.zadd(ns.lru_key, {entry_key: now})
+        pipe.expire(ns.lru_key, ns.ttl)
+        pipe.zcard(ns.lru_key)
+        *_, size = await pipe.execute()
+
+    excess = size - ns.max_entries
+    if excess <= 0:
+        return 0
+    victims = [key for key, _ in await client.zpopmin(ns.lru_key, excess)]
+    if victims:
+        await client.delete(*victims)
+        _evictions.add(len(victims), {"model": ns.model})
+    return len(victims)
+
+
+async def check_cache(
+    model: str,
+    messages: list[dict],
+    params: dict | None = None,
+    org_id: int | None = None,
+) -> CacheHit | None:
+    """Looks the request up in L1, then L2, then the semantic tier.
+
+    Every tier is scoped to the model's namespace (and `org_id`'s, when
+    CACHE_ISOLATE_ORGS is on). A hit in a lower tier is copied into the
+    tiers above it.
+    """
+    if not messages:
+        return None
+    key = cache_key(model, messages, params, org_id)
+
+    if CACHE_L1_SIZE > 0:
+        started = time.perf_counter()
+        response = exact_cache.get(key)
+        _record("l1", "miss" if response is None else "hit", started)
+        if response is not None:
+            return CacheHit(response, "l1")
+
+    if CACHE_L2_TTL > 0:
+        response = await _get_exact(key)
+        if response is not None:
+            exact_cache.set(key, response)
+            return CacheHit(response, "l2")
+
+    if embedder is not None:
+        hit = await _lookup_semantic(
+            messages[-1]["content"],
+            namespace(model, org_id),
+            context_fingerprint(messages),
+        )
+        if hit is not None:
+            exact_cache.set(key, hit.response)
+            if CACHE_L2_TTL > 0:
+                _in_background(_set_exact(key, hit.response))
+            return hit
+
+    return None
+
+
+async def store_cache(
+    model: str,
+    messages: list[dict],
+    response: str,
+    params: dict | None = None,
+    org_id: int | None = None,
+):
+    """Writes a fresh completion to every tier."""
+    if not messages:
         return
+    key = cache_key(model, messages, params, org_id)
+    exact_cache.set(key, response)
+    if CACHE_L2_TTL > 0:
+        await _set_exact(key, response)
+    if embedder is None:
+        return
+
+    ns = namespace(model, org_id)
+    context = context_fingerprint(messages)
+    prompt = messages[-1]["content"]
     try:
-        # astore performs async vectorization and storage
-        await cache.astore(prompt=prompt, response=response)
-    except Exception as e:
-        print(f"Cache store failed: {e}")
+        # Usually memoized from the lookup that missed
+        vector = await embedder.embed(prompt)
+    except Exception as e:  # noqa: BLE001 - backend-specific (torch/onnx) errors
+        print(f"Cache embedding failed: {e}")
+        return
+
+    stored = False
+    if cache is not None:
+        try:
+            entry_key = await cache.astore(
+                prompt=prompt,
+                response=response,
+                vector=vector,
+                filters={"model": ns.model, "org": ns.org, "context": context},
+                ttl=ns.ttl,
+            )
+            stored = True
+            await _track_and_evict(ns, entry_key)
+        except (redis.RedisError, RedisVLError) as e:
+            print(f"Cache store failed: {e}")
+
+    if local_index is not None and (CACHE_LOCAL_INDEX == "front" or not stored):
+        local_index.add(_local_tag(ns, context), prompt, vector, response, ns.ttl)
+
+
+async def snapshot_local_index():
+    if local_index is not None:
+        try:
+            await local_index.snapshot()
+        except OSError as e:
+            print(f"Vector index snapshot failed: {e}")
+
+
+async def snapshot_periodically(interval: float = CACHE_LOCAL_SNAPSHOT_INTERVAL):
+    """Keeps the on-disk copy of the local index warm for the next restart."""
+    if local_index is None or not local_index.snapshot_path:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        await snapshot_local_index()
+
+
+def stats() -> dict:
+    return {
+        **{tier: _tier_stats[tier].as_dict() for tier in TIERS},
+        "l1_size": len(exact_cache),
+        "semantic_enabled": cache is not None,
+        "vectorizer": CACHE_VECTORIZER,
+        "embeddings": embedder.stats() if embedder else None,
+        "local_index": local_index.stats() if local_index else None,
+    }
@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+from shared.instrumentation import meter
+from shared.lru import TTLCache
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "1"))
+EMBEDDING_MEMO_SIZE = int(os.getenv("EMBEDDING_MEMO_SIZE", "10000"))
+EMBEDDING_MEMO_TTL = float(os.getenv("EMBEDDING_MEMO_TTL", "600"))
+
+Vector = list[float]
+EmbedMany = Callable[[list[str]], list[Vector]]
+
+_batch_size = meter.create_histogram(
+    "embeddings.batch_size", unit="{text}", description="Texts per embedding batch"
+)
+_batch_latency = meter.create_histogram(
+    "embeddings.batch_latency", unit="ms", description="Embedding time per batch"
+)
+_requests = meter.create_counter(
+    "embeddings.requests", description="Embedding requests by how they were served"
+)
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class EmbeddingBatcher:
+    """Collects concurrent embedding requests into batches run off the loop.
+
+    Requests queue until `max_batch` texts are waiting or `max_wait_ms`
+    has passed since the first one, then the batch is embedded in one
+    `embed_many` call on a worker thread (the model releases the GIL in
+    its matmuls). Results are memoized by text hash, so a prompt embedded
+    for a cache lookup is not embedded again when the response is stored,
+    and identical texts in flight share one slot in the batch.
+    """
+
+    def __init__(
+        self,
+        embed_many: EmbedMany,
+        max_batch: int = EMBEDDING_BATCH_SIZE,
+        max_wait_ms: float = EMBEDDING_MAX_WAIT_MS,
+        workers: int = EMBEDDING_WORKERS,
+        memo_size: int = EMBEDDING_MEMO_SIZE,
+        memo_ttl: float = EMBEDDING_MEMO_TTL,
+    ):
+        self._embed_many = embed_many
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="embed"
+        )
+        self.memo = TTLCache(maxsize=memo_size, ttl=memo_ttl)
+
+        self._pending: list[tuple[str, str, asyncio.Future]] = []
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._timer: asyncio.TimerHandle | None = None
+
+        self.batches = 0
+        self.embedded = 0
+
+    async def embed(self, text: str) -> Vector:
+        digest = text_digest(text)
+        vector = self.memo.get(digest)
+        if vector is not None:
+            _requests.add(1, {"source": "memo"})
+            return vector
+
+        future = self._inflight.get(digest)
+        if future is not None:
+            _requests.add(1, {"source": "inflight"})
+        else:
+            _requests.add(1, {"source": "batch"})
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._inflight[digest] = future
+            self._pending.append((digest, text, future))
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.max_wait, self._flush)
+
+        # A cancelled caller must not cancel the result for the others
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            texts = [text for _, text, _ in batch]
+            started = time.perf_counter()
+            work = asyncio.get_running_loop().run_in_executor(
+                self._executor, self._embed_many, texts
+            )
+            work.add_done_callback(lambda done: self._settle(batch, started, done))
+
+    def _settle(
+        self,
+        batch: list[tuple[str, str, asyncio.Future]],
+        started: float,
+        work: asyncio.Future,
+    ):
+        error = work.exception() if not work.cancelled() else None
+        if work.cancelled() or error is not None:
+            for digest, _, future in batch:
+                self._inflight.pop(digest, None)
+                if future.done():
+                    continue
+                if error is None:
+                    future.cancel()
+                else:
+                    future.set_exception(error)
+                    # Retrieved here so callers that gave up don't log it again
+                    future.exception()
+            return
+
+        self.batches += 1
+        self.embedded += len(batch)
+        _batch_size.record(len(batch))
+        _batch_latency.record((time.perf_counter() - started) * 1000)
+        for (digest, _, future), vector in zip(batch, work.result()):
+            self.memo.set(digest, vector)
+            self._inflight.pop(digest, None)
+            if not future.done():
+                future.set_result(vector)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "embedded": self.embedded,
+            "avg_batch_size": (self.embedded / self.batches) if self.batches else 0.0,
+            "memo": self.memo.stats(),
+        }
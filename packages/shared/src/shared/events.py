@@ -0,0 +1,80 @@
+import asyncio
+import contextlib
+import json
+import os
+from collections.abc import Awaitable, Callable
+
+import redis.asyncio as redis
+
+# Control plane -> gateway cache invalidation bus.
+# Messages look like {"kind": "api_key", "key": "<sha256>"}; a missing key
+# means "drop everything of this kind".
+INVALIDATION_CHANNEL = "himmi:invalidate"
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+Handler = Callable[[str | None], None | Awaitable[None]]
+
+_client: redis.Redis | None = None
+
+
+def _get_client() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.from_url(REDIS_URL)
+    return _client
+
+
+async def publish_invalidation(kind: str, key: str | None = None):
+    """Tells every gateway replica to drop cached state for `kind`/`key`."""
+    try:
+        await _get_client().publish(
+            INVALIDATION_CHANNEL, json.dumps({"kind": kind, "key": key})
+        )
+    except redis.RedisError as e:
+        # Gateway caches are TTL-bounded, so a lost message only means staleness
+        print(f"Invalidation publish failed ({kind}): {e}")
+
+
+async def _dispatch(handler: Handler, key: str | None):
+    # One failing handler must not take the listener down with it. Handlers
+    # are arbitrary callbacks registered by each service, so this stays broad
+    try:
+        result = handler(key)
+        if asyncio.iscoroutine(result):
+            await result
+    except Exception as e:  # noqa: BLE001
+        print(f"Invalidation handler failed: {e}")
+
+
+async def listen_invalidations(handlers: dict[str, Handler], retry_delay: float = 5.0):
+    """Subscribes to the invalidation channel and dispatches to `handlers` forever."""
+    reconnecting = False
+    while True:
+        pubsub = None
+        try:
+            pubsub = _get_client().pubsub()
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            if reconnecting:
+                # We may have missed messages while disconnected: flush everything
+                for handler in handlers.values():
+                    await _dispatch(handler, None)
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    event = json.loads(message["data"])
+                except ValueError as e:
+                    print(f"Invalidation message dropped: {e}")
+                    continue
+                handler = handlers.get(event.get("kind"))
+                if handler:
+                    await _dispatch(handler, event.get("key"))
+        except redis.RedisError as e:
+            print(f"Invalidation listener disconnected ({e}). Retrying...")
+            reconnecting = True
+        finally:
+            if pubsub is not None:
+                with contextlib.suppress(redis.RedisError):
+                    await pubsub.aclose()
+        await asyncio.sleep(retry_delay)
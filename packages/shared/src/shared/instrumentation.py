@@ -1,14 +1,22 @@
+import os
 from functools import wraps
 
-from opentelemetry import trace
+from opentelemetry import metrics, trace
+from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
 
 tracer = trace.get_tracer(__name__)
 
+# Instruments created from this meter are no-ops until `instrument_app`
+# installs a MeterProvider (only when OTEL_METRICS_ENDPOINT is set).
+meter = metrics.get_meter(__name__)
+
 
 def trace_node(name: str):
     def decorator(func):
@@ -37,5 +45,15 @@ def instrument_app(app, service_name: str):
 
     trace.set_tracer_provider(provider)
 
+    # Metrics go to a separate collector (Jaeger doesn't ingest OTLP metrics)
+    metrics_endpoint = os.getenv("OTEL_METRICS_ENDPOINT")
+    if metrics_endpoint:
+        reader = PeriodicExportingMetricReader(
+            OTLPMetricExporter(endpoint=metrics_endpoint, insecure=True)
+        )
+        metrics.set_meter_provider(
+            MeterProvider(resource=resource, metric_readers=[reader])
+        )
+
     # Automatic FastAPI Instrumentation
     FastAPIInstrumentor.instrument_app(app)
@@ -0,0 +1,307 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:  # optional (shared[fast-cache]): brute force everywhere
+    hnswlib = None
+
+
+class IndexHit(NamedTuple):
+    response: str
+    distance: float
+
+
+class _Graph:
+    """HNSW graph over one namespace's slots (labels are slot numbers).
+
+    A removed slot stays in the graph marked deleted. When the slot comes
+    back, adding its label again unmarks it and updates its vector in
+    place, so the graph never holds more than `max_entries` labels.
+    (hnswlib's replace_deleted would hand the slot some other deleted
+    element and leave two labels pointing at one node.)
+    """
+
+    def __init__(self, dims: int, capacity: int):
+        self.index = hnswlib.Index(space="cosine", dim=dims)
+        self.index.init_index(max_elements=capacity, ef_construction=100, M=16)
+        self.index.set_ef(64)
+
+    def add(self, slot: int, vector: np.ndarray):
+        if self.index.get_current_count() >= self.index.get_max_elements():
+            self.index.resize_index(self.index.get_max_elements() * 2)
+        self.index.add_items(vector[None, :], [slot])
+
+    def remove(self, slot: int):
+        self.index.mark_deleted(slot)
+
+
+class LocalVectorIndex:
+    """Bounded in-process ANN index for the semantic cache.
+
+    Vectors live in one preallocated float32 matrix (`max_entries` x
+    `dims`), so memory is fixed up front. Entries are grouped by tag (the
+    cache namespace + context) and searched with a NumPy dot product;
+    a tag that grows past `graph_threshold` entries gets an HNSW graph
+    when `hnswlib` is installed. When full, expired entries go first, then
+    the least recently used.
+
+    With `snapshot_path`, `snapshot()` saves the live entries to disk and a
+    restarted process memory-maps them back in, coming back warm instead
+    of empty.
+    """
+
+    def __init__(
+        self,
+        dims: int,
+        max_entries: int,
+        snapshot_path: str | None = None,
+        graph_threshold: int = 5000,
+    ):
+        self.dims = dims
+        self.max_entries = max_entries
+        self.snapshot_path = snapshot_path
+        self.graph_threshold = graph_threshold
+        self.ann = "hnswlib" if hnswlib is not None else "numpy"
+
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._live = np.zeros(max_entries, dtype=bool)
+        self._graphs: dict[str, _Graph] = {}
+        self._reset_state()
+
+        self.evictions = 0
+        self._generation = 0
+        self._written = 0
+        self._write_lock = threading.Lock()
+        self._vectors = self._open_matrix()
+        if hnswlib is not None:
+            for tag, slots in self._by_tag.items():
+                if len(slots) > self.graph_threshold:
+                    self._build_graph(tag)
+
+    # --- Storage ---
+
+    def _open_matrix(self) -> np.ndarray:
+        matrix = np.zeros((self.max_entries, self.dims), dtype=np.float32)
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            try:
+                self._restore(matrix)
+            except (OSError, ValueError, KeyError, IndexError) as e:
+                print(f"Vector index snapshot unreadable, starting cold: {e}")
+                self._reset_state()
+                matrix[:] = 0
+        return matrix
+
+    def _restore(self, matrix: np.ndarray):
+        with open(self.snapshot_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        self._generation = manifest["generation"]
+        # Memory-mapped: only the rows still live are paged in
+        saved = np.load(manifest["vectors"], mmap_mode="r")
+        if saved.shape[1] != self.dims:
+            print(f"Vector index snapshot has {saved.shape[1]} dims, starting cold")
+            return
+
+        now = time.time()
+        entries = [e for e in manifest["entries"] if e["expires"] > now]
+        # Most recently used first, in case the index was made smaller
+        entries.sort(key=lambda e: e["last_used"], reverse=True)
+        for entry in entries[: self.max_entries]:
+            slot = self._free.pop()
+            matrix[slot] = saved[entry["row"]]
+            self._place(slot, entry["tag"], entry["prompt"], entry["response"])
+            self._expires[slot] = entry["expires"]
+            self._last_used[slot] = entry["last_used"]
+
+    def _reset_state(self):
+        self._tags: list[str | None] = [None] * self.max_entries
+        self._prompts: list[str | None] = [None] * self.max_entries
+        self._responses: list[str | None] = [None] * self.max_entries
+        self._live[:] = False
+        self._by_tag: dict[str, set[int]] = {}
+        self._slot_of: dict[tuple, int] = {}  # (tag, prompt) -> slot
+        self._free: list[int] = list(range(self.max_entries - 1, -1, -1))
+
+    async def snapshot(self):
+        """Writes live entries to `<path>.<n>.npy` plus a JSON manifest.
+
+        The entries are copied on the event loop and written from a thread.
+        Both files go through a temp file and a rename, and the manifest
+        names the vector file it belongs to, so a crash mid-snapshot leaves
+        the previous one intact.
+        """
+        if not self.snapshot_path:
+            return
+        # Copied without awaiting, so the snapshot is of a single moment
+        slots = np.flatnonzero(self._live).tolist()
+        vectors = self._vectors[slots]
+        entries = [
+            {
+                "row": row,
+                "tag": self._tags[slot],
+                "prompt": self._prompts[slot],
+                "response": self._responses[slot],
+                "expires": float(self._expires[slot]),
+                "last_used": float(self._last_used[slot]),
+            }
+            for row, slot in enumerate(slots)
+        ]
+        self._generation += 1
+        await asyncio.to_thread(self._write, self._generation, vectors, entries)
+
+    def _write(self, generation: int, vectors: np.ndarray, entries: list[dict]):
+        with self._write_lock:
+            if generation <= self._written:
+                return  # a newer snapshot finished first
+            os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+            vectors_path = f"{self.snapshot_path}.{generation}.npy"
+            with open(vectors_path + ".tmp", "wb") as f:
+                np.save(f, vectors)
+            os.replace(vectors_path + ".tmp", vectors_path)
+
+            manifest = {
+                "generation": generation,
+                "vectors": vectors_path,
+                "entries": entries,
+            }
+            tmp = self.snapshot_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            os.replace(tmp, self.snapshot_path)
+            self._written = generation
+
+            # Older vector files are no longer referenced
+            prefix = os.path.basename(self.snapshot_path) + "."
+            directory = os.path.dirname(self.snapshot_path) or "."
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if (
+                    name.startswith(prefix)
+                    and name.endswith((".npy", ".npy.tmp"))
+                    and path != vectors_path
+                ):
+                    os.remove(path)
+
+    # --- Index operations ---
+
+    def __len__(self) -> int:
+        return self.max_entries - len(self._free)
+
+    def add(
+        self, tag: str, prompt: str, vector: list[float], response: str, ttl: float
+    ):
+        now = time.time()
+        slot = self._slot_of.get((tag, prompt))
+        if slot is not None:
+            self._remove(slot)
+        slot = self._allocate(now)
+
+        vec = np.array(vector, dtype=np.float32)
+        vec /= max(float(np.linalg.norm(vec)), 1e-12)
+        self._vectors[slot] = vec
+        slots = self._place(slot, tag, prompt, response)
+        self._expires[slot] = now + ttl
+        self._last_used[slot] = now
+
+        graph = self._graphs.get(tag)
+        if graph is not None:
+            graph.add(slot, vec)
+        elif hnswlib is not None and len(slots) > self.graph_threshold:
+            self._build_graph(tag)
+
+    def search(
+        self, tag: str, vector: list[float], distance_threshold: float
+    ) -> IndexHit | None:
+        """Closest live entry in `tag` within `distance_threshold` (cosine)."""
+        slots = self._by_tag.get(tag)
+        if not slots:
+            return None
+        query = np.array(vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        now = time.time()
+
+        graph = self._graphs.get(tag)
+        if graph is not None:
+            labels, distances = graph.index.knn_query(query, k=min(4, len(slots)))
+            candidates = zip(labels[0].tolist(), distances[0].tolist())
+        else:
+            idx = np.fromiter(slots, dtype=np.int64, count=len(slots))
+            sims = self._vectors[idx] @ query
+            order = np.argsort(-sims)[:4]
+            candidates = ((int(idx[i]), 1.0 - float(sims[i])) for i in order)
+
+        for slot, distance in candidates:
+            if distance > distance_threshold:
+                break
+            if self._expires[slot] <= now:
+                self._remove(slot)
+                continue
+            self._last_used[slot] = now
+            return IndexHit(self._responses[slot], distance)
+        return None
+
+    def _place(self, slot: int, tag: str, prompt: str, response: str) -> set[int]:
+        self._tags[slot] = tag
+        self._prompts[slot] = prompt
+        self._responses[slot] = response
+        self._live[slot] = True
+        self._slot_of[(tag, prompt)] = slot
+        slots = self._by_tag.setdefault(tag, set())
+        slots.add(slot)
+        return slots
+
+    def _allocate(self, now: float) -> int:
+        if self._free:
+            return self._free.pop()
+        expired = np.flatnonzero(self._live & (self._expires <= now)).tolist()
+        if expired:
+            for slot in expired:
+                self._remove(slot)
+        else:
+            # Least recently used
+            lru = np.where(self._live, self._last_used, np.inf)
+            self._remove(int(np.argmin(lru)))
+            self.evictions += 1
+        return self._free.pop()
+
+    def _remove(self, slot: int):
+        tag = self._tags[slot]
+        if tag is None:
+            return
+        slots = self._by_tag[tag]
+        slots.discard(slot)
+        graph = self._graphs.get(tag)
+        if graph is not None:
+            graph.remove(slot)
+        if not slots:
+            del self._by_tag[tag]
+            self._graphs.pop(tag, None)
+        self._slot_of.pop((tag, self._prompts[slot]), None)
+        self._tags[slot] = self._prompts[slot] = self._responses[slot] = None
+        self._live[slot] = False
+        self._free.append(slot)
+
+    def _build_graph(self, tag: str):
+        slots = sorted(self._by_tag[tag])
+        graph = _Graph(self.dims, capacity=max(len(slots) * 2, 1024))
+        graph.index.add_items(self._vectors[slots], slots)
+        self._graphs[tag] = graph
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "namespaces": len(self._by_tag),
+            "ann": self.ann,
+            "graphs": len(self._graphs),
+            "evictions": self.evictions,
+            "memory_mb": self._vectors.nbytes / 2**20,
+            "snapshot": self.snapshot_path,
+        }
@@ -0,0 +1,127 @@
+import os
+from typing import Any
+
+import numpy as np
+from pydantic import PrivateAttr
+from redisvl.utils.vectorize.base import BaseVectorizer
+
+# Embedding model behind the semantic cache. Every backend serves the same
+# weights, so switching backends does not require rebuilding the index.
+CACHE_EMBEDDING_MODEL = os.getenv(
+    "CACHE_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
+)
+# "torch" (sentence-transformers), "onnx" (fp32) or "onnx-int8" (quantized)
+CACHE_VECTORIZER = os.getenv("CACHE_VECTORIZER", "torch").lower()
+# Overrides the ONNX file picked for the backend (path inside the model repo)
+CACHE_ONNX_FILE = os.getenv("CACHE_ONNX_FILE")
+
+# Exports published in the sentence-transformers model repos
+ONNX_FILES = {
+    "onnx": "onnx/model.onnx",
+    # AVX2 is the most portable int8 kernel on x86 gateway boxes
+    "onnx-int8": "onnx/model_quint8_avx2.onnx",
+}
+MAX_SEQ_LENGTH = 256
+
+
+class OnnxTextVectorizer(BaseVectorizer):
+    """Sentence-transformers model run through ONNX Runtime, without torch.
+
+    Reproduces the model's mean pooling and L2 normalization in numpy, so
+    vectors are interchangeable with HFTextVectorizer's (up to quantization
+    error for the int8 export). Needs `onnxruntime`; the tokenizer and the
+    ONNX file are fetched from the Hugging Face Hub like the torch model.
+    """
+
+    _session: Any = PrivateAttr()
+    _tokenizer: Any = PrivateAttr()
+    _input_names: list[str] = PrivateAttr()
+
+    def __init__(
+        self,
+        model: str = CACHE_EMBEDDING_MODEL,
+        file_name: str = ONNX_FILES["onnx"],
+        dtype: str = "float32",
+        threads: int = 1,
+        **kwargs,
+    ):
+        super().__init__(model=model, dtype=dtype)
+        self._initialize_client(model, file_name, threads)
+        self.dims = len(self._embed("dimension check"))
+
+    def _initialize_client(self, model: str, file_name: str, threads: int):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError(
+                "OnnxTextVectorizer requires onnxruntime. "
+                "Please install with `pip install 'shared[fast-cache]'`"
+            )
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        tokenizer = Tokenizer.from_file(hf_hub_download(model, "tokenizer.json"))
+        tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        tokenizer.enable_padding()
+        self._tokenizer = tokenizer
+
+        options = ort.SessionOptions()
+        # One thread per session: the embedding batcher provides parallelism
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self._session = ort.InferenceSession(
+            hf_hub_download(model, file_name),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = [i.name for i in self._session.get_inputs()]
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+
+        token_embeddings = self._session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens, then L2 normalize
+        weights = mask[..., None].astype(np.float32)
+        summed = (token_embeddings * weights).sum(axis=1)
+        pooled = summed / np.clip(weights.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def _embed(self, content: str, **kwargs) -> list[float]:
+        return self._encode([content])[0].tolist()
+
+    def _embed_many(
+        self, contents: list[str], batch_size: int = 10, **kwargs
+    ) -> list[list[float]]:
+        vectors: list[list[float]] = []
+        for start in range(0, len(contents), batch_size):
+            vectors.extend(self._encode(contents[start : start + batch_size]).tolist())
+        return vectors
+
+    @property
+    def type(self) -> str:
+        return "onnx"
+
+
+def build_vectorizer(
+    backend: str = CACHE_VECTORIZER, model: str = CACHE_EMBEDDING_MODEL
+) -> BaseVectorizer:
+    """Creates the semantic cache's vectorizer for `backend`."""
+    if backend == "torch":
+        from redisvl.utils.vectorize.text.huggingface import HFTextVectorizer
+
+        return HFTextVectorizer(model=model)
+    if backend in ONNX_FILES:
+        return OnnxTextVectorizer(
+            model=model, file_name=CACHE_ONNX_FILE or ONNX_FILES[backend]
+        )
+    raise ValueError(
+        f"Unknown CACHE_VECTORIZER {backend!r}; "
+        f"expected one of: torch, {', '.join(ONNX_FILES)}"
+    )
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+bench_sse.py
+────────────
+Microbenchmark for the gateway's SSE chunk encoders: the original
+model_dump() + json.dumps path ("json") against the direct-to-bytes
+encoder ("fast"). Encodes realistic litellm streaming chunks and reports
+chunks/sec and µs per chunk for each.
+
+Usage:
+    uv run python scripts/bench_sse.py
+
+    # Longer run / different stream length:
+    CHUNKS=2000 ROUNDS=20 uv run python scripts/bench_sse.py
+"""
+
+import os
+import time
+
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+import litellm
+from inference_gateway.sse import FastEncoder, encode_json
+
+CHUNKS = int(os.getenv("CHUNKS", "500"))  # chunks per simulated stream
+ROUNDS = int(os.getenv("ROUNDS", "10"))
+
+
+def build_stream() -> list:
+    """One completion's worth of chunks, shaped like a real provider stream."""
+    common = {"id": "chatcmpl-bench", "created": 1_700_000_000, "model": "gpt-4o"}
+    chunks = [
+        litellm.ModelResponseStream(
+            **common,
+            choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}}],
+        )
+    ]
+    for i in range(CHUNKS):
+        chunks.append(
+            litellm.ModelResponseStream(
+                **common,
+                choices=[{"index": 0, "delta": {"content": f' tok"{i}é'}}],
+            )
+        )
+    chunks.append(
+        litellm.ModelResponseStream(
+            **common,
+            choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        )
+    )
+    return chunks
+
+
+def run(name: str, make_encoder, chunks: list) -> float:
+    total = 0
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        encode = make_encoder()
+        for chunk in chunks:
+            total += len(encode(chunk))
+    elapsed = time.perf_counter() - started
+    n = ROUNDS * len(chunks)
+    print(
+        f"{name:>5}: {n / elapsed:>12,.0f} chunks/s  "
+        f"{elapsed / n * 1e6:>7.2f} µs/chunk  ({total / n:.0f} B/chunk)"
+    )
+    return elapsed
+
+
+def main():
+    chunks = build_stream()
+    print(f"{len(chunks)} chunks x {ROUNDS} rounds\n")
+    baseline = run("json", lambda: encode_json, chunks)
+    fast = run("fast", FastEncoder, chunks)
+    print(f"\nfast is {baseline / fast:.1f}x the json encoder")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+bench_vectorizers.py
+────────────────────
+Compares the semantic cache's embedding backends (CACHE_VECTORIZER):
+torch (sentence-transformers), onnx (fp32) and onnx-int8 (quantized).
+
+Each backend runs in its own subprocess so load time and RSS are measured
+from a clean interpreter. Reports single-prompt latency, batched
+throughput, and cache-hit agreement with the torch backend: on a set of
+near-duplicate and unrelated prompt pairs, which pairs fall within the
+cache's distance threshold ("hits"), and the recall/precision of each
+backend's hits against torch's.
+
+Usage:
+    # onnx backends need the shared[fast-cache] extra (onnxruntime)
+    uv run python scripts/bench_vectorizers.py
+
+    BACKENDS=torch,onnx-int8 ITERATIONS=500 uv run python scripts/bench_vectorizers.py
+"""
+
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+BACKENDS = os.getenv("BACKENDS", "torch,onnx,onnx-int8").split(",")
+ITERATIONS = int(os.getenv("ITERATIONS", "200"))
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "32"))
+THRESHOLD = float(os.getenv("CACHE_DISTANCE_THRESHOLD", "0.04"))
+
+# (cached prompt, incoming prompt): near-duplicates a cache should catch
+# and look-alikes it must not
+PAIRS = [
+    ("What is the capital of France?", "what is the capital of france"),
+    ("What is the capital of France?", "What's the capital of France?"),
+    ("How do I reverse a list in Python?", "How do I reverse a list in python"),
+    ("How do I reverse a list in Python?", "How can I reverse a Python list?"),
+    ("Explain quantum entanglement simply.", "Explain quantum entanglement simply"),
+    ("Explain quantum entanglement simply.", "Explain quantum entanglment simply."),
+    ("Write a haiku about autumn.", "Write a haiku about autumn!"),
+    ("Write a haiku about autumn.", "Write a haiku about spring."),
+    ("Translate 'good morning' to Spanish.", "Translate 'good morning' to spanish"),
+    ("Translate 'good morning' to Spanish.", "Translate 'good night' to Spanish."),
+    ("Summarize the plot of Hamlet.", "Summarise the plot of Hamlet."),
+    ("Summarize the plot of Hamlet.", "Summarize the plot of Macbeth."),
+    ("What is 2 + 2?", "What is 2+2?"),
+    ("What is 2 + 2?", "What is 2 + 3?"),
+    ("Give me a recipe for pancakes.", "Give me a recipe for pancakes please"),
+    ("Give me a recipe for pancakes.", "Give me a recipe for waffles."),
+    ("Who wrote Pride and Prejudice?", "who wrote pride and prejudice?"),
+    ("Who wrote Pride and Prejudice?", "Who wrote War and Peace?"),
+    ("List the planets in the solar system.", "List the planets in our solar system."),
+    ("List the planets in the solar system.", "List the moons of Jupiter."),
+]
+
+PROMPT = "Summarize the key differences between TCP and UDP for a networking class."
+
+
+def rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_backend(backend: str) -> dict:
+    """Child process: measures one backend and prints JSON."""
+    import numpy as np
+    from shared.vectorizers import build_vectorizer
+
+    base_rss = rss_mb()
+    started = time.perf_counter()
+    vectorizer = build_vectorizer(backend)
+    load_s = time.perf_counter() - started
+
+    for _ in range(10):  # warm up
+        vectorizer.embed(PROMPT)
+
+    latencies = []
+    for _ in range(ITERATIONS):
+        t = time.perf_counter()
+        vectorizer.embed(PROMPT)
+        latencies.append((time.perf_counter() - t) * 1000)
+
+    batch = [f"{PROMPT} (variant {i})" for i in range(BATCH_SIZE)]
+    rounds = max(1, ITERATIONS // BATCH_SIZE)
+    t = time.perf_counter()
+    for _ in range(rounds):
+        vectorizer.embed_many(batch, batch_size=BATCH_SIZE)
+    throughput = rounds * BATCH_SIZE / (time.perf_counter() - t)
+
+    hits = []
+    for cached, incoming in PAIRS:
+        a, b = (np.array(v) for v in vectorizer.embed_many([cached, incoming]))
+        distance = 1 - float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+        hits.append(distance <= THRESHOLD)
+
+    latencies.sort()
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "rss_mb": rss_mb() - base_rss,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "texts_per_s": throughput,
+        "hits": hits,
+    }
+
+
+def main():
+    results = {}
+    for backend in BACKENDS:
+        try:
+            proc = subprocess.run(
+                [sys.executable, __file__, "--backend", backend],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+        except subprocess.CalledProcessError as e:
+            # e.g. an onnx backend without onnxruntime: report it, bench the rest
+            print(f"{backend}: failed\n{e.stderr.strip().splitlines()[-1]}\n")
+            continue
+        results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    print(
+        f"{'backend':<10} {'load s':>7} {'RSS MB':>7} {'p50 ms':>7} {'p95 ms':>7} "
+        f"{'texts/s':>8} {'hits':>5} {'recall':>7} {'prec':>6}"
+    )
+    reference = results.get("torch", {}).get("hits")
+    for backend, r in results.items():
+        recall = precision = "n/a"
+        hits = r["hits"]
+        if reference:
+            both = sum(a and b for a, b in zip(hits, reference))
+            recall = f"{both / max(sum(reference), 1):.2f}"
+            precision = f"{both / max(sum(hits), 1):.2f}"
+        print(
+            f"{backend:<10} {r['load_s']:>7.1f} {r['rss_mb']:>7.0f} "
+            f"{r['p50_ms']:>7.2f} {r['p95_ms']:>7.2f} {r['texts_per_s']:>8.0f} "
+            f"{sum(hits):>5} {recall:>7} {precision:>6}"
+        )
+    print(f"\nhits: pairs within distance {THRESHOLD}; recall/precision vs torch")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--backend":
+        print(json.dumps(run_backend(sys.argv[2])))
+    else:
+        main()
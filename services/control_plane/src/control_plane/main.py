@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from database.encryption import encrypt
 from database.models import (
@@ -9,14 +9,16 @@ from database.models import (
     Organization,
     Provider,
     RequestLog,
+    ShadowTarget,
     User,
     UserProviderKey,
 )
 from database.session import get_session
 from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from shared.auth_utils import hash_password, verify_password
+from shared.events import publish_invalidation
 from shared.instrumentation import instrument_app
 from shared.security import generate_api_key
 from sqlalchemy.orm import selectinload
@@ -120,6 +122,9 @@ async def create_new_key(
     session.add(new_key)
     await session.commit()
 
+    # Gateways may hold a negative cache entry for this hash
+    await publish_invalidation("api_key", key_hash)
+
     # Return the raw key ONLY once
     return {"id": new_key.id, "name": new_key.name, "api_key": raw_key}
 
@@ -131,6 +136,65 @@ async def list_api_keys(user_id: int, session: AsyncSession = Depends(get_sessio
     return res.scalars().all()
 
 
+async def _get_user_key(session: AsyncSession, key_id: int, user_id: int) -> ApiKey:
+    stmt = select(ApiKey).where(ApiKey.id == key_id, ApiKey.user_id == user_id)
+    res = await session.execute(stmt)
+    api_key = res.scalar_one_or_none()
+    if not api_key or api_key.deleted:
+        raise HTTPException(status_code=404, detail="API key not found")
+    return api_key
+
+
+@app.post("/api-keys/{key_id}/disable")
+async def disable_api_key(
+    key_id: int, user_id: int, session: AsyncSession = Depends(get_session)
+):
+    api_key = await _get_user_key(session, key_id, user_id)
+    api_key.disabled = True
+    await session.commit()
+
+    await publish_invalidation("api_key", api_key.key_hash)
+    return {"id": api_key.id, "disabled": True}
+
+
+@app.delete("/api-keys/{key_id}")
+async def delete_api_key(
+    key_id: int, user_id: int, session: AsyncSession = Depends(get_session)
+):
+    # Soft delete: RequestLog rows keep referencing the key
+    api_key = await _get_user_key(session, key_id, user_id)
+    api_key.deleted = True
+    api_key.disabled = True
+    await session.commit()
+
+    await publish_invalidation("api_key", api_key.key_hash)
+    return {"status": "deleted"}
+
+
+class RoutingPolicyRequest(BaseModel):
+    policy: Literal["default", "cheapest", "fastest", "throughput", "balanced"]
+    max_cost: Optional[float] = None  # USD per 1M input + output tokens
+    # p90 for "balanced": TTFT for streams, response time otherwise
+    latency_target_ms: Optional[float] = None
+
+
+@app.put("/api-keys/{key_id}/routing-policy")
+async def set_routing_policy(
+    key_id: int,
+    user_id: int,
+    req: RoutingPolicyRequest,
+    session: AsyncSession = Depends(get_session),
+):
+    """How the gateway picks among a model's providers for this key."""
+    api_key = await _get_user_key(session, key_id, user_id)
+    policy = req.model_dump(exclude_none=True)
+    api_key.routing_policy = None if policy == {"policy": "default"} else policy
+    await session.commit()
+
+    await publish_invalidation("api_key", api_key.key_hash)
+    return {"id": api_key.id, "routing_policy": api_key.routing_policy}
+
+
 class CompanyResponse(BaseModel):
     name: str
     website: str
@@ -227,6 +291,8 @@ async def add_provider_key(
         session.add(key_entry)
 
     await session.commit()
+
+    await publish_invalidation("provider_key", f"{user_id}:{req.provider_name}")
     return {"status": "success", "provider": req.provider_name}
 
 
@@ -254,11 +320,79 @@ async def delete_provider_key(
     if key_entry:
         await session.delete(key_entry)
         await session.commit()
+
+        await publish_invalidation("provider_key", f"{user_id}:{provider_name}")
         return {"status": "deleted"}
 
     raise HTTPException(status_code=404, detail="Key not found")
 
 
+# --- SHADOW TARGETS ---
+
+
+class ShadowTargetRequest(BaseModel):
+    model_slug: str  # primary model, or "*" for every model
+    shadow_model: str  # LiteLLM model string, e.g. "groq/llama3-8b-8192"
+    sample_rate: float = Field(default=0.01, ge=0.0, le=1.0)
+    enabled: bool = True
+
+
+@app.get("/shadow-targets")
+async def list_shadow_targets(session: AsyncSession = Depends(get_session)):
+    res = await session.execute(select(ShadowTarget).order_by(ShadowTarget.id))
+    return res.scalars().all()
+
+
+@app.post("/shadow-targets")
+async def create_shadow_target(
+    req: ShadowTargetRequest, session: AsyncSession = Depends(get_session)
+):
+    """Shadows a sample of `model_slug`'s requests with `shadow_model`."""
+    target = ShadowTarget(**req.model_dump())
+    session.add(target)
+    await session.commit()
+    await session.refresh(target)
+
+    # Gateways reload every target; the key is informational
+    await publish_invalidation("shadow_target", str(target.id))
+    return target
+
+
+async def _get_shadow_target(session: AsyncSession, target_id: int) -> ShadowTarget:
+    target = await session.get(ShadowTarget, target_id)
+    if not target:
+        raise HTTPException(status_code=404, detail="Shadow target not found")
+    return target
+
+
+@app.put("/shadow-targets/{target_id}")
+async def update_shadow_target(
+    target_id: int,
+    req: ShadowTargetRequest,
+    session: AsyncSession = Depends(get_session),
+):
+    target = await _get_shadow_target(session, target_id)
+    for field, value in req.model_dump().items():
+        setattr(target, field, value)
+    await session.commit()
+    await session.refresh(target)
+
+    await publish_invalidation("shadow_target", str(target.id))
+    return target
+
+
+@app.delete("/shadow-targets/{target_id}")
+async def delete_shadow_target(
+    target_id: int, session: AsyncSession = Depends(get_session)
+):
+    target = await _get_shadow_target(session, target_id)
+    await session.delete(target)
+    await session.commit()
+
+    await publish_invalidation("shadow_target", str(target_id))
+    return {"status": "deleted"}
+
+
 # --- ANALYTICS ---
 
 
@@ -301,6 +435,8 @@ async def get_provider_health(session: AsyncSession = Depends(get_session)):
     stmt = select(
         RequestLog.provider_name,
         func.avg(RequestLog.latency_ms).label("avg_latency"),
+        func.avg(RequestLog.ttft_ms).label("avg_ttft"),
+        func.avg(RequestLog.tokens_per_sec).label("avg_tokens_per_sec"),
         func.count(RequestLog.id).label("total_reqs"),
     ).group_by(RequestLog.provider_name)
     res = await session.execute(stmt)
@@ -308,6 +444,9 @@ async def get_provider_health(session: AsyncSession = Depends(get_session)):
         {
             "provider": r.provider_name,
             "avg_latency": r.avg_latency,
+            # Streaming requests only (NULL for non-streamed rows)
+            "avg_ttft": r.avg_ttft,
+            "avg_tokens_per_sec": r.avg_tokens_per_sec,
             "total_reqs": r.total_reqs,
         }
         for r in res.all()
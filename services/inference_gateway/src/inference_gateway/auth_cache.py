@@ -0,0 +1,118 @@
+import asyncio
+import os
+from typing import NamedTuple
+
+from database.models import ApiKey, User
+from database.session import engine
+from shared.instrumentation import meter
+from shared.lru import TTLCache
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+# Unknown keys are cached for less time so a freshly created key is usable
+# quickly even if the invalidation message gets lost.
+AUTH_CACHE_NEGATIVE_TTL = float(os.getenv("AUTH_CACHE_NEGATIVE_TTL", "5"))
+
+
+class AuthEntry(NamedTuple):
+    """The resolved identity behind an API key hash."""
+
+    user_id: int
+    api_key_id: int
+    org_id: int | None
+    disabled: bool
+    deleted: bool
+    routing_policy: dict | None = None
+
+
+_lookups = meter.create_counter(
+    "gateway.auth_cache.lookups", description="Auth cache lookups by result"
+)
+
+_UNCACHED = object()
+
+# key_hash -> AuthEntry, or None for hashes that don't exist in the DB
+auth_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+
+# Misses being loaded right now, so concurrent lookups share one query.
+# Invalidation drops a key's entry: its load may have read the row before
+# the change, so the result is returned to its waiters but not cached.
+_loading: dict[str, asyncio.Future] = {}
+
+
+def _finish_loading(key_hash: str, loading: asyncio.Future) -> bool:
+    """Unregisters `loading`; False if an invalidation already dropped it."""
+    if _loading.get(key_hash) is not loading:
+        return False
+    del _loading[key_hash]
+    return True
+
+
+async def _load_entry(key_hash: str) -> AuthEntry | None:
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        # Find Key -> User -> Organization
+        statement = (
+            select(ApiKey)
+            .where(ApiKey.key_hash == key_hash)
+            .options(selectinload(ApiKey.user).selectinload(User.organization))
+        )
+        result = await session.execute(statement)
+        api_key_db = result.scalar_one_or_none()
+
+        if not api_key_db:
+            return None
+
+        user_db = api_key_db.user
+        org_id = user_db.organization.id if user_db and user_db.organization else None
+
+        return AuthEntry(
+            user_id=api_key_db.user_id,
+            api_key_id=api_key_db.id,
+            org_id=org_id,
+            disabled=api_key_db.disabled,
+            deleted=api_key_db.deleted,
+            routing_policy=api_key_db.routing_policy,
+        )
+
+
+async def resolve_api_key(key_hash: str) -> AuthEntry | None:
+    """Returns the AuthEntry for `key_hash`, hitting the DB only on a cache miss."""
+    entry = auth_cache.get(key_hash, _UNCACHED)
+    if entry is not _UNCACHED:
+        _lookups.add(1, {"result": "hit"})
+        return entry
+
+    loading = _loading.get(key_hash)
+    if loading is not None:
+        _lookups.add(1, {"result": "coalesced"})
+        return await asyncio.shield(loading)
+
+    _lookups.add(1, {"result": "miss"})
+    loading = asyncio.ensure_future(_load_entry(key_hash))
+    _loading[key_hash] = loading
+    try:
+        entry = await asyncio.shield(loading)
+    finally:
+        if loading.done():
+            fresh = _finish_loading(key_hash, loading)
+        else:
+            # Our caller was cancelled; let the load finish for the others
+            loading.add_done_callback(lambda _: _finish_loading(key_hash, loading))
+    if fresh:
+        auth_cache.set(
+            key_hash, entry, ttl=None if entry is not None else AUTH_CACHE_NEGATIVE_TTL
+        )
+    return entry
+
+
+def invalidate_api_key(key_hash: str | None = None):
+    """Invalidation handler: drops one key hash, or the whole cache if None."""
+    if key_hash is None:
+        auth_cache.clear()
+        _loading.clear()
+    else:
+        auth_cache.pop(key_hash)
+        _loading.pop(key_hash, None)
@@ -0,0 +1,141 @@
+import os
+import random
+from collections import deque
+from typing import NamedTuple
+
+from shared.instrumentation import meter
+from shared.lru import TTLCache
+
+# Skip the response cache for segments (org, model, prompt length bucket)
+# whose recent hit rate is below CACHE_BYPASS_MIN_HIT_RATE
+CACHE_BYPASS = os.getenv("CACHE_BYPASS", "false").lower() == "true"
+CACHE_BYPASS_MIN_HIT_RATE = float(os.getenv("CACHE_BYPASS_MIN_HIT_RATE", "0.02"))
+# Lookups per segment in the sliding window, and how many before judging it
+CACHE_BYPASS_WINDOW = int(os.getenv("CACHE_BYPASS_WINDOW", "500"))
+CACHE_BYPASS_MIN_SAMPLES = int(os.getenv("CACHE_BYPASS_MIN_SAMPLES", "100"))
+# Share of a bypassed segment's requests that still use the cache, so it is
+# noticed when the segment becomes cacheable again
+CACHE_BYPASS_PROBE_RATE = float(os.getenv("CACHE_BYPASS_PROBE_RATE", "0.05"))
+
+# Prompt length buckets double from 256 characters: <256, <512, <1k, ...
+_BUCKET_BASE = 256
+
+_decisions = meter.create_counter(
+    "gateway.cache_policy.decisions",
+    description="Cache eligibility decisions (use, bypass or probe)",
+)
+
+Segment = tuple[int | None, str, int]
+
+
+class Eligibility(NamedTuple):
+    segment: Segment
+    use_cache: bool
+    probe: bool
+
+
+def prompt_chars(messages: list[dict]) -> int:
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        total += len(content) if isinstance(content, str) else len(str(content))
+    return total
+
+
+def length_bucket(chars: int) -> int:
+    return (chars // _BUCKET_BASE).bit_length()
+
+
+class _Window:
+    __slots__ = ("hits", "outcomes")
+
+    def __init__(self, size: int):
+        self.outcomes: deque = deque(maxlen=size)
+        self.hits = 0
+
+    def add(self, hit: bool):
+        if len(self.outcomes) == self.outcomes.maxlen:
+            self.hits -= self.outcomes[0]
+        self.outcomes.append(hit)
+        self.hits += hit
+
+
+class CachePolicy:
+    """Decides per request whether the response cache is worth using.
+
+    Hit rates are kept per segment over the last `window` lookups. Once a
+    segment has `min_samples` lookups and a hit rate below `min_hit_rate`,
+    its requests skip both the lookup (no embedding or vector search) and
+    the store. A `probe_rate` share of them still use the cache and keep
+    the window current, so the segment returns once it starts hitting.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = CACHE_BYPASS,
+        min_hit_rate: float = CACHE_BYPASS_MIN_HIT_RATE,
+        window: int = CACHE_BYPASS_WINDOW,
+        min_samples: int = CACHE_BYPASS_MIN_SAMPLES,
+        probe_rate: float = CACHE_BYPASS_PROBE_RATE,
+        maxsize: int = 10000,
+    ):
+        self.enabled = enabled
+        self.min_hit_rate = min_hit_rate
+        self.window = window
+        self.min_samples = min(min_samples, window)
+        self.probe_rate = probe_rate
+        # Idle segments age out and are judged afresh
+        self._windows = TTLCache(maxsize=maxsize, ttl=3600)
+
+        self.bypassed = 0
+        self.probes = 0
+
+    def decide(
+        self, org_id: int | None, model: str, messages: list[dict]
+    ) -> Eligibility:
+        segment = (org_id, model, length_bucket(prompt_chars(messages)))
+        if not self.enabled or not self._is_cold(segment):
+            _decisions.add(1, {"decision": "use"})
+            return Eligibility(segment, True, False)
+        if random.random() < self.probe_rate:
+            self.probes += 1
+            _decisions.add(1, {"decision": "probe"})
+            return Eligibility(segment, True, True)
+        self.bypassed += 1
+        _decisions.add(1, {"decision": "bypass"})
+        return Eligibility(segment, False, False)
+
+    def _is_cold(self, segment: Segment) -> bool:
+        window = self._windows.get(segment)
+        return (
+            window is not None
+            and len(window.outcomes) >= self.min_samples
+            and window.hits < self.min_hit_rate * len(window.outcomes)
+        )
+
+    def record(self, segment: Segment, hit: bool):
+        if not self.enabled:
+            return
+        window = self._windows.get(segment)
+        if window is None:
+            window = _Window(self.window)
+        window.add(hit)
+        self._windows.set(segment, window)
+
+    def hit_rate(self, segment: Segment) -> float | None:
+        window = self._windows.get(segment)
+        if window is None or not window.outcomes:
+            return None
+        return window.hits / len(window.outcomes)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "min_hit_rate": self.min_hit_rate,
+            "segments": len(self._windows),
+            "bypassed": self.bypassed,
+            "probes": self.probes,
+        }
+
+
+cache_policy = CachePolicy()
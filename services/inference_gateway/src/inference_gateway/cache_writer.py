@@ -0,0 +1,131 @@
+import asyncio
+import os
+import time
+
+from opentelemetry.metrics import Observation
+from redis import RedisError
+from shared.cache import cache_key, store_cache
+from shared.instrumentation import meter
+
+CACHE_WRITE_QUEUE_SIZE = int(os.getenv("CACHE_WRITE_QUEUE_SIZE", "2000"))
+# Concurrent writers; several let the embedding batcher batch their prompts
+CACHE_WRITE_WORKERS = int(os.getenv("CACHE_WRITE_WORKERS", "4"))
+
+_writes = meter.create_counter(
+    "gateway.cache_write.writes", description="Response cache writes by outcome"
+)
+_write_latency = meter.create_histogram(
+    "gateway.cache_write.latency",
+    unit="ms",
+    description="Time to write one response to every cache tier",
+)
+
+_Write = tuple[str, list[dict], str, int | None]
+
+
+class CacheWriter:
+    """Write-behind queue for response cache stores.
+
+    `submit` returns immediately; `workers` tasks embed and write queued
+    responses with `store_cache`. A write for a key that is already queued
+    replaces the queued response instead of taking another slot, and when
+    `maxsize` writes are waiting new ones are dropped (counted in
+    `dropped`): a missed cache fill is cheaper than a slower response.
+    """
+
+    def __init__(
+        self, maxsize: int = CACHE_WRITE_QUEUE_SIZE, workers: int = CACHE_WRITE_WORKERS
+    ):
+        self.maxsize = maxsize
+        self.workers = workers
+        self._pending: dict[str, _Write] = {}
+        self._keys: asyncio.Queue = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+
+        self.written = 0
+        self.deduped = 0
+        self.dropped = 0
+        self.failed = 0
+
+        meter.create_observable_gauge(
+            "gateway.cache_write.queue_depth",
+            callbacks=[lambda _options: [Observation(len(self._pending))]],
+            unit="{write}",
+        )
+
+    def start(self):
+        self._tasks = [t for t in self._tasks if not t.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._run()))
+
+    def submit(
+        self,
+        model: str,
+        messages: list[dict],
+        response: str,
+        org_id: int | None = None,
+    ) -> bool:
+        """Queues a cache write. Returns False if it was dropped."""
+        key = cache_key(model, messages, org_id=org_id)
+        if key in self._pending:
+            self._pending[key] = (model, messages, response, org_id)
+            self.deduped += 1
+            _writes.add(1, {"outcome": "deduped"})
+            return True
+        if len(self._pending) >= self.maxsize:
+            self.dropped += 1
+            _writes.add(1, {"outcome": "dropped"})
+            return False
+
+        self.start()
+        self._pending[key] = (model, messages, response, org_id)
+        self._keys.put_nowait(key)
+        return True
+
+    async def _run(self):
+        while True:
+            key = await self._keys.get()
+            try:
+                await self._write(*self._pending.pop(key))
+            finally:
+                self._keys.task_done()
+
+    async def _write(
+        self, model: str, messages: list[dict], response: str, org_id: int | None
+    ):
+        started = time.perf_counter()
+        try:
+            await store_cache(model, messages, response, org_id=org_id)
+        except RedisError as e:
+            self.failed += 1
+            _writes.add(1, {"outcome": "failed"})
+            print(f"Response cache write failed: {e}")
+            return
+
+        self.written += 1
+        _writes.add(1, {"outcome": "written"})
+        _write_latency.record((time.perf_counter() - started) * 1000)
+
+    async def stop(self, timeout: float = 5.0):
+        """Waits for the workers to finish the writes still queued."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._keys.join(), timeout)
+        except TimeoutError:
+            print(f"Cache writer shutdown timed out, {len(self._pending)} writes lost")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._pending),
+            "written": self.written,
+            "deduped": self.deduped,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+cache_writer = CacheWriter()
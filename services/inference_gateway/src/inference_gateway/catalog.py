@@ -0,0 +1,151 @@
+import asyncio
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+from database.models import Model, ModelProviderMapping, Provider
+from database.session import DB_ERRORS, engine
+from shared.instrumentation import meter
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+# Map DB provider names to LiteLLM provider prefixes
+LITELLM_PROVIDER_MAP = {
+    "Google AI": "gemini",
+    "OpenAI": "openai",
+    "Anthropic": "anthropic",
+    "Groq": "groq",  # Groq inference platform (fast LPU)
+    "Perplexity": "perplexity",
+    "Mistral AI": "mistral",
+    "Mistral": "mistral",
+    "xAI": "xai",  # xAI Grok models
+    "Meta": "groq",  # Llama 4 served via Groq
+    "DeepSeek": "deepseek",
+    "Amazon Bedrock": "bedrock",  # AWS Bedrock
+    "Ollama (Local)": "ollama",  # Local models via Ollama
+}
+
+
+def litellm_prefix(provider_name: str) -> str:
+    return LITELLM_PROVIDER_MAP.get(provider_name, provider_name.lower())
+
+
+@dataclass(frozen=True)
+class Route:
+    """One way of serving a model: a ModelProviderMapping row, denormalized."""
+
+    provider: str
+    litellm_prefix: str
+    model_name: str
+    input_cost: float  # USD per 1M
+    output_cost: float  # USD per 1M
+    mapping_id: int
+    context_length: int | None
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    version: int
+    loaded_at: float
+    routes: Mapping[str, tuple[Route, ...]] = field(
+        default_factory=lambda: MappingProxyType({})
+    )
+
+
+_refreshes = meter.create_counter(
+    "gateway.catalog.refreshes", description="Routing table rebuilds by result"
+)
+
+# Readers grab the module global once; refresh() swaps it in a single assignment
+_snapshot = CatalogSnapshot(version=0, loaded_at=0.0)
+_refresh_lock = asyncio.Lock()
+
+
+def get_snapshot() -> CatalogSnapshot:
+    return _snapshot
+
+
+def lookup(model_slug: str) -> tuple[Route, ...]:
+    """Ordered routes for `model_slug` (empty if unknown). No I/O."""
+    return _snapshot.routes.get(model_slug, ())
+
+
+async def _build_routes() -> Mapping[str, tuple[Route, ...]]:
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        statement = (
+            select(Model, ModelProviderMapping, Provider)
+            .where(
+                ModelProviderMapping.model_id == Model.id,
+                ModelProviderMapping.provider_id == Provider.id,
+            )
+            .order_by(Model.slug, ModelProviderMapping.id)
+        )
+        rows = (await session.execute(statement)).all()
+
+    routes: dict = {}
+    for model_db, mapping_db, provider_db in rows:
+        routes.setdefault(model_db.slug, []).append(
+            Route(
+                provider=provider_db.name,
+                litellm_prefix=litellm_prefix(provider_db.name),
+                model_name=model_db.slug.split("/")[-1],  # e.g. "gpt-4o"
+                input_cost=mapping_db.input_token_cost,
+                output_cost=mapping_db.output_token_cost,
+                mapping_id=mapping_db.id,
+                context_length=model_db.context_length,
+            )
+        )
+    return MappingProxyType({slug: tuple(r) for slug, r in routes.items()})
+
+
+async def _swap_in_new_snapshot() -> CatalogSnapshot:
+    global _snapshot
+    try:
+        routes = await _build_routes()
+    except Exception:
+        _refreshes.add(1, {"result": "error"})
+        raise
+    _snapshot = CatalogSnapshot(
+        version=_snapshot.version + 1, loaded_at=time.time(), routes=routes
+    )
+    _refreshes.add(1, {"result": "ok"})
+    return _snapshot
+
+
+async def refresh() -> CatalogSnapshot:
+    """Rebuilds the routing table from the DB and swaps it in atomically."""
+    async with _refresh_lock:
+        return await _swap_in_new_snapshot()
+
+
+async def ensure_loaded():
+    """Loads the table if startup couldn't (e.g. DB was still booting)."""
+    if _snapshot.version == 0:
+        async with _refresh_lock:
+            if _snapshot.version == 0:
+                await _swap_in_new_snapshot()
+
+
+async def refresh_periodically(interval: float):
+    """Safety net for catalog edits that never publish an invalidation (SQL scripts)."""
+    while True:
+        await asyncio.sleep(interval)
+        await handle_invalidation()
+
+
+async def handle_invalidation(_key: str | None = None):
+    """Invalidation handler: any catalog change rebuilds the whole table."""
+    try:
+        await refresh()
+    except DB_ERRORS as e:
+        print(f"Catalog refresh failed, keeping version {_snapshot.version}: {e}")
+
+
+def stats() -> dict:
+    return {
+        "version": _snapshot.version,
+        "loaded_at": _snapshot.loaded_at,
+        "models": len(_snapshot.routes),
+        "routes": sum(len(r) for r in _snapshot.routes.values()),
+    }
@@ -0,0 +1,238 @@
+import os
+import time
+from collections import deque
+
+from opentelemetry.metrics import Observation
+from shared.events import publish_invalidation
+from shared.instrumentation import meter
+
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "true").lower() == "true"
+# Outcomes are judged over a sliding window once it holds enough requests
+BREAKER_WINDOW_S = float(os.getenv("BREAKER_WINDOW_S", "30"))
+BREAKER_MIN_REQUESTS = int(os.getenv("BREAKER_MIN_REQUESTS", "20"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+# Latency SLO per attempt (first chunk for streams); 0 disables the check
+BREAKER_SLOW_MS = float(os.getenv("BREAKER_SLOW_MS", "0"))
+BREAKER_SLOW_RATE = float(os.getenv("BREAKER_SLOW_RATE", "0.5"))
+BREAKER_OPEN_S = float(os.getenv("BREAKER_OPEN_S", "30"))
+# Trial requests let through while half-open; all must succeed to close
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "3"))
+# Tell the other gateway replicas when a breaker opens
+BREAKER_SHARED = os.getenv("BREAKER_SHARED", "false").lower() == "true"
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+_transitions = meter.create_counter(
+    "gateway.breaker.transitions", description="Circuit breaker state changes"
+)
+_rejections = meter.create_counter(
+    "gateway.breaker.rejections", description="Attempts skipped by an open breaker"
+)
+
+
+class CircuitBreaker:
+    """Closed -> open -> half-open state machine for one provider or route.
+
+    While closed, outcomes are kept for `window_s`; with at least
+    `min_requests` of them, an error rate or slow (over `slow_ms`) rate
+    above its threshold opens the breaker. Open rejects everything for
+    `open_s`, then half-open lets `probes` requests through: if all
+    succeed it closes, any failure reopens it.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        window_s: float = BREAKER_WINDOW_S,
+        min_requests: int = BREAKER_MIN_REQUESTS,
+        error_rate: float = BREAKER_ERROR_RATE,
+        slow_ms: float = BREAKER_SLOW_MS,
+        slow_rate: float = BREAKER_SLOW_RATE,
+        open_s: float = BREAKER_OPEN_S,
+        probes: int = BREAKER_HALF_OPEN_PROBES,
+    ):
+        self.key = key
+        self.window_s = window_s
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.slow_ms = slow_ms
+        self.slow_rate = slow_rate
+        self.open_s = open_s
+        self.probes = probes
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.reason: str | None = None
+        self._outcomes: deque = deque()  # (timestamp, failed, slow)
+        self._failures = 0
+        self._slow = 0
+        self._probes_started = 0
+        self._probes_passed = 0
+
+    def allow(self) -> bool:
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.open_s:
+                return False
+            self._transition(HALF_OPEN)
+            self._probes_started = self._probes_passed = 0
+        if self.state == HALF_OPEN:
+            if self._probes_started >= self.probes:
+                return False
+            self._probes_started += 1
+        return True
+
+    def release(self):
+        """Gives back a half-open trial that never got an outcome."""
+        if self.state == HALF_OPEN and self._probes_started > self._probes_passed:
+            self._probes_started -= 1
+
+    def record(self, failed: bool, latency_ms: float) -> bool:
+        """Adds an outcome. Returns True if it opened the breaker."""
+        slow = self.slow_ms > 0 and latency_ms > self.slow_ms
+        if self.state == HALF_OPEN:
+            if failed or slow:
+                self.open("failed half-open trial")
+                return True
+            self._probes_passed += 1
+            if self._probes_passed >= self.probes:
+                self._transition(CLOSED)
+                self._clear()
+            return False
+        if self.state == OPEN:
+            return False
+
+        now = time.monotonic()
+        self._outcomes.append((now, failed, slow))
+        self._failures += failed
+        self._slow += slow
+        while self._outcomes and self._outcomes[0][0] < now - self.window_s:
+            _, old_failed, old_slow = self._outcomes.popleft()
+            self._failures -= old_failed
+            self._slow -= old_slow
+
+        total = len(self._outcomes)
+        if total < self.min_requests:
+            return False
+        if self._failures / total > self.error_rate:
+            self.open(f"error rate {self._failures / total:.0%}")
+            return True
+        if self._slow / total > self.slow_rate:
+            self.open(f"{self._slow / total:.0%} slower than {self.slow_ms:.0f}ms")
+            return True
+        return False
+
+    def open(self, reason: str):
+        self.opened_at = time.monotonic()
+        self.reason = reason
+        self._transition(OPEN)
+        self._clear()
+
+    def _clear(self):
+        self._outcomes.clear()
+        self._failures = self._slow = 0
+
+    def _transition(self, state: str):
+        if state != self.state:
+            self.state = state
+            _transitions.add(1, {"breaker": self.key, "state": state})
+
+    def snapshot(self) -> dict:
+        total = len(self._outcomes)
+        return {
+            "state": self.state,
+            "reason": self.reason if self.state != CLOSED else None,
+            "requests": total,
+            "error_rate": (self._failures / total) if total else 0.0,
+            "open_for_s": (
+                max(self.open_s - (time.monotonic() - self.opened_at), 0.0)
+                if self.state == OPEN
+                else 0.0
+            ),
+        }
+
+
+class BreakerRegistry:
+    """Breakers per provider and per (provider, model).
+
+    An attempt goes ahead only if both its provider's and its route's
+    breakers allow it, so one failing model does not take a provider's
+    other models down while a provider-wide outage trips every route.
+    """
+
+    def __init__(self, enabled: bool = BREAKER_ENABLED, shared: bool = BREAKER_SHARED):
+        self.enabled = enabled
+        self.shared = shared
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+        meter.create_observable_gauge(
+            "gateway.breaker.open",
+            callbacks=[lambda _options: [Observation(self.open_count())]],
+            unit="{breaker}",
+        )
+
+    def _get(self, key: str) -> CircuitBreaker:
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker(key)
+        return breaker
+
+    @staticmethod
+    def _keys(provider: str, model: str) -> list[str]:
+        return [provider, f"{provider}|{model}"]
+
+    def allow(self, provider: str, model: str) -> bool:
+        if not self.enabled:
+            return True
+        provider_breaker, route_breaker = (
+            self._get(k) for k in self._keys(provider, model)
+        )
+        if not provider_breaker.allow():
+            _rejections.add(1, {"breaker": provider_breaker.key})
+            return False
+        if not route_breaker.allow():
+            provider_breaker.release()
+            _rejections.add(1, {"breaker": route_breaker.key})
+            return False
+        return True
+
+    def release(self, provider: str, model: str):
+        if self.enabled:
+            for key in self._keys(provider, model):
+                self._get(key).release()
+
+    async def record(self, provider: str, model: str, failed: bool, latency_ms: float):
+        if not self.enabled:
+            return
+        for key in self._keys(provider, model):
+            breaker = self._get(key)
+            if breaker.record(failed, latency_ms):
+                print(f"Circuit breaker {key} opened: {breaker.reason}")
+                if self.shared:
+                    await publish_invalidation("breaker", key)
+
+    def handle_remote_open(self, key: str | None = None):
+        """Opens a breaker that another replica tripped."""
+        if key is None:  # bus reconnect: nothing to flush
+            return
+        breaker = self._get(key)
+        if breaker.state != OPEN:
+            breaker.open("opened by another replica")
+
+    def reset(self, key: str | None = None):
+        if key is None:
+            self._breakers.clear()
+        else:
+            self._breakers.pop(key, None)
+
+    def open_count(self) -> int:
+        return sum(b.state == OPEN for b in self._breakers.values())
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "shared": self.shared,
+            "breakers": {k: b.snapshot() for k, b in sorted(self._breakers.items())},
+        }
+
+
+breakers = BreakerRegistry()
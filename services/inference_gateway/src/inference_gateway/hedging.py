@@ -0,0 +1,109 @@
+import os
+
+from shared.instrumentation import meter
+from shared.lru import TTLCache
+
+from inference_gateway.selection import SelectionEngine, selection
+
+# Send a backup request to the next route when the first one has not
+# answered within its observed percentile: TTFT for streams, response time
+# for non-stream requests
+HEDGING = os.getenv("HEDGING", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.9"))
+# Timing samples a mapping needs before its requests can be hedged
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# Never hedge sooner than this, however fast the mapping usually is
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "100"))
+# Per-org budget: each request earns HEDGE_BUDGET_RATIO of a hedge (so at
+# most that share of an org's requests are sent twice), saved up to
+# HEDGE_BUDGET_BURST hedges
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.05"))
+HEDGE_BUDGET_BURST = float(os.getenv("HEDGE_BUDGET_BURST", "10"))
+
+_hedges = meter.create_counter(
+    "gateway.hedge.requests",
+    description="Hedged requests by outcome (won, lost, failed, over_budget)",
+)
+
+
+class HedgePolicy:
+    """Decides when to hedge an upstream call, within a per-org budget.
+
+    The hedge delay is the primary mapping's `percentile` TTFT (streams)
+    or response time (non-stream) from the selection engine, so only its
+    slowest requests get a backup. Budgets are token buckets: every request
+    adds `budget_ratio`, a hedge spends 1.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = HEDGING,
+        percentile: float = HEDGE_PERCENTILE,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+        min_delay_ms: float = HEDGE_MIN_DELAY_MS,
+        budget_ratio: float = HEDGE_BUDGET_RATIO,
+        budget_burst: float = HEDGE_BUDGET_BURST,
+        engine: SelectionEngine = selection,
+        maxsize: int = 10000,
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay_ms = min_delay_ms
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+        self.engine = engine
+        # org_id -> hedges available; idle orgs age out and start empty
+        self._budgets = TTLCache(maxsize=maxsize, ttl=3600)
+
+        self.fired = 0
+        self.won = 0
+        self.lost = 0
+        self.failed = 0
+        self.over_budget = 0
+
+    def delay(self, mapping_id: int | None, stream: bool) -> float | None:
+        """Seconds to wait before hedging, or None if the mapping has too
+        few samples to tell a slow request from a normal one."""
+        if not self.enabled or mapping_id is None:
+            return None
+        if self.engine.samples(mapping_id, stream) < self.min_samples:
+            return None
+        threshold = self.engine.percentile(mapping_id, self.percentile, stream)
+        return max(threshold, self.min_delay_ms) / 1000.0
+
+    def deposit(self, org_id: int | None):
+        if self.enabled:
+            budget = self._budgets.get(org_id) or 0.0
+            self._budgets.set(
+                org_id, min(budget + self.budget_ratio, self.budget_burst)
+            )
+
+    def try_spend(self, org_id: int | None) -> bool:
+        budget = self._budgets.get(org_id) or 0.0
+        if budget < 1.0:
+            self.over_budget += 1
+            _hedges.add(1, {"outcome": "over_budget"})
+            return False
+        self._budgets.set(org_id, budget - 1.0)
+        self.fired += 1
+        return True
+
+    def record(self, outcome: str):
+        """`won` (the backup served), `lost` (the primary did) or `failed`."""
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        _hedges.add(1, {"outcome": outcome})
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "fired": self.fired,
+            "won": self.won,
+            "lost": self.lost,
+            "failed": self.failed,
+            "over_budget": self.over_budget,
+            "win_rate": self.won / self.fired if self.fired else None,
+        }
+
+
+hedging = HedgePolicy()
@@ -0,0 +1,184 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+
+from database.models import Organization
+from database.session import DB_ERRORS, engine
+from shared.instrumentation import meter
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from inference_gateway.ledger import ledger
+
+# USD reserved from an org's balance per lease; 0 (the default) disables leasing
+CREDIT_LEASE_SIZE = float(os.getenv("CREDIT_LEASE_SIZE", "0"))
+# Renew in the background once the lease drops below this fraction
+CREDIT_LEASE_LOW_WATERMARK = float(os.getenv("CREDIT_LEASE_LOW_WATERMARK", "0.25"))
+# Idle leases are handed back so the balance shown in the dashboard is accurate
+CREDIT_LEASE_IDLE_SECONDS = float(os.getenv("CREDIT_LEASE_IDLE_SECONDS", "300"))
+# How long an org with no balance left is rejected without asking the DB again
+CREDIT_LEASE_EXHAUSTED_SECONDS = float(os.getenv("CREDIT_LEASE_EXHAUSTED_SECONDS", "5"))
+
+_reservations = meter.create_counter(
+    "gateway.credit_lease.reservations",
+    description="Lease reservations against Organization.credits by result",
+)
+
+
+@dataclass
+class _Lease:
+    # Can go negative: requests already authorized may cost more than is left
+    remaining: float = 0.0
+    last_used: float = field(default_factory=time.monotonic)
+    exhausted_until: float = 0.0
+    renewal: asyncio.Task | None = None
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class CreditLeaseManager:
+    """Authorizes requests against locally held slices of each org's balance.
+
+    A lease moves up to `lease_size` USD out of Organization.credits in one
+    short transaction; requests are then authorized and charged in memory.
+    Each gateway can overspend an org by at most one lease (plus the cost
+    of requests in flight when it runs dry). Unused credit goes back to the
+    org through the billing ledger when a lease idles out or on shutdown.
+
+    Grants, charges and releases are journaled by the ledger, so if the
+    process crashes, the next one to replay its journal returns what was
+    left. Only a crash between a reservation's COMMIT and its journal write
+    loses that lease.
+    """
+
+    def __init__(
+        self,
+        lease_size: float = CREDIT_LEASE_SIZE,
+        low_watermark: float = CREDIT_LEASE_LOW_WATERMARK,
+    ):
+        self.lease_size = lease_size
+        self.low_watermark = lease_size * low_watermark
+        self._leases: dict[int, _Lease] = {}
+        self.renewals = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.lease_size > 0
+
+    async def authorize(self, org_id: int) -> bool:
+        """True if the org has credit. Only touches the DB when the lease is dry."""
+        lease = self._leases.setdefault(org_id, _Lease())
+        lease.last_used = time.monotonic()
+
+        if lease.remaining > 0:
+            if lease.remaining < self.low_watermark:
+                self._renew_in_background(org_id, lease)
+            return True
+
+        if time.monotonic() < lease.exhausted_until:
+            return False
+
+        await self._renew(org_id, lease)
+        return lease.remaining > 0
+
+    def consume(self, org_id: int, cost: float):
+        """Charges a completed request against the org's lease."""
+        lease = self._leases.setdefault(org_id, _Lease())
+        lease.remaining -= cost
+        if lease.remaining < self.low_watermark:
+            self._renew_in_background(org_id, lease)
+
+    async def charge(self, org_id: int, api_key_id: int | None, cost: float):
+        """Consumes `cost` from the lease and journals it with the key's charge."""
+        self.consume(org_id, cost)
+        await ledger.charge(None, api_key_id, cost, lease_org=org_id, held=-cost)
+
+    def _renew_in_background(self, org_id: int, lease: _Lease):
+        if lease.renewal is None or lease.renewal.done():
+            lease.renewal = asyncio.create_task(self._renew(org_id, lease))
+
+    async def _renew(self, org_id: int, lease: _Lease):
+        async with lease.lock:
+            if lease.remaining >= self.low_watermark:
+                return  # renewed while we waited for the lock
+            if time.monotonic() < lease.exhausted_until:
+                return
+            try:
+                granted = await self._reserve(org_id, lease)
+            except DB_ERRORS as e:
+                _reservations.add(1, {"result": "error"})
+                print(f"Credit lease renewal failed for org {org_id}: {e}")
+                return
+
+            self.renewals += 1
+            if granted > 0:
+                _reservations.add(1, {"result": "granted"})
+                lease.exhausted_until = 0.0
+            else:
+                _reservations.add(1, {"result": "exhausted"})
+                lease.exhausted_until = (
+                    time.monotonic() + CREDIT_LEASE_EXHAUSTED_SECONDS
+                )
+
+    async def _reserve(self, org_id: int, lease: _Lease) -> float:
+        """Settles any overdraft and moves up to one lease out of the balance."""
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            org_stmt = (
+                select(Organization).where(Organization.id == org_id).with_for_update()
+            )
+            org = (await session.execute(org_stmt)).scalar_one()
+
+            debt = max(-lease.remaining, 0.0)
+            granted = min(self.lease_size, max(org.credits - debt, 0.0))
+            org.credits -= debt + granted
+            await session.commit()
+
+        await ledger.record(None, None, 0.0, lease_org=org_id, held=debt + granted)
+        lease.remaining += debt + granted
+        return granted
+
+    async def _release(self, org_id: int):
+        lease = self._leases.pop(org_id)
+        if lease.remaining:
+            # Negative cost credits the org back; an overdraft is charged
+            await ledger.record(
+                org_id,
+                None,
+                -lease.remaining,
+                lease_org=org_id,
+                held=-lease.remaining,
+            )
+
+    async def release_idle_periodically(
+        self, idle_seconds: float = CREDIT_LEASE_IDLE_SECONDS
+    ):
+        while True:
+            await asyncio.sleep(idle_seconds / 2)
+            cutoff = time.monotonic() - idle_seconds
+            for org_id, lease in list(self._leases.items()):
+                renewing = lease.renewal is not None and not lease.renewal.done()
+                if (
+                    lease.last_used < cutoff
+                    and not renewing
+                    and not lease.lock.locked()
+                ):
+                    await self._release(org_id)
+
+    async def release_all(self):
+        """Returns every lease to its org. Call before the ledger's final flush."""
+        renewals = [lease.renewal for lease in self._leases.values() if lease.renewal]
+        await asyncio.gather(*renewals, return_exceptions=True)
+        for org_id in list(self._leases):
+            await self._release(org_id)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "lease_size": self.lease_size,
+            "orgs": len(self._leases),
+            "held": sum(max(lease.remaining, 0.0) for lease in self._leases.values()),
+            "renewals": self.renewals,
+        }
+
+
+credit_leases = CreditLeaseManager()
@@ -0,0 +1,492 @@
+import asyncio
+import fcntl
+import glob
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime
+
+from database.models import ApiKey, Organization
+from database.session import DB_ERRORS, engine
+from opentelemetry.metrics import Observation
+from shared.instrumentation import meter
+from sqlalchemy import bindparam, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+BILLING_FLUSH_INTERVAL_MS = float(os.getenv("BILLING_FLUSH_INTERVAL_MS", "250"))
+BILLING_FLUSH_MAX_EVENTS = int(os.getenv("BILLING_FLUSH_MAX_EVENTS", "500"))
+# Each process journals to its own file next to this path (billing.<pid>.journal)
+BILLING_JOURNAL_PATH = os.getenv("BILLING_JOURNAL_PATH", ".himmi/billing.journal")
+
+_flush_size = meter.create_histogram(
+    "gateway.billing.flush_size", unit="{event}", description="Events per flush"
+)
+_flush_latency = meter.create_histogram(
+    "gateway.billing.flush_latency", unit="ms", description="Batched UPDATE time"
+)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+def _process_path(path: str, suffix: str) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.{suffix}{ext}"
+
+
+def _add(
+    org_deltas: dict[int, float],
+    key_deltas: dict[int, tuple[float, datetime]],
+    org_id: int | None,
+    api_key_id: int | None,
+    cost: float,
+    used_at: datetime,
+):
+    if org_id is not None:
+        org_deltas[org_id] = org_deltas.get(org_id, 0.0) + cost
+    if api_key_id is not None:
+        prev_cost, prev_used = key_deltas.get(api_key_id, (0.0, used_at))
+        key_deltas[api_key_id] = (prev_cost + cost, max(prev_used, used_at))
+
+
+def _event(
+    org_id: int | None,
+    api_key_id: int | None,
+    cost: float,
+    used_at: datetime,
+    lease_org: int | None = None,
+    held: float = 0.0,
+) -> str:
+    event = {"org": org_id, "key": api_key_id, "cost": cost, "ts": used_at.isoformat()}
+    if lease_org is not None:
+        event.update(lease=lease_org, held=held)
+    return json.dumps(event) + "\n"
+
+
+def _replay(
+    paths: list[str],
+) -> tuple[dict[int, float], dict[int, tuple[float, datetime]]]:
+    """Sums the charges journaled in `paths` into per-org and per-key deltas.
+
+    Credit still held under a lease when the journal ends is given back to
+    its org (or, if the lease was overdrawn, the overdraft is charged).
+    """
+    org_deltas: dict[int, float] = {}
+    key_deltas: dict[int, tuple[float, datetime]] = {}
+    held: dict[int, float] = {}
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn final write
+                if "org" not in event:
+                    # Checkpoint written at rotation: everything held so far
+                    held = {int(org_id): v for org_id, v in event["held"].items()}
+                    continue
+                _add(
+                    org_deltas,
+                    key_deltas,
+                    event["org"],
+                    event["key"],
+                    event["cost"],
+                    datetime.fromisoformat(event["ts"]),
+                )
+                if event.get("lease") is not None:
+                    held[event["lease"]] = held.get(event["lease"], 0.0) + event["held"]
+    for org_id, amount in held.items():
+        org_deltas[org_id] = org_deltas.get(org_id, 0.0) - amount
+    return org_deltas, key_deltas
+
+
+def _claim(journal_path: str) -> int | None:
+    """Locks a journal for this process; None while another process holds it."""
+    lock = os.open(journal_path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(lock)
+        return None
+    return lock
+
+
+def _open_journal_fd(path: str, truncate: bool = False) -> int:
+    # Unbuffered appends: each write lands in the file as one piece
+    flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | (os.O_TRUNC if truncate else 0)
+    return os.open(path, flags, 0o644)
+
+
+class BillingLedger:
+    """Write-behind credit ledger.
+
+    Completions are charged in memory (per-org and per-key deltas) and
+    flushed to Postgres in one transaction every `flush_interval_ms` or
+    `max_events`, instead of taking row locks per request.
+
+    Every charge is first appended to a local journal. On flush the journal
+    is rotated into `<path>.flushing`, which is deleted once the UPDATE
+    commits; on startup both files are replayed. A crash between COMMIT and
+    the unlink replays that batch twice, so the window is kept to a single
+    syscall.
+
+    Each process owns its journal through an flock on `<path>.lock`, so
+    uvicorn workers never share a file. On startup a process also adopts
+    the journals of processes that died (their lock is free): it rewrites
+    its own journal with their net charges, then deletes theirs. Journal
+    I/O runs on one dedicated thread, so appends and rotations never block
+    the event loop and happen in the order they were issued.
+
+    Credit leases (leases.py) journal what they take out of, spend from and
+    give back to an org's balance. Each rotation starts the new journal with
+    a checkpoint of what is still held, so a replay returns the unused part
+    of a dead process's leases to their orgs.
+    """
+
+    def __init__(
+        self,
+        journal_path: str = BILLING_JOURNAL_PATH,
+        flush_interval_ms: float = BILLING_FLUSH_INTERVAL_MS,
+        max_events: int = BILLING_FLUSH_MAX_EVENTS,
+    ):
+        self.base_path = journal_path
+        # Claimed in start(), so a fork after import gets its own file
+        self.journal_path = journal_path
+        self.flushing_path = journal_path + ".flushing"
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_events = max_events
+
+        self._org_deltas: dict[int, float] = {}
+        self._key_deltas: dict[int, tuple[float, datetime]] = {}
+        self._pending_events = 0
+        # org_id -> USD this process holds under a credit lease
+        self._held: dict[int, float] = {}
+
+        self._journal: int | None = None  # file descriptors
+        self._lock: int | None = None
+        self._buffer: list[str] = []
+        self._executor: ThreadPoolExecutor | None = None
+        self._start_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._flusher: asyncio.Task | None = None
+
+        self.flushes = 0
+        self.flush_failures = 0
+        self.last_flush_size = 0
+        self.last_flush_ms = 0.0
+
+        meter.create_observable_gauge(
+            "gateway.billing.backlog",
+            callbacks=[lambda _options: [Observation(self._pending_events)]],
+            unit="{event}",
+            description="Charges waiting to be flushed",
+        )
+
+    # --- Recording ---
+
+    async def start(self):
+        """Claims this process's journal, replays charges left by earlier
+        processes and starts flushing."""
+        async with self._start_lock:
+            if self._journal is not None:
+                return
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="billing-journal"
+            )
+            org_deltas, key_deltas = await self._io(self._open_journal)
+            for org_id, cost in org_deltas.items():
+                self._apply(org_id, None, cost, _utcnow())
+            for key_id, (cost, used_at) in key_deltas.items():
+                self._apply(None, key_id, cost, used_at)
+            if self.flush_interval > 0:
+                self._flusher = asyncio.create_task(self._run())
+
+    def _io(self, fn, *args) -> asyncio.Future:
+        return asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open_journal(self):
+        os.makedirs(os.path.dirname(self.base_path) or ".", exist_ok=True)
+        pid = str(os.getpid())
+        for suffix in (pid, f"{pid}-{uuid.uuid4().hex[:8]}"):
+            # The second name only matters if another host sharing the
+            # directory runs a process with our pid
+            self.journal_path = _process_path(self.base_path, suffix)
+            self._lock = _claim(self.journal_path)
+            if self._lock is not None:
+                break
+        self.flushing_path = self.journal_path + ".flushing"
+
+        # Our own leftovers (a dead process with the same pid) and orphans
+        sources = [self.journal_path]
+        orphan_locks = []
+        pattern = _process_path(glob.escape(self.base_path), "*") + ".lock"
+        for lock_path in glob.glob(pattern):
+            journal_path = lock_path[: -len(".lock")]
+            if journal_path == self.journal_path:
+                continue
+            lock = _claim(journal_path)
+            if lock is not None:
+                sources.append(journal_path)
+                orphan_locks.append((lock_path, lock))
+
+        # Replayed one process at a time: each journal's checkpoints only
+        # cover that process's leases
+        org_deltas: dict[int, float] = {}
+        key_deltas: dict[int, tuple[float, datetime]] = {}
+        paths = []
+        for source in sources:
+            source_paths = [source + ".flushing", source]
+            source_orgs, source_keys = _replay(source_paths)
+            for org_id, cost in source_orgs.items():
+                _add(org_deltas, key_deltas, org_id, None, cost, _utcnow())
+            for key_id, (cost, used_at) in source_keys.items():
+                _add(org_deltas, key_deltas, None, key_id, cost, used_at)
+            paths.extend(source_paths)
+
+        # Their net charges become our journal before their files go away; a
+        # crash in between replays them twice
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            now = _utcnow()
+            for org_id, cost in org_deltas.items():
+                f.write(_event(org_id, None, cost, now))
+            for key_id, (cost, used_at) in key_deltas.items():
+                f.write(_event(None, key_id, cost, used_at))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+        for path in paths:
+            if path != self.journal_path and os.path.exists(path):
+                os.remove(path)
+        for lock_path, lock in orphan_locks:
+            os.remove(lock_path)
+            os.close(lock)
+
+        self._journal = _open_journal_fd(self.journal_path)
+        return org_deltas, key_deltas
+
+    async def record(
+        self,
+        org_id: int | None,
+        api_key_id: int | None,
+        cost: float,
+        used_at: datetime | None = None,
+        lease_org: int | None = None,
+        held: float = 0.0,
+    ):
+        """Journals a charge and adds it to the pending deltas.
+
+        `org_id=None` charges only the key (the org balance was settled
+        elsewhere, e.g. against a credit lease). `api_key_id=None` adjusts
+        only the org balance; a negative `cost` credits it back. `held`
+        changes what this process holds of `lease_org`'s balance under a
+        credit lease; with both ids None nothing is charged.
+        """
+        await self.start()
+        used_at = used_at or _utcnow()
+        # Buffered and applied together, so a flush takes both or neither
+        self._buffer.append(_event(org_id, api_key_id, cost, used_at, lease_org, held))
+        if org_id is not None or api_key_id is not None:
+            self._apply(org_id, api_key_id, cost, used_at)
+        if lease_org is not None:
+            amount = self._held.get(lease_org, 0.0) + held
+            if abs(amount) > 1e-9:
+                self._held[lease_org] = amount
+            else:
+                self._held.pop(lease_org, None)  # released, up to float dust
+
+        if self._pending_events >= self.max_events:
+            self._wake.set()
+
+        # Concurrent charges go out in one write. Submitted even when a flush
+        # already took our line: it runs after that rotation has written it
+        lines, self._buffer = self._buffer, []
+        await self._io(self._append, lines)
+
+    def _append(self, lines: list[str]):
+        if lines:
+            os.write(self._journal, "".join(lines).encode("utf-8"))
+
+    async def charge(
+        self,
+        org_id: int | None,
+        api_key_id: int | None,
+        cost: float,
+        lease_org: int | None = None,
+        held: float = 0.0,
+    ):
+        """Records a charge; flushes inline when write-behind is disabled."""
+        await self.record(org_id, api_key_id, cost, lease_org=lease_org, held=held)
+        if self.flush_interval <= 0:
+            await self.flush()
+
+    def _apply(
+        self,
+        org_id: int | None,
+        api_key_id: int | None,
+        cost: float,
+        used_at: datetime,
+    ):
+        _add(self._org_deltas, self._key_deltas, org_id, api_key_id, cost, used_at)
+        self._pending_events += 1
+
+    # --- Flushing ---
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except DB_ERRORS as e:
+                print(f"Billing flush failed, will retry: {e}")
+
+    def _rotate_journal(self, lines: list[str], held: dict[int, float]):
+        # Move everything journaled so far, plus the charges still buffered,
+        # into the .flushing file (appending, in case a previous flush failed
+        # and left one behind). All or nothing: on error the journal, its fd
+        # and the .flushing file are as they were
+        with open(self.journal_path, "rb") as src:
+            data = src.read()
+        tmp_path = self.journal_path + ".tmp"
+        flushing = os.open(
+            self.flushing_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+        )
+        journal = None
+        try:
+            start = os.fstat(flushing).st_size
+            try:
+                os.write(flushing, data + "".join(lines).encode("utf-8"))
+                os.fsync(flushing)
+                # The lines that showed what is held are about to be deleted
+                journal = _open_journal_fd(tmp_path, truncate=True)
+                os.write(journal, (json.dumps({"held": held}) + "\n").encode("utf-8"))
+                os.replace(tmp_path, self.journal_path)
+            except OSError:
+                if journal is not None:
+                    os.close(journal)
+                os.ftruncate(flushing, start)
+                raise
+        finally:
+            os.close(flushing)
+        os.close(self._journal)
+        self._journal = journal
+
+    async def flush(self):
+        """Applies all pending deltas in one transaction."""
+        async with self._flush_lock:
+            if not self._pending_events:
+                return
+
+            org_deltas, key_deltas = self._org_deltas, self._key_deltas
+            events = self._pending_events
+            lines = self._buffer
+            self._org_deltas, self._key_deltas, self._pending_events = {}, {}, 0
+            self._buffer = []
+
+            rotated = False
+            try:
+                await self._io(self._rotate_journal, lines, dict(self._held))
+                rotated = True
+                started = time.perf_counter()
+                await self._write(org_deltas, key_deltas)
+            except Exception:
+                # Put the deltas back; their journal lines stay in .flushing,
+                # or in the journal and the buffer if the rotation failed
+                self.flush_failures += 1
+                if not rotated:
+                    self._buffer[:0] = lines
+                for org_id, cost in org_deltas.items():
+                    self._org_deltas[org_id] = self._org_deltas.get(org_id, 0.0) + cost
+                for key_id, (cost, used_at) in key_deltas.items():
+                    prev_cost, prev_used = self._key_deltas.get(key_id, (0.0, used_at))
+                    self._key_deltas[key_id] = (
+                        prev_cost + cost,
+                        max(prev_used, used_at),
+                    )
+                self._pending_events += events
+                raise
+
+            await self._io(os.remove, self.flushing_path)
+
+            self.flushes += 1
+            self.last_flush_size = events
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+            _flush_size.record(events)
+            _flush_latency.record(self.last_flush_ms)
+
+    async def _write(
+        self,
+        org_deltas: dict[int, float],
+        key_deltas: dict[int, tuple[float, datetime]],
+    ):
+        org_table = Organization.__table__
+        key_table = ApiKey.__table__
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            # Sorted ids keep lock order stable across gateway replicas
+            if org_deltas:
+                await session.execute(
+                    update(org_table)
+                    .where(org_table.c.id == bindparam("b_id"))
+                    .values(credits=org_table.c.credits - bindparam("b_cost")),
+                    [
+                        {"b_id": org_id, "b_cost": cost}
+                        for org_id, cost in sorted(org_deltas.items())
+                    ],
+                )
+            if key_deltas:
+                await session.execute(
+                    update(key_table)
+                    .where(key_table.c.id == bindparam("b_id"))
+                    .values(
+                        credits_consumed=key_table.c.credits_consumed
+                        + bindparam("b_cost"),
+                        last_used=bindparam("b_used"),
+                    ),
+                    [
+                        {"b_id": key_id, "b_cost": cost, "b_used": used_at}
+                        for key_id, (cost, used_at) in sorted(key_deltas.items())
+                    ],
+                )
+            await session.commit()
+
+    async def stop(self):
+        """Final flush on graceful shutdown. Unflushed charges stay journaled."""
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        try:
+            await self.flush()
+        except DB_ERRORS as e:
+            print(f"Final billing flush failed, journal kept for replay: {e}")
+        if self._journal is not None:
+            await self._io(self._close)
+            self._executor.shutdown(wait=False)
+            self._journal = None
+
+    def _close(self):
+        os.close(self._journal)
+        # Releasing the lock lets the next process adopt what is left
+        os.close(self._lock)
+
+    def stats(self) -> dict:
+        return {
+            "backlog": self._pending_events,
+            "flushes": self.flushes,
+            "flush_failures": self.flush_failures,
+            "last_flush_size": self.last_flush_size,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+ledger = BillingLedger()
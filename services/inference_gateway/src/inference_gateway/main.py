@@ -1,18 +1,91 @@
-import json
-from typing import List, Optional
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
 
-from database.models import RequestLog
-from database.session import engine
-from fastapi import BackgroundTasks, FastAPI, Header, HTTPException
+from database.session import DB_ERRORS
+from fastapi import Depends, FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
+from inference_gateway import catalog
+from inference_gateway.auth_cache import auth_cache, invalidate_api_key
+from inference_gateway.cache_policy import cache_policy
+from inference_gateway.cache_writer import cache_writer
+from inference_gateway.circuit_breaker import breakers
+from inference_gateway.hedging import hedging
+from inference_gateway.leases import credit_leases
+from inference_gateway.ledger import ledger
 from inference_gateway.mcp_server import mcp
+from inference_gateway.provider_keys import (
+    invalidate_provider_key,
+    provider_key_cache,
+    sweep_periodically,
+)
+from inference_gateway.request_log import build_log_row, request_log_writer
 from inference_gateway.router import gateway_app
+from inference_gateway.selection import selection
+from inference_gateway.shadow import shadow_runner
+from inference_gateway.singleflight import single_flight
+from inference_gateway.speculation import speculation
+from inference_gateway.sse import coalesce_chunks, coalesce_window, sse_generator
 from pydantic import BaseModel
+from shared import cache as response_cache
+from shared.events import listen_invalidations
 from shared.instrumentation import instrument_app
-from sqlmodel.ext.asyncio.session import AsyncSession
 
-app = FastAPI(title="OpenRouter Inference Gateway")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "300"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await catalog.refresh()
+    except DB_ERRORS as e:
+        # route_node retries the load lazily on first use
+        print(f"Warning: Failed to load model catalog at startup ({e}).")
+
+    # Replays charges journaled by a previous process before serving traffic
+    await ledger.start()
+    request_log_writer.start()
+    cache_writer.start()
+
+    # Control plane changes reach our in-process caches over Redis pub/sub
+    tasks = [
+        asyncio.create_task(
+            listen_invalidations(
+                {
+                    "api_key": invalidate_api_key,
+                    "catalog": catalog.handle_invalidation,
+                    "provider_key": invalidate_provider_key,
+                    "shadow_target": shadow_runner.handle_invalidation,
+                    # Breakers opened by another replica (BREAKER_SHARED)
+                    "breaker": breakers.handle_remote_open,
+                }
+            )
+        ),
+        asyncio.create_task(catalog.refresh_periodically(CATALOG_REFRESH_INTERVAL)),
+        asyncio.create_task(
+            shadow_runner.refresh_periodically(CATALOG_REFRESH_INTERVAL)
+        ),
+        asyncio.create_task(sweep_periodically()),
+        asyncio.create_task(credit_leases.release_idle_periodically()),
+        asyncio.create_task(response_cache.snapshot_periodically()),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+    # Unused lease credit is returned through the ledger's final flush
+    await credit_leases.release_all()
+    await ledger.stop()
+    await request_log_writer.stop()
+    await cache_writer.stop()
+    await shadow_runner.stop()
+    # Lets the next process start with a warm local vector index
+    await response_cache.snapshot_local_index()
+
+
+app = FastAPI(title="OpenRouter Inference Gateway", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,11 +104,20 @@ class ChatMessage(BaseModel):
     content: str
 
 
+class RoutingOptions(BaseModel):
+    """Provider selection for one request; overrides the API key's policy."""
+
+    policy: Literal["default", "cheapest", "fastest", "throughput", "balanced"]
+    max_cost: Optional[float] = None  # USD per 1M input + output tokens
+    latency_target_ms: Optional[float] = None  # p90 for "balanced", see selection
+
+
 class ChatRequest(BaseModel):
     model: str
     messages: List[ChatMessage]
     stream: Optional[bool] = False
     shadow_mode: Optional[bool] = False
+    routing: Optional[RoutingOptions] = None
 
 
 @app.get("/health")
@@ -43,76 +125,61 @@ async def health():
     return {"status": "healthy"}
 
 
-async def log_request_task(result: dict):
-    """Background task to save request logs."""
-    # If error occurred, result might be partial.
-    if result.get("error"):
-        # We can still log errors if we have user_id
-        return
+async def require_admin(x_admin_token: str = Header(None)):
+    """Guards /admin routes when ADMIN_TOKEN is configured."""
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.get("/admin/stats", dependencies=[Depends(require_admin)])
+async def admin_stats():
+    return {
+        "auth_cache": auth_cache.stats(),
+        "catalog": catalog.stats(),
+        "provider_key_cache": provider_key_cache.stats(),
+        "billing": ledger.stats(),
+        "credit_leases": credit_leases.stats(),
+        "request_log": request_log_writer.stats(),
+        "response_cache": response_cache.stats(),
+        "cache_writer": cache_writer.stats(),
+        "cache_policy": cache_policy.stats(),
+        "single_flight": single_flight.stats(),
+        "speculation": speculation.stats(),
+        "shadow": shadow_runner.stats(),
+        "circuit_breakers": breakers.stats(),
+        "selection": selection.stats(),
+        "hedging": hedging.stats(),
+    }
 
-    try:
-        user_id = result.get("user_id")
-        api_key_id = result.get("api_key_id")
-
-        if not user_id or not api_key_id:
-            return
-
-        usage = result.get("usage") or {"prompt_tokens": 0, "completion_tokens": 0}
-        costs = result.get("costs") or {"input": 0.0, "output": 0.0}
-
-        input_cost = (usage["prompt_tokens"] / 1_000_000.0) * costs["input"]
-        output_cost = (usage["completion_tokens"] / 1_000_000.0) * costs["output"]
-        total_cost = input_cost + output_cost
-
-        # For streaming, usage might be 0 here because stream hasn't finished.
-        # Ideally, we'd log *after* stream, but that requires more complex architecture.
-        # For Phase 8/10 MVP, logging start/latency is key.
-
-        log_entry = RequestLog(
-            user_id=user_id,
-            organization_id=result.get("org_id"),
-            api_key_id=api_key_id,
-            model_slug=result.get("model_slug", "unknown"),
-            provider_name=result.get("provider_info", {}).get("name", "unknown"),
-            prompt_tokens=usage["prompt_tokens"],
-            completion_tokens=usage["completion_tokens"],
-            cost=total_cost,
-            latency_ms=result.get("latency_ms", 0),
-            status_code=200,
-            is_cached=False,  # Placeholder for generic caching
-        )
 
-        async with AsyncSession(engine, expire_on_commit=False) as session:
-            session.add(log_entry)
-            await session.commit()
+@app.get("/admin/circuit-breakers", dependencies=[Depends(require_admin)])
+async def admin_circuit_breakers():
+    return breakers.stats()
 
-    except Exception as e:
-        print(f"Logging Failed: {e}")
 
+@app.post("/admin/circuit-breakers/reset", dependencies=[Depends(require_admin)])
+async def admin_reset_circuit_breakers(key: Optional[str] = None):
+    """Closes one breaker (e.g. `?key=Groq` or `?key=Groq|llama-3`) or all of them."""
+    breakers.reset(key)
+    return breakers.stats()
 
-async def sse_generator(stream_iterator):
-    """Formats chunks into SSE events."""
-    try:
-        async for chunk in stream_iterator:
-            if hasattr(chunk, "model_dump"):
-                data = chunk.model_dump()
-            elif hasattr(chunk, "dict"):
-                data = chunk.dict()
-            else:
-                data = chunk
-            yield f"data: {json.dumps(data, default=str)}\n\n"
-    except Exception as e:
-        print(f"Streaming Error: {e}")
-        yield f"data: {json.dumps({'error': str(e)})}\n\n"
 
-    yield "data: [DONE]\n\n"
+@app.post("/admin/catalog/refresh", dependencies=[Depends(require_admin)])
+async def admin_refresh_catalog():
+    try:
+        await catalog.refresh()
+    except DB_ERRORS as e:
+        raise HTTPException(
+            status_code=503, detail=f"Catalog refresh failed: {e}"
+        ) from e
+    return catalog.stats()
 
 
 @app.post("/v1/chat/completions")
 async def chat_completions(
     request: ChatRequest,
-    background_tasks: BackgroundTasks,
     authorization: str = Header(None),
+    x_himmi_coalesce: Optional[str] = Header(None),
 ):
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(
@@ -121,12 +188,19 @@ async def chat_completions(
 
     api_key = authorization.replace("Bearer ", "")
 
+    if request.shadow_mode and not shadow_runner.has_target(request.model):
+        raise HTTPException(
+            status_code=422,
+            detail=f"shadow_mode requires a shadow target for {request.model}",
+        )
+
     inputs = {
         "raw_api_key": api_key,
         "model_slug": request.model,
         "messages": [m.model_dump() for m in request.messages],
         "stream": request.stream,
         "shadow_mode": request.shadow_mode,
+        "routing": request.routing.model_dump() if request.routing else None,
     }
 
     result = await gateway_app.ainvoke(inputs)
@@ -134,18 +208,18 @@ async def chat_completions(
     if result.get("error"):
         raise HTTPException(status_code=403, detail=result["error"])
 
-    # Trigger logging in background
-    # Note: For streaming requests, this logs *initial* state (latency to first token).
-    # Token usage will be 0. Real usage is updated in DB by billing_node logic.
-    # We accept this dual-write/incomplete log for streams for now.
-    background_tasks.add_task(log_request_task, result)
-
     if request.stream and result.get("stream_iterator"):
-        return StreamingResponse(
-            sse_generator(result["stream_iterator"]), media_type="text/event-stream"
-        )
+        # Streams are logged by the billing wrapper once they finish
+        stream = result["stream_iterator"]
+        window_ms = coalesce_window(x_himmi_coalesce)
+        if window_ms is not None:
+            stream = coalesce_chunks(stream, window_ms)
+        return StreamingResponse(sse_generator(stream), media_type="text/event-stream")
+
+    # Queue the log row for the batched writer
+    await request_log_writer.submit(build_log_row(result))
 
-    # Prepare response, including shadow data if present
+    # Prepare response
     response_data = {
         "id": "chatcmpl-" + str(result.get("user_id", "unknown")),
         "object": "chat.completion",
@@ -160,8 +234,9 @@ async def chat_completions(
         "usage": result["usage"],
     }
 
-    if result.get("shadow_response"):
+    if request.shadow_mode:
+        # The shadow runs after the response is served and is compared in
+        # EvaluationPair; null when the shadow pool was saturated
         response_data["shadow_model"] = result.get("shadow_model_slug")
-        response_data["shadow_response"] = result.get("shadow_response")
 
     return response_data
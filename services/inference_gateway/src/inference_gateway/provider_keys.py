@@ -0,0 +1,123 @@
+import asyncio
+import os
+from collections.abc import Hashable
+
+from cryptography.fernet import InvalidToken
+from database.encryption import decrypt
+from database.models import UserProviderKey
+from database.session import engine
+from shared.instrumentation import meter
+from shared.lru import TTLCache
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+PROVIDER_KEY_CACHE_SIZE = int(os.getenv("PROVIDER_KEY_CACHE_SIZE", "5000"))
+PROVIDER_KEY_CACHE_TTL = float(os.getenv("PROVIDER_KEY_CACHE_TTL", "30"))
+
+_lookups = meter.create_counter(
+    "gateway.provider_key_cache.lookups",
+    description="BYOK key cache lookups by result",
+)
+
+
+def _wipe(_key: Hashable, secret: bytearray | None):
+    # Overwrite the plaintext in place so it doesn't linger in freed memory.
+    # str copies handed to litellm are out of our reach; this bounds their
+    # number to one per request instead of one per cached entry lifetime.
+    if secret is not None:
+        for i in range(len(secret)):
+            secret[i] = 0
+
+
+_UNCACHED = object()
+
+# (user_id, canonical provider) -> bytearray plaintext, or None if no BYOK key
+provider_key_cache = TTLCache(
+    maxsize=PROVIDER_KEY_CACHE_SIZE, ttl=PROVIDER_KEY_CACHE_TTL, on_evict=_wipe
+)
+
+# Misses being loaded right now, so concurrent lookups share one query.
+# Invalidation drops a key's entry: its load may have read the row before
+# the change, so the result is returned to its waiters but not cached.
+# Loads resolve to (secret, plaintext): only the leader touches the secret,
+# which it caches; waiters get the str decoded before anything can wipe it.
+_loading: dict[tuple[int, str], asyncio.Future] = {}
+
+
+def _finish_loading(cache_key: tuple[int, str], loading: asyncio.Future) -> bool:
+    """Unregisters `loading`; False if an invalidation already dropped it."""
+    if _loading.get(cache_key) is not loading:
+        return False
+    del _loading[cache_key]
+    return True
+
+
+async def _load_key(user_id: int, provider: str) -> bytearray | None:
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        key_stmt = select(UserProviderKey.encrypted_key).where(
+            UserProviderKey.user_id == user_id,
+            UserProviderKey.provider_name == provider,
+        )
+        encrypted_key = (await session.execute(key_stmt)).scalar_one_or_none()
+
+    if not encrypted_key:
+        return None
+    try:
+        return bytearray(decrypt(encrypted_key).encode())
+    except InvalidToken:
+        # Undecryptable (e.g. rotated ENCRYPTION_KEY): fall back to platform key
+        return None
+
+
+async def _load(user_id: int, provider: str) -> tuple[bytearray | None, str | None]:
+    secret = await _load_key(user_id, provider)
+    return secret, secret.decode() if secret is not None else None
+
+
+async def get_provider_key(user_id: int, provider: str) -> str | None:
+    """Returns the user's decrypted BYOK key for `provider`, or None."""
+    cache_key: tuple[int, str] = (user_id, provider)
+    secret = provider_key_cache.get(cache_key, _UNCACHED)
+    if secret is not _UNCACHED:
+        _lookups.add(1, {"result": "hit"})
+        return secret.decode() if secret is not None else None
+
+    loading = _loading.get(cache_key)
+    if loading is not None:
+        _lookups.add(1, {"result": "coalesced"})
+        _, plaintext = await asyncio.shield(loading)
+        return plaintext
+
+    _lookups.add(1, {"result": "miss"})
+    loading = asyncio.ensure_future(_load(user_id, provider))
+    _loading[cache_key] = loading
+    try:
+        secret, plaintext = await asyncio.shield(loading)
+    finally:
+        if loading.done():
+            fresh = _finish_loading(cache_key, loading)
+        else:
+            # Our caller was cancelled; let the load finish for the others
+            loading.add_done_callback(lambda _: _finish_loading(cache_key, loading))
+    if fresh:
+        # Negative entries too: most users have no BYOK key at all
+        provider_key_cache.set(cache_key, secret)
+    return plaintext
+
+
+def invalidate_provider_key(key: str | None = None):
+    """Invalidation handler. `key` is "<user_id>:<provider>", or None for all."""
+    if key is None:
+        provider_key_cache.clear()
+        _loading.clear()
+        return
+    user_id, _, provider = key.partition(":")
+    provider_key_cache.pop((int(user_id), provider))
+    _loading.pop((int(user_id), provider), None)
+
+
+async def sweep_periodically(interval: float = PROVIDER_KEY_CACHE_TTL):
+    """Wipes expired plaintext keys even if nobody asks for them again."""
+    while True:
+        await asyncio.sleep(interval)
+        provider_key_cache.purge_expired()
@@ -0,0 +1,179 @@
+import asyncio
+import os
+import time
+
+from database.models import RequestLog
+from database.session import DB_ERRORS, engine
+from opentelemetry.metrics import Observation
+from shared.instrumentation import meter
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+REQUEST_LOG_QUEUE_SIZE = int(os.getenv("REQUEST_LOG_QUEUE_SIZE", "10000"))
+REQUEST_LOG_BATCH_SIZE = int(os.getenv("REQUEST_LOG_BATCH_SIZE", "500"))
+REQUEST_LOG_FLUSH_MS = float(os.getenv("REQUEST_LOG_FLUSH_MS", "200"))
+# How long a request may wait for queue space before its log row is dropped
+REQUEST_LOG_ENQUEUE_TIMEOUT_MS = float(os.getenv("REQUEST_LOG_ENQUEUE_TIMEOUT_MS", "0"))
+
+_rows = meter.create_counter(
+    "gateway.request_log.rows", description="RequestLog rows by outcome"
+)
+_batch_latency = meter.create_histogram(
+    "gateway.request_log.insert_latency", unit="ms", description="Bulk INSERT time"
+)
+
+
+def build_log_row(result: dict, **stream_metrics) -> dict | None:
+    """Turns a final gateway state into RequestLog column values.
+
+    Streams are logged once they finish, with `stream_metrics` holding the
+    ttft_ms / stream_duration_ms / chunk_count / tokens_per_sec columns.
+    """
+    # If error occurred, result might be partial.
+    if result.get("error"):
+        # We can still log errors if we have user_id
+        return None
+
+    user_id = result.get("user_id")
+    api_key_id = result.get("api_key_id")
+
+    if not user_id or not api_key_id:
+        return None
+
+    usage = result.get("usage") or {"prompt_tokens": 0, "completion_tokens": 0}
+    costs = result.get("costs") or {"input": 0.0, "output": 0.0}
+
+    input_cost = (usage["prompt_tokens"] / 1_000_000.0) * costs["input"]
+    output_cost = (usage["completion_tokens"] / 1_000_000.0) * costs["output"]
+    total_cost = input_cost + output_cost
+
+    log_entry = RequestLog(
+        user_id=user_id,
+        organization_id=result.get("org_id"),
+        api_key_id=api_key_id,
+        model_slug=result.get("model_slug", "unknown"),
+        provider_name=(result.get("provider_info") or {}).get("name", "unknown"),
+        prompt_tokens=usage["prompt_tokens"],
+        completion_tokens=usage["completion_tokens"],
+        cost=total_cost,
+        latency_ms=result.get("latency_ms", 0),
+        status_code=result.get("status_code", 200),
+        is_cached=bool(result.get("is_cached")),
+        **stream_metrics,
+    )
+    # Validated model -> plain column dict (defaults such as timestamp filled in)
+    return log_entry.model_dump(exclude={"id"})
+
+
+class RequestLogWriter:
+    """Bounded queue of RequestLog rows drained by one bulk-inserting worker.
+
+    Rows are inserted with a single multi-row INSERT every `batch_size` rows
+    or `flush_ms`, whichever comes first. When Postgres falls behind and the
+    queue is full, `submit` waits up to `enqueue_timeout_ms` for space and
+    then drops the row (counted in `dropped`) rather than stalling requests.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = REQUEST_LOG_QUEUE_SIZE,
+        batch_size: int = REQUEST_LOG_BATCH_SIZE,
+        flush_ms: float = REQUEST_LOG_FLUSH_MS,
+        enqueue_timeout_ms: float = REQUEST_LOG_ENQUEUE_TIMEOUT_MS,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000.0
+        self.enqueue_timeout = enqueue_timeout_ms / 1000.0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._worker: asyncio.Task | None = None
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+        meter.create_observable_gauge(
+            "gateway.request_log.queue_depth",
+            callbacks=[lambda _options: [Observation(self._queue.qsize())]],
+            unit="{row}",
+        )
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def submit(self, row: dict | None) -> bool:
+        """Queues a row for insertion. Returns False if it was dropped."""
+        if row is None:
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.enqueue_timeout > 0:
+            try:
+                await asyncio.wait_for(self._queue.put(row), self.enqueue_timeout)
+                return True
+            except TimeoutError:
+                pass
+
+        self.dropped += 1
+        _rows.add(1, {"outcome": "dropped"})
+        return False
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except TimeoutError:
+                    break
+            await self._insert(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _insert(self, batch: list[dict]):
+        started = time.perf_counter()
+        try:
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                # One multi-row INSERT for the whole batch
+                await session.execute(insert(RequestLog).values(batch))
+                await session.commit()
+        except DB_ERRORS as e:
+            self.failed += len(batch)
+            _rows.add(len(batch), {"outcome": "failed"})
+            print(f"RequestLog batch insert failed ({len(batch)} rows): {e}")
+            return
+
+        self.written += len(batch)
+        _rows.add(len(batch), {"outcome": "written"})
+        _batch_latency.record((time.perf_counter() - started) * 1000)
+
+    async def stop(self, timeout: float = 10.0):
+        """Waits for the worker to write out everything still queued."""
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except TimeoutError:
+            print(f"RequestLog shutdown timed out, {self._queue.qsize()} rows lost")
+        self._worker.cancel()
+        self._worker = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+request_log_writer = RequestLogWriter()
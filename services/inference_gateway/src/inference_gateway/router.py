@@ -2,25 +2,32 @@ import asyncio
 import hashlib
 import os
 import time
-from datetime import datetime, timezone
-from typing import AsyncGenerator, List, Optional, TypedDict
+from typing import AsyncGenerator, List, NamedTuple, Optional, TypedDict
 
+import aiohttp
+import httpx
 import litellm
-from database.encryption import decrypt
-from database.models import (
-    ApiKey,
-    Model,
-    ModelProviderMapping,
-    Organization,
-    Provider,
-    User,
-    UserProviderKey,
-)
+import openai
+from database.models import Organization
 from database.session import engine
+from inference_gateway import catalog
+from inference_gateway.auth_cache import resolve_api_key
+from inference_gateway.cache_policy import cache_policy
+from inference_gateway.cache_writer import cache_writer
+from inference_gateway.catalog import LITELLM_PROVIDER_MAP
+from inference_gateway.circuit_breaker import breakers
+from inference_gateway.hedging import hedging
+from inference_gateway.leases import credit_leases
+from inference_gateway.ledger import ledger
+from inference_gateway.provider_keys import get_provider_key
+from inference_gateway.request_log import build_log_row, request_log_writer
+from inference_gateway.selection import Policy, selection
+from inference_gateway.shadow import shadow_runner
+from inference_gateway.singleflight import single_flight
+from inference_gateway.speculation import discard_call, speculation
 from langgraph.graph import END, StateGraph
-from shared.cache import check_cache, store_cache
+from shared.cache import CACHE_ISOLATE_ORGS, check_cache
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 from sqlmodel import select
 
 
@@ -31,18 +38,24 @@ class GatewayState(TypedDict):
     messages: List[dict]
     stream: bool
     shadow_mode: Optional[bool]
+    routing: Optional[dict]  # per-request routing policy, overrides the key's
 
     # Internal State
     user_id: Optional[int]
     api_key_id: Optional[int]
     org_id: Optional[int]
+    routing_policy: Optional[dict]  # the API key's routing policy
     provider_info: Optional[dict]
     costs: Optional[dict]  # input_token_cost, output_token_cost
     start_time: float
     latency_ms: int
-    shadow_model_slug: Optional[str]
-    shadow_response: Optional[str]
+    upstream_ms: float  # the serving attempt: to the first chunk for streams
     is_cached: bool  # New flag
+    cache_bypassed: bool  # Cache skipped by the eligibility policy
+    coalesced: bool  # Served from another request's upstream call
+    speculative_call: Optional[asyncio.Task]  # Upstream call raced with the cache
+    routes: tuple  # every catalog.Route for the model, in failover order
+    shadow_model_slug: Optional[str]  # shadow queued for this completion
 
     # Outputs
     response_content: Optional[str]
@@ -51,23 +64,7 @@ class GatewayState(TypedDict):
     error: Optional[str]
 
 
-from shared.instrumentation import trace_node
-
-# Map DB provider names to LiteLLM provider prefixes
-LITELLM_PROVIDER_MAP = {
-    "Google AI": "gemini",
-    "OpenAI": "openai",
-    "Anthropic": "anthropic",
-    "Groq": "groq",  # Groq inference platform (fast LPU)
-    "Perplexity": "perplexity",
-    "Mistral AI": "mistral",
-    "Mistral": "mistral",
-    "xAI": "xai",  # xAI Grok models
-    "Meta": "groq",  # Llama 4 served via Groq
-    "DeepSeek": "deepseek",
-    "Amazon Bedrock": "bedrock",  # AWS Bedrock
-    "Ollama (Local)": "ollama",  # Local models via Ollama
-}
+from shared.instrumentation import meter, trace_node
 
 # Ollama base URL — override with OLLAMA_BASE_URL env var if running remotely
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
@@ -75,6 +72,32 @@ OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 # AWS Bedrock region
 BEDROCK_REGION = os.getenv("AWS_DEFAULT_REGION", "us-east-1")
 
+# Provider failover: routes tried per request, and each attempt's deadline
+# (the whole call, or up to the first chunk for streams)
+FAILOVER_MAX_ATTEMPTS = int(os.getenv("FAILOVER_MAX_ATTEMPTS", "3"))
+UPSTREAM_ATTEMPT_TIMEOUT = float(os.getenv("UPSTREAM_ATTEMPT_TIMEOUT", "30"))
+# What an upstream attempt can fail with: LiteLLM maps most provider errors
+# onto subclasses of the openai SDK's OpenAIError, but its budget error does
+# not derive from it and some provider paths leak raw httpx/aiohttp errors;
+# TimeoutError is our own deadline
+UPSTREAM_ERRORS = (
+    openai.OpenAIError,
+    litellm.exceptions.BudgetExceededError,
+    httpx.HTTPError,
+    aiohttp.ClientError,
+    TimeoutError,
+)
+
+_attempts = meter.create_counter(
+    "gateway.upstream.attempts",
+    description="Upstream attempts by provider and outcome (served, retried, failed, skipped)",
+)
+
+# Streamed completions longer than this are not cached
+CACHE_STREAM_MAX_CHARS = int(os.getenv("CACHE_STREAM_MAX_CHARS", "32768"))
+# Text per chunk when a cache hit is replayed as a stream
+CACHE_REPLAY_CHUNK_CHARS = int(os.getenv("CACHE_REPLAY_CHUNK_CHARS", "256"))
+
 
 # --- NODES ---
 
@@ -86,18 +109,30 @@ async def init_node(state: GatewayState):
 
 @trace_node("cache_lookup")
 async def cache_lookup_node(state: GatewayState):
-    # Only cache simple user prompts for now
     if not state.get("messages"):
         return {"is_cached": False}
 
-    last_msg = state["messages"][-1]["content"]
-
-    # We only cache the LAST message content as key for now
-    cached_response = await check_cache(last_msg)
-    if cached_response:
-        print("Cache HIT!")
+    org_id = None
+    if CACHE_ISOLATE_ORGS or cache_policy.enabled:
+        # Runs alongside auth_node; both share the auth cache entry
+        key_hash = hashlib.sha256(state["raw_api_key"].encode()).hexdigest()
+        entry = await resolve_api_key(key_hash)
+        if not entry or entry.org_id is None:
+            return {"is_cached": False}
+        org_id = entry.org_id
+
+    # Segments that never hit skip the embedding and search (and the store)
+    eligibility = cache_policy.decide(org_id, state["model_slug"], state["messages"])
+    if not eligibility.use_cache:
+        return {"is_cached": False, "cache_bypassed": True}
+
+    # L1 (in-process) -> L2 (Redis exact) -> semantic
+    hit = await check_cache(state["model_slug"], state["messages"], org_id=org_id)
+    cache_policy.record(eligibility.segment, hit is not None)
+    if hit:
+        print(f"Cache HIT ({hit.tier})")
         return {
-            "response_content": cached_response,
+            "response_content": hit.response,
             "is_cached": True,
             "usage": {"prompt_tokens": 0, "completion_tokens": 0},  # FREE
         }
@@ -108,12 +143,39 @@ async def cache_lookup_node(state: GatewayState):
 async def cache_store_node(state: GatewayState):
     if (
         not state.get("is_cached")
+        and not state.get("coalesced")
+        and not state.get("cache_bypassed")
         and not state.get("error")
         and state.get("response_content")
     ):
-        # Store only if we have a valid text response
-        last_msg = state["messages"][-1]["content"]
-        await store_cache(last_msg, state["response_content"])
+        # Store only if we have a valid text response. Written behind, so
+        # the response does not wait for the embedding and Redis round trips
+        cache_writer.submit(
+            state["model_slug"],
+            state["messages"],
+            state["response_content"],
+            org_id=state.get("org_id"),
+        )
+    return state
+
+
+@trace_node("shadow")
+async def shadow_node(state: GatewayState):
+    """Queues a sampled shadow of a non-streaming completion."""
+    if (
+        not state.get("is_cached")
+        and not state.get("coalesced")
+        and not state.get("error")
+        and state.get("response_content")
+    ):
+        shadow = shadow_runner.pick(state["model_slug"], bool(state.get("shadow_mode")))
+        if shadow and shadow_runner.submit(
+            shadow,
+            state["messages"],
+            state["model_slug"],
+            state["response_content"],
+        ):
+            return {"shadow_model_slug": shadow.model}
     return state
 
 
@@ -122,40 +184,38 @@ async def auth_node(state: GatewayState):
     """Verifies the API key and checks organization credit balance."""
     key_hash = hashlib.sha256(state["raw_api_key"].encode()).hexdigest()
 
-    async with AsyncSession(engine, expire_on_commit=False) as session:
-        # Find Key -> User -> Organization
-        statement = (
-            select(ApiKey)
-            .where(
-                ApiKey.key_hash == key_hash,
-                ApiKey.disabled == False,
-                ApiKey.deleted == False,
-            )
-            .options(selectinload(ApiKey.user).selectinload(User.organization))
-        )
-
-        result = await session.execute(statement)
-        api_key_db = result.scalar_one_or_none()
+    # Key -> User -> Organization comes from the in-process auth cache
+    entry = await resolve_api_key(key_hash)
 
-        if not api_key_db:
-            return {"error": "Invalid or disabled API Key"}
+    if not entry or entry.disabled or entry.deleted:
+        return {"error": "Invalid or disabled API Key"}
 
-        user_db = api_key_db.user
-        if not user_db or not user_db.organization:
-            # Should practically not happen with correct data integrity
-            return {"error": "User configuration error (No Organization)"}
+    if entry.org_id is None:
+        # Should practically not happen with correct data integrity
+        return {"error": "User configuration error (No Organization)"}
 
-        org_db = user_db.organization
+    if credit_leases.enabled:
+        # Authorized against this gateway's lease on the org balance
+        if not await credit_leases.authorize(entry.org_id):
+            return {"error": "Insufficient credits"}
+    else:
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            # Balance is never cached: a single-column primary key lookup
+            credits_stmt = select(Organization.credits).where(
+                Organization.id == entry.org_id
+            )
+            credits = (await session.execute(credits_stmt)).scalar_one_or_none()
 
-        if org_db.credits <= 0:
+        if credits is None or credits <= 0:
             return {"error": "Insufficient credits"}
 
-        return {
-            "user_id": user_db.id,
-            "api_key_id": api_key_db.id,
-            "org_id": org_db.id,
-            "error": None,
-        }
+    return {
+        "user_id": entry.user_id,
+        "api_key_id": entry.api_key_id,
+        "org_id": entry.org_id,
+        "routing_policy": entry.routing_policy,
+        "error": None,
+    }
 
 
 @trace_node("route")
@@ -164,54 +224,146 @@ async def route_node(state: GatewayState):
     if state.get("error"):
         return state
 
-    async with AsyncSession(engine, expire_on_commit=False) as session:
-        # Find Model and its first available mapping
-        statement = select(Model, ModelProviderMapping, Provider).where(
-            Model.slug == state["model_slug"],
-            ModelProviderMapping.model_id == Model.id,
-            ModelProviderMapping.provider_id == Provider.id,
-        )
-        result = await session.execute(statement)
-        row = result.first()
+    # In-memory routing table: no DB round-trip
+    await catalog.ensure_loaded()
+    routes = catalog.lookup(state["model_slug"])
+    if not routes:
+        return {"error": "Model not supported or mapping missing"}
 
-        if not row:
-            return {"error": "Model not supported or mapping missing"}
+    # We store the provider details and costs for the billing node.
+    # The BYOK key is filled in by prepare_node once auth knows the user,
+    # and the routes are reordered by _apply_routing_policy.
+    return {**_route_state(routes[0]), "routes": routes}
 
-        model_db, mapping_db, provider_db = row
 
-        # Check for User-Specified Provider Key (BYOK)
-        # We need to look up using the canonical name that the frontend uses
-        canonical_provider = LITELLM_PROVIDER_MAP.get(
-            provider_db.name, provider_db.name.lower()
-        )
+def _apply_routing_policy(state: GatewayState, auth: dict, route: dict) -> dict:
+    """Reorders the routes by the request's (or else the key's) policy."""
+    if route.get("error"):
+        return route
+    try:
+        policy = Policy.parse(state.get("routing") or auth.get("routing_policy"))
+    except ValueError as e:
+        return {"error": str(e)}
+    if policy == Policy():
+        return route
+    routes = selection.order(route["routes"], policy, bool(state.get("stream")))
+    if not routes:
+        return {"error": "No provider for this model is within the cost ceiling"}
+    return {**_route_state(routes[0]), "routes": routes}
+
+
+def _route_state(route: catalog.Route, api_key: Optional[str] = None) -> dict:
+    return {
+        "provider_info": {
+            "name": route.provider,
+            "model_name": route.model_name,  # e.g. "gpt-4o"
+            "api_key": api_key,
+        },
+        "costs": {
+            "input": route.input_cost,
+            "output": route.output_cost,
+            "mapping_id": route.mapping_id,
+        },
+    }
+
+
+class _AuthFailed(Exception):
+    def __init__(self, result: dict):
+        self.result = result
+
+
+async def _checked_auth(state: GatewayState) -> dict:
+    result = await auth_node(state)
+    if result.get("error"):
+        # Raising inside the TaskGroup cancels the sibling branches
+        raise _AuthFailed(result)
+    return result
+
+
+async def _byok_provider_info(route: dict, user_id: int) -> dict:
+    # Check for User-Specified Provider Key (BYOK)
+    # We need to look up using the canonical name that the frontend uses
+    provider_info = route["provider_info"]
+    provider_info["api_key"] = await get_provider_key(
+        user_id, catalog.litellm_prefix(provider_info["name"])
+    )
+    return provider_info
+
+
+async def _speculate(
+    state: GatewayState,
+    auth_task: asyncio.Task,
+    route_task: asyncio.Task,
+    cache_task: asyncio.Task,
+) -> Optional[asyncio.Task]:
+    """Starts the upstream call before the cache lookup finishes, if the
+    model's cache rarely hits for this org."""
+    await asyncio.wait({auth_task, route_task})
+    if cache_task.done() or auth_task.exception() or route_task.exception():
+        return None
+    auth = auth_task.result()
+    route = _apply_routing_policy(state, auth, route_task.result())
+    if route.get("error") or not speculation.should_speculate(
+        state["model_slug"], auth["org_id"]
+    ):
+        return None
+    await _byok_provider_info(route, auth["user_id"])
+    if cache_task.done():
+        return None
+    return asyncio.create_task(_dispatch({**state, **auth, **route}))
 
-        key_stmt = select(UserProviderKey).where(
-            UserProviderKey.user_id == state["user_id"],
-            UserProviderKey.provider_name == canonical_provider,
-        )
-        key_res = await session.execute(key_stmt)
-        user_key_entry = key_res.scalar_one_or_none()
 
-        user_api_key = None
-        if user_key_entry:
-            try:
-                user_api_key = decrypt(user_key_entry.encrypted_key)
-            except Exception:
-                pass
+@trace_node("prepare")
+async def prepare_node(state: GatewayState):
+    """Runs key verification, catalog resolution and cache lookup concurrently.
 
-        # We store the provider details and costs for the billing node
-        return {
-            "provider_info": {
-                "name": provider_db.name,
-                "model_name": state["model_slug"].split("/")[-1],  # e.g. "gpt-4o"
-                "api_key": user_api_key,  # Pass encrypted key context
-            },
-            "costs": {
-                "input": mapping_db.input_token_cost,
-                "output": mapping_db.output_token_cost,
-                "mapping_id": mapping_db.id,
-            },
-        }
+    With speculative dispatch the upstream call can start as soon as auth
+    and routing are done; a cache hit then cancels it.
+    """
+    speculative = None
+    try:
+        auth_failure = None
+        try:
+            async with asyncio.TaskGroup() as tg:
+                auth_task = tg.create_task(_checked_auth(state))
+                route_task = tg.create_task(route_node(state))
+                cache_task = tg.create_task(cache_lookup_node(state))
+                if speculation.enabled:
+                    speculative = await _speculate(
+                        state, auth_task, route_task, cache_task
+                    )
+        except* _AuthFailed as group:
+            auth_failure = group.exceptions[0].result
+
+        if auth_failure:
+            return {**auth_failure, "is_cached": False}
+
+        auth, cached = auth_task.result(), cache_task.result()
+        route = _apply_routing_policy(state, auth, route_task.result())
+        if not cached.get("cache_bypassed"):
+            speculation.record(
+                state["model_slug"], auth["org_id"], cached.get("is_cached")
+            )
+
+        if cached.get("is_cached"):
+            if speculative is not None:
+                speculation.abandon(speculative)
+            # Cache hits don't need a provider at all
+            return {**auth, **cached}
+
+        if route.get("error"):
+            return {**auth, **route, "is_cached": False}
+
+        if speculative is not None:
+            return {**auth, **route, **cached, "speculative_call": speculative}
+
+        await _byok_provider_info(route, auth["user_id"])
+        return {**auth, **route, **cached}
+    except BaseException:
+        # Failed or cancelled before handing the call on: nobody will use it
+        if speculative is not None:
+            discard_call(speculative)
+        raise
 
 
 @trace_node("llm")
@@ -220,6 +372,251 @@ async def call_llm_node(state: GatewayState):
     if state.get("error"):
         return state
 
+    if state.get("speculative_call") is not None:
+        # Started during the cache lookup
+        speculation.used_call()
+        return await state["speculative_call"]
+    return await _dispatch(state)
+
+
+async def _dispatch(state: GatewayState):
+    if not single_flight.enabled_for(state.get("org_id")):
+        return await _call_with_failover(state)
+
+    # Identical requests in flight share one upstream call; each caller is
+    # still billed for the usage it is served
+    key = single_flight.fingerprint(
+        state["model_slug"],
+        state["messages"],
+        {"stream": bool(state.get("stream"))},
+        state["org_id"],
+        state["user_id"],
+    )
+    return await single_flight.run(key, lambda: _call_with_failover(state))
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Timeouts, dropped connections, 429s and 5xx are worth another provider;
+    other errors are not."""
+    if isinstance(
+        error, (TimeoutError, httpx.TransportError, aiohttp.ClientConnectionError)
+    ):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+    elif isinstance(error, aiohttp.ClientResponseError):
+        status = error.status
+    else:
+        status = getattr(error, "status_code", None)
+    return isinstance(status, int) and (status in (408, 429) or status >= 500)
+
+
+async def _prepend(first, stream):
+    try:
+        if first is not None:
+            yield first
+        async for chunk in stream:
+            yield chunk
+    finally:
+        if hasattr(stream, "aclose"):
+            await stream.aclose()
+
+
+async def _attempt(state: GatewayState) -> dict:
+    """One upstream call. Streams are read up to their first chunk, so a
+    provider that fails before sending anything can still be failed over."""
+    result = await _call_upstream(state)
+    stream = result.get("stream_iterator")
+    if stream is None:
+        return result
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except BaseException:
+        if hasattr(stream, "aclose"):
+            await stream.aclose()
+        raise
+    return {**result, "stream_iterator": _prepend(first, stream)}
+
+
+class _Candidate(NamedTuple):
+    route: dict  # provider_info and costs, as _route_state builds them
+    provider: str
+    model_name: str
+    mapping_id: Optional[int]
+    byok_prefix: Optional[str]  # BYOK key still to look up; None if resolved
+
+
+def _candidate(route: dict, byok_prefix: Optional[str] = None) -> _Candidate:
+    provider_info = route["provider_info"]
+    return _Candidate(
+        route,
+        provider_info["name"],
+        provider_info["model_name"],
+        (route.get("costs") or {}).get("mapping_id"),
+        byok_prefix,
+    )
+
+
+def _candidates(state: GatewayState) -> List[_Candidate]:
+    # prepare_node already resolved the first route's BYOK key
+    candidates = [
+        _candidate(
+            {"provider_info": state["provider_info"], "costs": state.get("costs")}
+        )
+    ]
+    for route in state.get("routes", ())[1:FAILOVER_MAX_ATTEMPTS]:
+        candidates.append(_candidate(_route_state(route), route.litellm_prefix))
+    return candidates
+
+
+def _admit(candidate: _Candidate) -> bool:
+    if breakers.allow(candidate.provider, candidate.model_name):
+        return True
+    _attempts.add(1, {"provider": candidate.provider, "outcome": "skipped"})
+    return False
+
+
+def _next_admitted(pending: List[_Candidate]) -> Optional[_Candidate]:
+    while pending:
+        candidate = pending.pop(0)
+        if _admit(candidate):
+            return candidate
+    return None
+
+
+async def _try_route(state: GatewayState, candidate: _Candidate) -> dict:
+    """One attempt on an admitted candidate, recorded for its circuit
+    breaker and the selection engine. Raises on failure."""
+    provider, model_name = candidate.provider, candidate.model_name
+    route = candidate.route
+    started = time.perf_counter()
+    try:
+        if candidate.byok_prefix is not None:
+            # Later routes may be served with the user's own key for that provider
+            api_key = await get_provider_key(state["user_id"], candidate.byok_prefix)
+            route = {
+                **route,
+                "provider_info": {**route["provider_info"], "api_key": api_key},
+            }
+            started = time.perf_counter()
+        result = await asyncio.wait_for(
+            _attempt({**state, **route}), UPSTREAM_ATTEMPT_TIMEOUT
+        )
+    except UPSTREAM_ERRORS as e:
+        retryable = _is_retryable(e)
+        # Only provider-side failures count against the breaker
+        await breakers.record(
+            provider, model_name, retryable, (time.perf_counter() - started) * 1000
+        )
+        if retryable and candidate.mapping_id is not None:
+            selection.observe_outcome(candidate.mapping_id, failed=True)
+        _attempts.add(
+            1,
+            {"provider": provider, "outcome": "retried" if retryable else "failed"},
+        )
+        raise
+    except BaseException:
+        breakers.release(provider, model_name)
+        raise
+
+    attempt_ms = (time.perf_counter() - started) * 1000
+    await breakers.record(provider, model_name, False, attempt_ms)
+    if candidate.mapping_id is not None:
+        selection.observe_outcome(candidate.mapping_id, failed=False)
+        # Up to the first chunk for streams, the whole response otherwise
+        if state.get("stream"):
+            selection.observe(candidate.mapping_id, ttft_ms=attempt_ms)
+        else:
+            selection.observe(candidate.mapping_id, latency_ms=attempt_ms)
+    _attempts.add(1, {"provider": provider, "outcome": "served"})
+    return {**result, **route, "upstream_ms": attempt_ms}
+
+
+async def _hedged(
+    state: GatewayState,
+    primary: _Candidate,
+    pending: List[_Candidate],
+    delay: float,
+) -> dict:
+    """Runs `primary`; if it has not answered within `delay` seconds, sends
+    the same request to the next route too and keeps whichever answers
+    first. Raises the primary's error if both fail."""
+    first = asyncio.create_task(_try_route(state, primary))
+    tasks = {first: "lost"}
+    try:
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+        backup = _next_admitted(pending)
+        if backup is None:
+            return await first
+        if not hedging.try_spend(state.get("org_id")):
+            breakers.release(backup.provider, backup.model_name)
+            pending.insert(0, backup)
+            return await first
+
+        tasks[asyncio.create_task(_try_route(state, backup))] = "won"
+        waiting = set(tasks)
+        while waiting:
+            done, waiting = await asyncio.wait(
+                waiting, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    hedging.record(tasks[task])
+                    for other in tasks:
+                        if other is not task:
+                            discard_call(other)
+                    return task.result()
+        hedging.record("failed")
+        raise first.exception()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def _call_with_failover(state: GatewayState) -> dict:
+    """Tries the model's routes in order until one serves the request.
+
+    Each attempt has its own UPSTREAM_ATTEMPT_TIMEOUT (for streams, up to
+    the first chunk). Routes whose circuit breaker is open are skipped
+    without a call, and with hedging a slow attempt races the next route.
+    The serving route's provider_info and costs are returned, so billing
+    and logging use the mapping that was actually used.
+    """
+    hedging.deposit(state.get("org_id"))
+    pending = _candidates(state)
+
+    error: Optional[Exception] = None
+    while pending:
+        candidate = pending.pop(0)
+        if not _admit(candidate):
+            continue
+        try:
+            delay = (
+                hedging.delay(candidate.mapping_id, bool(state.get("stream")))
+                if pending
+                else None
+            )
+            if delay is None:
+                return await _try_route(state, candidate)
+            return await _hedged(state, candidate, pending, delay)
+        except UPSTREAM_ERRORS as e:
+            error = e
+            # Retries are counted per provider in gateway.upstream.attempts
+            if not _is_retryable(e):
+                break
+
+    if error is None:
+        return {"error": "LLM Provider Error: every provider's circuit breaker is open"}
+    return {"error": f"LLM Provider Error: {error}"}
+
+
+async def _call_upstream(state: GatewayState):
+    """Calls the routed provider (or the simulator). Raises on failure."""
     import os
 
     if os.getenv("HIMMI_SIMULATOR", "false").lower() == "true":
@@ -230,7 +627,7 @@ async def call_llm_node(state: GatewayState):
 
             async def mock_stream():
                 words = content.split(" ")
-                for i, word in enumerate(words):
+                for word in words:
                     yield litellm.ModelResponse(
                         id="chatcmpl-mock",
                         choices=[
@@ -257,131 +654,100 @@ async def call_llm_node(state: GatewayState):
                 "usage": {"prompt_tokens": 10, "completion_tokens": 20},
             }
 
-    try:
-        raw_provider = state["provider_info"]["name"]
-        provider_name = LITELLM_PROVIDER_MAP.get(raw_provider, raw_provider.lower())
-        model_name = state["provider_info"]["model_name"]
-        user_api_key = state["provider_info"].get("api_key")
-        stream = state.get("stream", False)
-        shadow_mode = state.get("shadow_mode", False)
-
-        # Primary Task
-        # If shadow mode is ON, we disable streaming on primary to allow comparison logic more easily for MVP
-        # Or we can support parallel streaming, but collecting shadow response is easier if both are non-stream,
-        # OR we stream primary and await shadow in background.
-        # For simplicity in Step 3, if shadow_mode=True, force stream=False.
-        if shadow_mode:
-            stream = False
-
-        # Build extra kwargs for provider-specific settings
-        extra_kwargs = {}
-        if provider_name == "ollama":
-            extra_kwargs["api_base"] = OLLAMA_BASE_URL
-        elif provider_name == "bedrock":
-            extra_kwargs["aws_region_name"] = BEDROCK_REGION
-
-        primary_task = litellm.acompletion(
-            model=f"{provider_name}/{model_name}",
-            messages=state["messages"],
-            stream=stream,
-            api_key=user_api_key,
-            **extra_kwargs,
-        )
-
-        if not shadow_mode:
-            response = await primary_task
-            if stream:
-                return {"stream_iterator": response}
-            else:
-                return {
-                    "response_content": response.choices[0].message.content,
-                    "usage": {
-                        "prompt_tokens": response.usage.prompt_tokens,
-                        "completion_tokens": response.usage.completion_tokens,
-                    },
-                }
-        else:
-            # Shadow Logic
-            # Hardcoded shadow model for MVP: Groq Llama 3 8B (fast & cheap)
-            # In real prod, select from DB configs
-            shadow_provider_model = "groq/llama3-8b-8192"
-
-            # We need a key for Groq if not provided in env. Assume env var GROQ_API_KEY is set or passed.
-            # For this demo, we assume the environment has keys or litellm handles it.
-
-            shadow_task = litellm.acompletion(
-                model=shadow_provider_model, messages=state["messages"], stream=False
-            )
-
-            # Run parallel
-            results = await asyncio.gather(
-                primary_task, shadow_task, return_exceptions=True
-            )
-            primary_res, shadow_res = results
-
-            outputs = {}
-
-            # Handle Primary
-            if isinstance(primary_res, Exception):
-                return {"error": f"Primary Provider Error: {str(primary_res)}"}
-            else:
-                outputs["response_content"] = primary_res.choices[0].message.content
-                outputs["usage"] = {
-                    "prompt_tokens": primary_res.usage.prompt_tokens,
-                    "completion_tokens": primary_res.usage.completion_tokens,
-                }
-
-            # Handle Shadow
-            if isinstance(shadow_res, Exception):
-                # Shadow failure shouldn't fail the request, just log it?
-                # or return None for shadow response
-                outputs["shadow_response"] = f"Shadow Error: {str(shadow_res)}"
-                outputs["shadow_model_slug"] = "error"
-            else:
-                outputs["shadow_response"] = shadow_res.choices[0].message.content
-                outputs["shadow_model_slug"] = shadow_provider_model
-
-            return outputs
-
-    except Exception as e:
-        return {"error": f"LLM Provider Error: {str(e)}"}
+    raw_provider = state["provider_info"]["name"]
+    provider_name = LITELLM_PROVIDER_MAP.get(raw_provider, raw_provider.lower())
+    model_name = state["provider_info"]["model_name"]
+    user_api_key = state["provider_info"].get("api_key")
+    stream = state.get("stream", False)
+
+    # Build extra kwargs for provider-specific settings
+    extra_kwargs = {}
+    if provider_name == "ollama":
+        extra_kwargs["api_base"] = OLLAMA_BASE_URL
+    elif provider_name == "bedrock":
+        extra_kwargs["aws_region_name"] = BEDROCK_REGION
+
+    # Shadows run after the response is served, see shadow_node
+    response = await litellm.acompletion(
+        model=f"{provider_name}/{model_name}",
+        messages=state["messages"],
+        stream=stream,
+        api_key=user_api_key,
+        **extra_kwargs,
+    )
+    if stream:
+        return {"stream_iterator": response}
+    return {
+        "response_content": response.choices[0].message.content,
+        "usage": {
+            "prompt_tokens": response.usage.prompt_tokens,
+            "completion_tokens": response.usage.completion_tokens,
+        },
+    }
 
 
 async def _execute_billing(org_id, api_key_id, prompt_tokens, completion_tokens, costs):
-    """Executes the atomic credit deduction in the DB."""
+    """Charges the completion to the write-behind credit ledger."""
     input_cost = (prompt_tokens / 1_000_000.0) * costs["input"]
     output_cost = (completion_tokens / 1_000_000.0) * costs["output"]
     total_cost = input_cost + output_cost
 
-    async with AsyncSession(engine, expire_on_commit=False) as session:
-        # Lock the Organization row for atomic update
-        org_stmt = (
-            select(Organization).where(Organization.id == org_id).with_for_update()
-        )
-        org_res = await session.execute(org_stmt)
-        org = org_res.scalar_one()
-
-        # Update org balance
-        org.credits -= total_cost
+    if credit_leases.enabled:
+        # The org balance was already reserved by the lease
+        await credit_leases.charge(org_id, api_key_id, total_cost)
+        return
 
-        # Update API Key stats
-        api_key_stmt = select(ApiKey).where(ApiKey.id == api_key_id).with_for_update()
-        api_key_res = await session.execute(api_key_stmt)
-        api_key = api_key_res.scalar_one()
+    # Org balance and key stats are applied in batched UPDATEs by the ledger
+    await ledger.charge(org_id, api_key_id, total_cost)
 
-        api_key.credits_consumed += total_cost
-        api_key.last_used = datetime.now(timezone.utc).replace(tzinfo=None)
 
-        await session.commit()
+def _delta_text(chunk) -> Optional[str]:
+    """Text of a single-choice chunk's delta ("" if none); None for n > 1."""
+    choices = getattr(chunk, "choices", None)
+    if not choices:
+        return ""
+    if len(choices) != 1:
+        return None
+    delta = getattr(choices[0], "delta", None)
+    return (getattr(delta, "content", None) or "") if delta is not None else ""
 
 
 async def wrap_stream_with_billing(state: GatewayState):
-    """Wraps the stream iterator to track usage and deduct credits on completion."""
+    """Wraps the stream iterator to track usage, bill and log on completion.
+
+    The completion text is assembled as it passes (up to
+    CACHE_STREAM_MAX_CHARS) and, once the stream finishes cleanly, written
+    to the response cache and handed to a sampled shadow model.
+    """
     prompt_tokens = 0
     completion_tokens = 0
+    chunk_count = 0
+    first_chunk_at = None
+    status_code = 200
+    # The leader of a coalesced call stores and shadows it for everyone
+    fresh = not (state.get("is_cached") or state.get("coalesced"))
+    cacheable = fresh and not state.get("cache_bypassed")
+    shadow = (
+        shadow_runner.pick(state["model_slug"], bool(state.get("shadow_mode")))
+        if fresh
+        else None
+    )
+    # None once the text is too long or has several choices
+    parts: Optional[List[str]] = [] if cacheable or shadow else None
+    text_len = 0
 
     try:
         async for chunk in state["stream_iterator"]:
+            if first_chunk_at is None:
+                first_chunk_at = time.time()
+            chunk_count += 1
+            if parts is not None:
+                text = _delta_text(chunk)
+                if text is None or text_len + len(text) > CACHE_STREAM_MAX_CHARS:
+                    parts = None
+                elif text:
+                    parts.append(text)
+                    text_len += len(text)
             if hasattr(chunk, "usage") and chunk.usage:
                 u = chunk.usage
                 if isinstance(u, dict):
@@ -391,7 +757,27 @@ async def wrap_stream_with_billing(state: GatewayState):
                     prompt_tokens = getattr(u, "prompt_tokens", 0)
                     completion_tokens = getattr(u, "completion_tokens", 0)
             yield chunk
+    except Exception:
+        status_code = 502  # upstream broke mid-stream
+        raise
+    except BaseException:
+        status_code = 499  # client went away (GeneratorExit / cancellation)
+        raise
     finally:
+        if status_code == 200 and parts and state.get("messages"):
+            text = "".join(parts)
+            if cacheable:
+                cache_writer.submit(
+                    state["model_slug"],
+                    state["messages"],
+                    text,
+                    org_id=state.get("org_id"),
+                )
+            if shadow:
+                shadow_runner.submit(
+                    shadow, state["messages"], state["model_slug"], text
+                )
+
         if prompt_tokens > 0 or completion_tokens > 0:
             await _execute_billing(
                 state["org_id"],
@@ -401,15 +787,81 @@ async def wrap_stream_with_billing(state: GatewayState):
                 state["costs"],
             )
 
+        # Streams are logged here, once final usage and timings are known
+        finished_at = time.time()
+        duration_ms = int((finished_at - state["start_time"]) * 1000)
+        generation_s = finished_at - first_chunk_at if first_chunk_at else 0.0
+        if fresh and status_code == 200 and generation_s > 0 and completion_tokens:
+            selection.observe(
+                state["costs"]["mapping_id"],
+                tokens_per_sec=completion_tokens / generation_s,
+            )
+        await request_log_writer.submit(
+            build_log_row(
+                {
+                    **state,
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                    },
+                    "latency_ms": duration_ms,
+                    "status_code": status_code,
+                },
+                ttft_ms=(
+                    int((first_chunk_at - state["start_time"]) * 1000)
+                    if first_chunk_at
+                    else None
+                ),
+                stream_duration_ms=duration_ms,
+                chunk_count=chunk_count,
+                tokens_per_sec=(
+                    completion_tokens / generation_s if generation_s > 0 else None
+                ),
+            )
+        )
+
+
+async def replay_cached_stream(
+    model_slug: str, text: str, chunk_chars: int = CACHE_REPLAY_CHUNK_CHARS
+):
+    """Synthesizes a completion stream from cached text, without delays."""
+    chunk_id = "chatcmpl-cache-" + hashlib.sha256(text.encode()).hexdigest()[:24]
+    pieces = [text[i : i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+    for i, piece in enumerate(pieces or [""]):
+        delta = (
+            {"role": "assistant", "content": piece} if i == 0 else {"content": piece}
+        )
+        yield litellm.ModelResponseStream(
+            id=chunk_id,
+            choices=[{"delta": delta, "finish_reason": None, "index": 0}],
+            model=model_slug,
+        )
+    yield litellm.ModelResponseStream(
+        id=chunk_id,
+        choices=[{"delta": {}, "finish_reason": "stop", "index": 0}],
+        model=model_slug,
+        usage={"prompt_tokens": 0, "completion_tokens": 0},
+    )
+
 
 @trace_node("billing")
 async def billing_node(state: GatewayState):
-    """Deducts credits using Row-Level Locking (Atomic)."""
+    """Deducts credits through the journaled billing ledger."""
     if state.get("error"):
         return state
 
     # If cached, we skip credit deduction but still return state
     if state.get("is_cached"):
+        if state.get("stream"):
+            # Replayed through the wrapper so the hit is logged like a stream
+            replay = replay_cached_stream(
+                state["model_slug"], state["response_content"]
+            )
+            return {
+                "stream_iterator": wrap_stream_with_billing(
+                    {**state, "stream_iterator": replay}
+                )
+            }
         return state
 
     if state.get("stream_iterator"):
@@ -441,118 +893,74 @@ async def log_node(state: GatewayState):
     # If using BackgroundTasks from main.py, main.py needs to read the state.
     # We simply compute and return here.
     latency = int((time.time() - state["start_time"]) * 1000)
-    return {"latency_ms": latency}
 
-
-def check_for_fallback(state: GatewayState):
-    # If the LLM node returned an error, we route to a fallback provider
-    # Basic check: if 'error' key is present and indicates LLM failure
-    if state.get("error") and "LLM Provider Error" in state["error"]:
-        # clear error to allow retry
-        # In a real graph we might want to preserve the original error trace
-        # For now, we return 'fallback' edge
-        return "fallback"
-    return "billing"  # Proceed to billing if success (or if error is not retryable)
-
-
-@trace_node("fallback_llm")
-async def fallback_llm_node(state: GatewayState):
-    """Fallback node that tries a different provider/model."""
-    # Logic to switch model/provider would go here.
-    # For MVP, let's just retry the same one or fail gracefully.
-    # In a full impl, we'd pick the next cheapest provider for the same model.
-    # Example: If OpenAI fails, try Azure OpenAI.
-
-    # For SIMPLICITY in this Step, we will just return the error but with a flag.
-    # Real fallback logic requires mapped backups in DB.
-
-    return {"error": state["error"] + " (Fallback failed too)"}
+    # Non-stream throughput for provider selection (streams report theirs
+    # from the billing wrapper). Tokens are generated after the first one,
+    # so the mapping's TTFT estimate is taken off the upstream call's time;
+    # without one the call cannot be split and is not used.
+    usage = state.get("usage") or {}
+    mapping_id = (state.get("costs") or {}).get("mapping_id")
+    if (
+        not state.get("stream")
+        and not state.get("is_cached")
+        and not state.get("coalesced")
+        and not state.get("error")
+        and usage.get("completion_tokens")
+        and mapping_id is not None
+    ):
+        ttft_ms = selection.ttft_estimate(mapping_id)
+        generation_ms = state.get("upstream_ms", 0.0) - (ttft_ms or 0.0)
+        if ttft_ms is not None and generation_ms > 0:
+            selection.observe(
+                mapping_id,
+                tokens_per_sec=usage["completion_tokens"] / (generation_ms / 1000),
+            )
+    return {"latency_ms": latency}
 
 
 # --- Graph Assembly ---
 
 
 def should_skip_llm(state: GatewayState):
-    if state["is_cached"]:
+    if state.get("is_cached"):
         return "skip"
     return "continue"
 
 
 workflow = StateGraph(GatewayState)
 workflow.add_node("init", init_node)
-workflow.add_node("cache_lookup", cache_lookup_node)
+workflow.add_node("prepare", prepare_node)
 workflow.add_node("cache_store", cache_store_node)
-workflow.add_node("auth", auth_node)
-workflow.add_node("route", route_node)
+workflow.add_node("shadow", shadow_node)
 workflow.add_node("llm", call_llm_node)
-workflow.add_node("fallback_llm", fallback_llm_node)
 workflow.add_node("billing", billing_node)
 workflow.add_node("log", log_node)
 
 workflow.set_entry_point("init")
 
-
-# Conditional Edge: If cached, go straight to billing (skipping auth/llm cost), else continue
-# Note: We technically need auth to know WHO asked, but for "cache_lookup" we might want to skip cost but still validate user?
-# The user's prompt suggested: "skip" -> "billing", "continue" -> "auth".
-# This implies if cached, we skip Auth logic regarding CREDITS? But we still need user_id/org_id for logging?
-# Actually billing_node needs org_id/api_key_id. If we skip auth_node, we don't have those in state!
-# Wait, `init` -> `auth` was previous flow.
-# If we do `init` -> `cache_lookup` -> `auth` -> (if cached: skip route/llm -> billing? or skip billing too?)
-# If cached = FREE, we still need `auth` to get IDs for logging/audit.
-# So correct flow: `init` -> `auth` -> `cache_lookup` -> (if cached: billing, else: route -> llm -> billing)
-# BUT the user prompted: `workflow.set_entry_point("init")`, `workflow.add_edge("init", "cache_lookup")`
-# And `workflow.add_conditional_edges("cache_lookup", ..., {"skip": "billing", "continue": "auth"})`
-# This implies `cache_lookup` happens BEFORE auth.
-# If so, `billing_node` will FAIL because `org_id` is missing.
-# UNLESS `billing_node` checks for `is_cached` and returns early safely without needing IDs?
-# But `log_node` needs IDs for the DB log.
-# So `auth` is CRITICAL for IDs.
-# I will adjust the graph: `init` -> `auth` -> `cache_lookup`.
-# If cached: -> `billing` (which skips cost deduction if cached) -> `cache_store` -> `log`.
-# If not cached: -> `route` -> `llm` -> `billing` -> `cache_store` -> `log`.
-
-# Wait, `cache_lookup` needs embedding. That's fine.
-# But `log_node` relies on `state['user_id']`. If we skip `auth`, `user_id` is null.
-# So we MUST run `auth`.
-# I will implement: `init` -> `auth` -> `cache_lookup`.
-# If cached -> skip to billing (effectively 0 cost).
-# If not cached -> route.
-
-# Adjusting User's suggested graph flow for correctness:
-# User said: `workflow.add_edge("init", "cache_lookup")` and conditional `skip` -> `billing`, `continue` -> `auth`.
-# This is physically impossible for logging/billing/metrics if `auth` (which yields user_id) is skipped.
-# UNLESS the user implies public cache access? No, API Key is needed.
-# I will keep `auth` FIRST.
-# `init` -> `auth` -> `cache_lookup`.
-# Conditional on `cache_lookup`:
-#  - Is Cached? -> `billing` (skips cost) -> `cache_store` (noop/update) -> `log`.
-#  - Not Cached? -> `route` -> `llm` -> `fallback` logic -> `billing` -> `cache_store` -> `log`.
-
-workflow.add_edge("init", "auth")
-workflow.add_edge("auth", "cache_lookup")  # Auth first, then Cache Check
+# `prepare` fans out auth, route and cache_lookup and joins them:
+#  - Is Cached? -> `billing` (skips cost) -> `cache_store` (noop) -> `shadow` (noop) -> `log`.
+#  - Not Cached? -> `llm` (with failover) -> `billing` -> `cache_store` -> `shadow` -> `log`.
+# Auth still gates everything: a failed auth cancels the other branches, and
+# its error flows through `llm`/`billing` untouched so IDs stay consistent.
+workflow.add_edge("init", "prepare")
 
 workflow.add_conditional_edges(
-    "cache_lookup",
+    "prepare",
     should_skip_llm,
     {
         "skip": "billing",  # If cached, jump to billing (which will handle 0 cost)
-        "continue": "route",  # If not cached, proceed to routing
+        "continue": "llm",  # If not cached, the route is already resolved
     },
 )
 
-workflow.add_edge("route", "llm")
-
-# Conditional Edge for Resilience (LLM -> Fallback or Billing)
-workflow.add_conditional_edges(
-    "llm", check_for_fallback, {"fallback": "fallback_llm", "billing": "billing"}
-)
-
-workflow.add_edge("fallback_llm", "billing")
+# Provider failover happens inside `llm`, across the model's routes
+workflow.add_edge("llm", "billing")
 
 # After billing, we try to store in cache (if it wasn't a cache hit)
 workflow.add_edge("billing", "cache_store")
-workflow.add_edge("cache_store", "log")
+workflow.add_edge("cache_store", "shadow")
+workflow.add_edge("shadow", "log")
 workflow.add_edge("log", END)
 
 gateway_app = workflow.compile()
@@ -0,0 +1,249 @@
+import math
+import os
+import random
+from collections import deque
+from collections.abc import Sequence
+from typing import NamedTuple
+
+from shared.instrumentation import meter
+
+from inference_gateway.catalog import Route
+
+# Weight of the newest observation in the moving averages
+SELECTION_EWMA_ALPHA = float(os.getenv("SELECTION_EWMA_ALPHA", "0.1"))
+# Recent TTFT samples kept per mapping for percentiles
+SELECTION_WINDOW = int(os.getenv("SELECTION_WINDOW", "100"))
+# Mappings failing more often than this go behind the healthy ones
+SELECTION_MAX_ERROR_RATE = float(os.getenv("SELECTION_MAX_ERROR_RATE", "0.5"))
+# Share of policy-routed requests sent to a random eligible mapping, so the
+# estimates of mappings a policy never picks stay current
+SELECTION_EXPLORE_RATE = float(os.getenv("SELECTION_EXPLORE_RATE", "0.02"))
+
+POLICIES = ("default", "cheapest", "fastest", "throughput", "balanced")
+
+# Error samples needed before a mapping can be judged unhealthy
+_MIN_ERROR_SAMPLES = 5
+
+_decisions = meter.create_counter(
+    "gateway.selection.decisions", description="Route orderings by routing policy"
+)
+
+
+class Policy(NamedTuple):
+    """How to order a model's routes for one request.
+
+    `max_cost` (USD per 1M input + output tokens) drops pricier routes for
+    any policy; `latency_target_ms` is the p90 "balanced" aims for: TTFT
+    for streams, response time for non-stream requests.
+    """
+
+    name: str = "default"
+    max_cost: float | None = None
+    latency_target_ms: float | None = None
+
+    @classmethod
+    def parse(cls, spec: dict | None) -> "Policy":
+        if not spec:
+            return cls()
+        name = spec.get("policy") or "default"
+        if name not in POLICIES:
+            raise ValueError(f"Unknown routing policy {name!r}")
+        return cls(name, spec.get("max_cost"), spec.get("latency_target_ms"))
+
+
+def price(route: Route) -> float:
+    return route.input_cost + route.output_cost
+
+
+class _Timing:
+    """Moving average plus a window of recent samples, for percentiles."""
+
+    __slots__ = ("ewma", "samples")
+
+    def __init__(self, window: int):
+        self.ewma: float | None = None
+        self.samples: deque = deque(maxlen=window)
+
+    def add(self, sample: float, alpha: float):
+        self.ewma = _ewma(self.ewma, sample, alpha)
+        self.samples.append(sample)
+
+    def percentile(self, q: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class _Estimate:
+    __slots__ = ("error_rate", "errors_seen", "latency", "tokens_per_sec", "ttft")
+
+    def __init__(self, window: int):
+        self.ttft = _Timing(window)  # streams: time to the first chunk
+        self.latency = _Timing(window)  # non-stream: time to the whole response
+        self.tokens_per_sec: float | None = None
+        self.error_rate = 0.0
+        self.errors_seen = 0
+
+    def timing(self, stream: bool) -> _Timing:
+        return self.ttft if stream else self.latency
+
+
+def _ewma(current: float | None, sample: float, alpha: float) -> float:
+    return sample if current is None else current + alpha * (sample - current)
+
+
+class SelectionEngine:
+    """Orders a model's routes by live performance and cost.
+
+    Keeps, per ModelProviderMapping, moving averages and recent samples of
+    time to first token (from streams) and of response time (from
+    non-stream calls), plus tokens/sec and error rate. Requests are ranked
+    on the timing that matches how they are served. Mappings without data
+    sort first under the latency and throughput policies so they get
+    measured.
+    """
+
+    def __init__(
+        self,
+        alpha: float = SELECTION_EWMA_ALPHA,
+        window: int = SELECTION_WINDOW,
+        max_error_rate: float = SELECTION_MAX_ERROR_RATE,
+        explore_rate: float = SELECTION_EXPLORE_RATE,
+    ):
+        self.alpha = alpha
+        self.window = window
+        self.max_error_rate = max_error_rate
+        self.explore_rate = explore_rate
+        # mapping_id -> _Estimate; bounded by the catalog
+        self._estimates: dict[int, _Estimate] = {}
+
+        self.decisions: dict[str, int] = {}
+        self.explored = 0
+
+    # --- Observations ---
+
+    def _get(self, mapping_id: int) -> _Estimate:
+        estimate = self._estimates.get(mapping_id)
+        if estimate is None:
+            estimate = self._estimates[mapping_id] = _Estimate(self.window)
+        return estimate
+
+    def observe(
+        self,
+        mapping_id: int,
+        ttft_ms: float | None = None,
+        latency_ms: float | None = None,
+        tokens_per_sec: float | None = None,
+    ):
+        """`ttft_ms` is a stream's first chunk; `latency_ms` a whole
+        non-stream response. The two are never mixed."""
+        estimate = self._get(mapping_id)
+        if ttft_ms is not None:
+            estimate.ttft.add(ttft_ms, self.alpha)
+        if latency_ms is not None:
+            estimate.latency.add(latency_ms, self.alpha)
+        if tokens_per_sec is not None and tokens_per_sec > 0:
+            estimate.tokens_per_sec = _ewma(
+                estimate.tokens_per_sec, tokens_per_sec, self.alpha
+            )
+
+    def observe_outcome(self, mapping_id: int, failed: bool):
+        estimate = self._get(mapping_id)
+        estimate.errors_seen += 1
+        # Plain average until there are enough samples, then exponential
+        alpha = max(self.alpha, 1.0 / estimate.errors_seen)
+        estimate.error_rate += alpha * (float(failed) - estimate.error_rate)
+
+    def ttft_estimate(self, mapping_id: int) -> float | None:
+        estimate = self._estimates.get(mapping_id)
+        return estimate.ttft.ewma if estimate is not None else None
+
+    def samples(self, mapping_id: int, stream: bool) -> int:
+        """Recent TTFT (stream) or response time (non-stream) samples."""
+        estimate = self._estimates.get(mapping_id)
+        return len(estimate.timing(stream).samples) if estimate is not None else 0
+
+    def percentile(self, mapping_id: int, q: float, stream: bool) -> float | None:
+        """TTFT (stream) or response time (non-stream) percentile, in ms."""
+        estimate = self._estimates.get(mapping_id)
+        return estimate.timing(stream).percentile(q) if estimate is not None else None
+
+    # --- Ordering ---
+
+    def _unhealthy(self, route: Route) -> bool:
+        estimate = self._estimates.get(route.mapping_id)
+        return (
+            estimate is not None
+            and estimate.errors_seen >= _MIN_ERROR_SAMPLES
+            and estimate.error_rate > self.max_error_rate
+        )
+
+    def _sort_key(self, route: Route, policy: Policy, stream: bool):
+        estimate = self._estimates.get(route.mapping_id)
+        if policy.name == "cheapest":
+            return price(route)
+        if policy.name == "fastest":
+            timing = estimate.timing(stream).ewma if estimate is not None else None
+            return timing if timing is not None else 0.0
+        if policy.name == "throughput":
+            if estimate is None or estimate.tokens_per_sec is None:
+                return -math.inf
+            return -estimate.tokens_per_sec
+        if policy.name == "balanced":
+            # Cheapest route that meets the latency target, else the fastest
+            p90 = self.percentile(route.mapping_id, 0.9, stream)
+            if (
+                policy.latency_target_ms is None
+                or p90 is None
+                or p90 <= policy.latency_target_ms
+            ):
+                return (0, price(route))
+            return (1, p90)
+        return 0  # default: catalog order
+
+    def order(
+        self, routes: Sequence[Route], policy: Policy, stream: bool = True
+    ) -> tuple[Route, ...]:
+        """`routes` in the order to try them (empty if none fits the ceiling).
+
+        Latency policies rank streams by TTFT and non-stream requests by
+        response time.
+        """
+        self.decisions[policy.name] = self.decisions.get(policy.name, 0) + 1
+        _decisions.add(1, {"policy": policy.name})
+
+        if policy.max_cost is not None:
+            routes = [r for r in routes if price(r) <= policy.max_cost]
+        ordered = sorted(
+            routes,
+            key=lambda r: (self._unhealthy(r), self._sort_key(r, policy, stream)),
+        )
+        if (
+            policy.name != "default"
+            and len(ordered) > 1
+            and random.random() < self.explore_rate
+        ):
+            self.explored += 1
+            ordered.insert(0, ordered.pop(random.randrange(1, len(ordered))))
+        return tuple(ordered)
+
+    def stats(self) -> dict:
+        return {
+            "decisions": dict(self.decisions),
+            "explored": self.explored,
+            "mappings": {
+                mapping_id: {
+                    "ttft_ms": e.ttft.ewma,
+                    "ttft_p90_ms": e.ttft.percentile(0.9),
+                    "latency_ms": e.latency.ewma,
+                    "latency_p90_ms": e.latency.percentile(0.9),
+                    "tokens_per_sec": e.tokens_per_sec,
+                    "error_rate": e.error_rate,
+                }
+                for mapping_id, e in sorted(self._estimates.items())
+            },
+        }
+
+
+selection = SelectionEngine()
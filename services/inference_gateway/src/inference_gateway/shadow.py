@@ -0,0 +1,233 @@
+import asyncio
+import os
+import random
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import NamedTuple
+
+import litellm
+import openai
+from database.models import EvaluationPair, ShadowTarget
+from database.session import DB_ERRORS, engine
+from opentelemetry.metrics import Observation
+from shared.instrumentation import meter
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+SHADOW_WORKERS = int(os.getenv("SHADOW_WORKERS", "4"))
+# Shadow calls waiting for a worker; more than this and new ones are dropped
+SHADOW_QUEUE_SIZE = int(os.getenv("SHADOW_QUEUE_SIZE", "200"))
+SHADOW_TIMEOUT = float(os.getenv("SHADOW_TIMEOUT", "60"))
+SHADOW_BATCH_SIZE = int(os.getenv("SHADOW_BATCH_SIZE", "50"))
+SHADOW_FLUSH_MS = float(os.getenv("SHADOW_FLUSH_MS", "2000"))
+
+_calls = meter.create_counter(
+    "gateway.shadow.calls", description="Shadow calls by outcome"
+)
+
+
+class Shadow(NamedTuple):
+    model: str  # LiteLLM model string
+    sample_rate: float
+
+
+class _Job(NamedTuple):
+    shadow: Shadow
+    messages: list[dict]
+    primary_model: str
+    primary_response: str
+
+
+class ShadowRunner:
+    """Runs shadow completions off the response path.
+
+    Once a primary completion has been served, `submit` queues the same
+    conversation for its shadow model; `workers` tasks call the shadows and
+    the resulting EvaluationPairs are inserted in batches of `batch_size`
+    (or every `flush_ms`). When the queue is full the shadow is dropped:
+    shadows are samples, and must never compete with user traffic.
+    """
+
+    def __init__(
+        self,
+        workers: int = SHADOW_WORKERS,
+        maxsize: int = SHADOW_QUEUE_SIZE,
+        timeout: float = SHADOW_TIMEOUT,
+        batch_size: int = SHADOW_BATCH_SIZE,
+        flush_ms: float = SHADOW_FLUSH_MS,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000.0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._tasks: list[asyncio.Task] = []
+        self._rows: list[dict] = []
+        # primary model slug (or "*") -> shadows, swapped in by refresh()
+        self.targets: Mapping[str, tuple[Shadow, ...]] = MappingProxyType({})
+
+        self.completed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.written = 0
+
+        meter.create_observable_gauge(
+            "gateway.shadow.queue_depth",
+            callbacks=[lambda _options: [Observation(self._queue.qsize())]],
+            unit="{call}",
+        )
+
+    # --- Targets ---
+
+    async def refresh(self):
+        """Reloads the enabled ShadowTarget rows."""
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            statement = select(ShadowTarget).where(ShadowTarget.enabled)
+            rows = (await session.execute(statement)).scalars().all()
+        targets: dict = {}
+        for row in rows:
+            targets.setdefault(row.model_slug, []).append(
+                Shadow(row.shadow_model, row.sample_rate)
+            )
+        self.targets = MappingProxyType({k: tuple(v) for k, v in targets.items()})
+
+    async def refresh_periodically(self, interval: float):
+        while True:
+            await self.handle_invalidation()
+            await asyncio.sleep(interval)
+
+    async def handle_invalidation(self, _key: str | None = None):
+        try:
+            await self.refresh()
+        except DB_ERRORS as e:
+            print(f"Shadow target refresh failed, keeping the previous ones: {e}")
+
+    def has_target(self, model_slug: str) -> bool:
+        """Whether `model_slug` has a shadow target other than itself."""
+        return any(
+            shadow.model != model_slug
+            for shadow in self.targets.get(model_slug, ()) + self.targets.get("*", ())
+        )
+
+    def pick(self, model_slug: str, forced: bool = False) -> Shadow | None:
+        """The shadow to run for one request, if it is sampled.
+
+        Requests sent with `shadow_mode` are always shadowed when a target
+        exists; the rest are sampled at the target's rate.
+        """
+        for shadow in self.targets.get(model_slug, ()) + self.targets.get("*", ()):
+            if shadow.model != model_slug and (
+                forced or random.random() < shadow.sample_rate
+            ):
+                return shadow
+        return None
+
+    # --- Execution ---
+
+    def start(self):
+        self._tasks = [t for t in self._tasks if not t.done()]
+        if not self._tasks:
+            self._tasks.append(asyncio.create_task(self._flush_periodically()))
+            for _ in range(self.workers):
+                self._tasks.append(asyncio.create_task(self._run()))
+
+    def submit(
+        self,
+        shadow: Shadow,
+        messages: list[dict],
+        primary_model: str,
+        primary_response: str,
+    ) -> bool:
+        """Queues a shadow call. Returns False if it was dropped."""
+        self.start()
+        try:
+            self._queue.put_nowait(
+                _Job(shadow, messages, primary_model, primary_response)
+            )
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            _calls.add(1, {"outcome": "dropped"})
+            return False
+
+    async def _run(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._shadow(job)
+            finally:
+                self._queue.task_done()
+
+    async def _shadow(self, job: _Job):
+        try:
+            response = await asyncio.wait_for(
+                litellm.acompletion(
+                    model=job.shadow.model, messages=job.messages, stream=False
+                ),
+                self.timeout,
+            )
+            shadow_response = response.choices[0].message.content or ""
+        except (openai.OpenAIError, TimeoutError) as e:
+            self.failed += 1
+            _calls.add(1, {"outcome": "failed"})
+            print(f"Shadow call to {job.shadow.model} failed: {e}")
+            return
+
+        self.completed += 1
+        _calls.add(1, {"outcome": "completed"})
+        pair = EvaluationPair(
+            prompt=str(job.messages[-1].get("content", "")),
+            primary_model=job.primary_model,
+            primary_response=job.primary_response,
+            shadow_model=job.shadow.model,
+            shadow_response=shadow_response,
+        )
+        self._rows.append(pair.model_dump(exclude={"id"}))
+        if len(self._rows) >= self.batch_size:
+            await self.flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """Inserts the collected EvaluationPairs in one multi-row INSERT."""
+        batch, self._rows = self._rows, []
+        if not batch:
+            return
+        try:
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                await session.execute(insert(EvaluationPair).values(batch))
+                await session.commit()
+        except DB_ERRORS as e:
+            print(f"EvaluationPair batch insert failed ({len(batch)} rows): {e}")
+            return
+        self.written += len(batch)
+
+    async def stop(self, timeout: float = 10.0):
+        """Lets queued shadows finish (up to `timeout`) and writes their pairs."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except TimeoutError:
+            print(f"Shadow shutdown timed out, {self._queue.qsize()} calls skipped")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "targets": sum(len(t) for t in self.targets.values()),
+            "queued": self._queue.qsize(),
+            "completed": self.completed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "written": self.written,
+        }
+
+
+shadow_runner = ShadowRunner()
@@ -0,0 +1,241 @@
+import asyncio
+import os
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Any
+
+import openai
+from shared.cache import cache_key
+from shared.instrumentation import meter
+
+# Orgs whose identical in-flight requests share one upstream call:
+# empty (off), "*" (every org) or a comma-separated list of org ids
+SINGLE_FLIGHT_ORGS = os.getenv("SINGLE_FLIGHT_ORGS", "").strip()
+
+_requests = meter.create_counter(
+    "gateway.single_flight.requests",
+    description="Upstream calls by single-flight role (leader or follower)",
+)
+
+
+def _copy(chunk: Any) -> Any:
+    # Each subscriber gets its own chunk: the SSE coalescer edits deltas in place
+    if hasattr(chunk, "model_copy"):
+        return chunk.model_copy(deep=True)
+    return chunk
+
+
+class Broadcast:
+    """One upstream stream fanned out to any number of subscribers.
+
+    A pump task reads the upstream into a buffer, so a slow or vanished
+    subscriber never holds up the others, and a late subscriber replays
+    the chunks it missed. The upstream is closed once it finishes or the
+    last subscriber leaves.
+    """
+
+    def __init__(self, upstream: AsyncIterator, on_close: Callable[[], None]):
+        self._upstream = upstream
+        self._on_close = on_close
+        self._chunks: list[Any] = []
+        self._changed = asyncio.Event()
+        self._error: BaseException | None = None
+        self._done = False
+        self.subscribers = 0
+        self._pump = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            async for chunk in self._upstream:
+                self._chunks.append(chunk)
+                self._notify()
+        except openai.OpenAIError as e:
+            self._error = e
+        except BaseException:
+            # Abandoned or broken: subscribers must not see a clean end
+            self._error = ConnectionError("Shared upstream stream was abandoned")
+            raise
+        finally:
+            self._done = True
+            self._notify()
+            self._on_close()
+            if hasattr(self._upstream, "aclose"):
+                await self._upstream.aclose()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def subscribe(self) -> "_Subscription":
+        # Counted now, not on first iteration, so the pump keeps running for
+        # a subscriber whose response has not started yet
+        self.subscribers += 1
+        return _Subscription(self)
+
+    def _unsubscribe(self):
+        self.subscribers -= 1
+        self.stop_if_unused()
+
+    def stop_if_unused(self):
+        """Stops reading the upstream once no subscriber is left."""
+        if self.subscribers == 0 and not self._done:
+            self._pump.cancel()
+
+
+class _Subscription:
+    """One subscriber's view of a `Broadcast`.
+
+    Not an async generator: closing one that never started would skip its
+    cleanup, and a discarded speculative call is closed exactly like that.
+    """
+
+    def __init__(self, broadcast: Broadcast):
+        self._broadcast = broadcast
+        self._position = 0
+        self._active = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Any:
+        broadcast = self._broadcast
+        while self._active:
+            if self._position < len(broadcast._chunks):
+                self._position += 1
+                return _copy(broadcast._chunks[self._position - 1])
+            if broadcast._done:
+                await self.aclose()
+                if broadcast._error is not None:
+                    raise broadcast._error
+                break
+            try:
+                await broadcast._changed.wait()
+            except BaseException:
+                await self.aclose()
+                raise
+        raise StopAsyncIteration
+
+    async def aclose(self):
+        if self._active:
+            self._active = False
+            self._broadcast._unsubscribe()
+
+
+class SingleFlight:
+    """Coalesces identical upstream calls that are in flight at the same time.
+
+    The first caller for a fingerprint starts the call as a task and every
+    caller, the first included, awaits it, so a leader whose client goes
+    away does not cancel the call for its followers. Only when every caller
+    has gone is the call cancelled. Non-streaming callers share the result;
+    streaming callers each get a subscription to a `Broadcast` of the
+    chunks. A fingerprint is released when its call returns or, for
+    streams, when the stream ends.
+    """
+
+    def __init__(self, orgs: str = SINGLE_FLIGHT_ORGS):
+        self.all_orgs = orgs == "*"
+        self.orgs = (
+            set()
+            if self.all_orgs
+            else {int(org) for org in orgs.split(",") if org.strip()}
+        )
+        self._flights: dict[str, asyncio.Task] = {}
+        # flight -> callers still awaiting it
+        self._waiting: dict[asyncio.Task, int] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def enabled_for(self, org_id: int | None) -> bool:
+        return org_id is not None and (self.all_orgs or org_id in self.orgs)
+
+    @staticmethod
+    def fingerprint(
+        model: str, messages: list[dict], params: dict, org_id: int, user_id: int
+    ) -> str:
+        # Per org and user, even with a shared response cache: the leader's
+        # upstream call may use its user's own (BYOK) provider key, which
+        # another user's request must never be served with
+        return cache_key(
+            model, messages, {**params, "org": org_id, "user": user_id}, org_id
+        )
+
+    async def run(self, key: str, call: Callable[[], Awaitable[dict]]) -> dict:
+        """Returns `call()`'s result, sharing it with identical callers.
+
+        Followers' results carry `coalesced=True`.
+        """
+        task = self._flights.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.followers += 1
+            _requests.add(1, {"role": "follower"})
+        else:
+            self.leaders += 1
+            _requests.add(1, {"role": "leader"})
+            task = asyncio.create_task(self._lead(key, call))
+            self._flights[key] = task
+
+        self._waiting[task] = self._waiting.get(task, 0) + 1
+        try:
+            result = await asyncio.shield(task)
+        except BaseException:
+            if self._leave(task) == 0:
+                self._abandon(key, task)
+            raise
+        self._leave(task)
+        broadcast = result.get("stream_iterator")
+        if isinstance(broadcast, Broadcast):
+            result = {**result, "stream_iterator": broadcast.subscribe()}
+        return {**result, "coalesced": True} if coalesced else result
+
+    async def _lead(self, key: str, call: Callable[[], Awaitable[dict]]) -> dict:
+        streaming = False
+        try:
+            result = await call()
+            upstream = result.get("stream_iterator")
+            if upstream is None:
+                return result
+            streaming = True
+            task = asyncio.current_task()
+            return {
+                **result,
+                "stream_iterator": Broadcast(
+                    upstream, lambda: self._release(key, task)
+                ),
+            }
+        finally:
+            if not streaming:
+                self._release(key, asyncio.current_task())
+
+    def _abandon(self, key: str, task: asyncio.Task):
+        # Every caller left without using the call (e.g. a discarded
+        # speculative call): stop it upstream. Released first, so a new
+        # caller starts afresh instead of joining a cancelled flight
+        self._release(key, task)
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled() and task.exception() is None:
+            broadcast = task.result().get("stream_iterator")
+            if isinstance(broadcast, Broadcast):
+                broadcast.stop_if_unused()
+
+    def _leave(self, task: asyncio.Task) -> int:
+        waiting = self._waiting.pop(task) - 1
+        if waiting:
+            self._waiting[task] = waiting
+        return waiting
+
+    def _release(self, key: str, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        return {
+            "orgs": "*" if self.all_orgs else sorted(self.orgs),
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,121 @@
+import asyncio
+import os
+
+from shared.instrumentation import meter
+from shared.lru import TTLCache
+
+# Start the upstream call while the semantic cache lookup is still running,
+# for (model, org) pairs whose cache rarely hits
+SPECULATIVE_DISPATCH = os.getenv("SPECULATIVE_DISPATCH", "false").lower() == "true"
+SPECULATIVE_MAX_HIT_RATE = float(os.getenv("SPECULATIVE_MAX_HIT_RATE", "0.1"))
+# Lookups observed before a pair may speculate
+SPECULATIVE_MIN_SAMPLES = int(os.getenv("SPECULATIVE_MIN_SAMPLES", "20"))
+# Roughly how many recent lookups the hit rate reflects
+SPECULATIVE_WINDOW = int(os.getenv("SPECULATIVE_WINDOW", "200"))
+
+_outcomes = meter.create_counter(
+    "gateway.speculation.calls",
+    description="Speculative upstream calls by outcome (used or wasted)",
+)
+
+
+# Streams being closed in the background, kept referenced until they finish
+_closing: set = set()
+
+
+def discard_call(call: asyncio.Task):
+    """Cancels an upstream call nobody will use, or, if it already
+    connected, closes its stream so the provider stops generating."""
+    if not call.done():
+        call.cancel()
+        return
+    if call.cancelled() or call.exception() is not None:
+        return
+    stream = call.result().get("stream_iterator")
+    if hasattr(stream, "aclose"):
+        task = asyncio.ensure_future(stream.aclose())
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+
+
+class _Rate:
+    __slots__ = ("hit_rate", "samples")
+
+    def __init__(self):
+        self.hit_rate = 0.0
+        self.samples = 0
+
+
+class SpeculationPolicy:
+    """Decides per (model, org) whether to race the upstream call against
+    the cache lookup, from a moving average of that pair's cache hit rate.
+
+    A pair speculates once `min_samples` lookups have been seen and its
+    hit rate is below `max_hit_rate`; a speculative call is wasted (and
+    cancelled) whenever the cache hits, so the threshold bounds the waste.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = SPECULATIVE_DISPATCH,
+        max_hit_rate: float = SPECULATIVE_MAX_HIT_RATE,
+        min_samples: int = SPECULATIVE_MIN_SAMPLES,
+        window: int = SPECULATIVE_WINDOW,
+        maxsize: int = 10000,
+    ):
+        self.enabled = enabled
+        self.max_hit_rate = max_hit_rate
+        self.min_samples = min_samples
+        self.alpha = 1.0 / max(window, 1)
+        # Idle pairs age out and start over
+        self._rates = TTLCache(maxsize=maxsize, ttl=3600)
+
+        self.used = 0
+        self.wasted = 0
+
+    def record(self, model: str, org_id: int | None, hit: bool):
+        key = (model, org_id)
+        rate = self._rates.get(key)
+        if rate is None:
+            rate = _Rate()
+        rate.samples += 1
+        # Plain average until the window fills, then exponential
+        alpha = max(self.alpha, 1.0 / rate.samples)
+        rate.hit_rate += alpha * (float(hit) - rate.hit_rate)
+        self._rates.set(key, rate)
+
+    def should_speculate(self, model: str, org_id: int | None) -> bool:
+        if not self.enabled:
+            return False
+        rate = self._rates.get((model, org_id))
+        return (
+            rate is not None
+            and rate.samples >= self.min_samples
+            and rate.hit_rate < self.max_hit_rate
+        )
+
+    def hit_rate(self, model: str, org_id: int | None) -> float | None:
+        rate = self._rates.get((model, org_id))
+        return rate.hit_rate if rate is not None else None
+
+    def used_call(self):
+        self.used += 1
+        _outcomes.add(1, {"outcome": "used"})
+
+    def abandon(self, call: asyncio.Task):
+        """Cancels a speculative call made redundant by a cache hit."""
+        self.wasted += 1
+        _outcomes.add(1, {"outcome": "wasted"})
+        discard_call(call)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_hit_rate": self.max_hit_rate,
+            "tracked": len(self._rates),
+            "used": self.used,
+            "wasted": self.wasted,
+        }
+
+
+speculation = SpeculationPolicy()
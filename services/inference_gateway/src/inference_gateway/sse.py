@@ -0,0 +1,283 @@
+import asyncio
+import json
+import os
+import time
+from collections.abc import AsyncIterator, Callable
+from typing import Any
+
+import openai
+import orjson
+from shared.instrumentation import meter
+
+# "json": the original model_dump() + json.dumps path (default, byte-for-byte
+# what clients have always received); "fast": direct-to-bytes encoding, whose
+# compact separators change the bytes but not the parsed events
+SSE_ENCODER = os.getenv("SSE_ENCODER", "json").lower()
+if SSE_ENCODER not in ("fast", "json"):
+    print(f"Warning: unknown SSE_ENCODER={SSE_ENCODER!r}, using 'json'.")
+
+# Opt-in delta coalescing (per request via the X-Himmi-Coalesce header)
+SSE_COALESCE_WINDOW_MS = float(os.getenv("SSE_COALESCE_WINDOW_MS", "15"))
+SSE_COALESCE_MAX_CHARS = int(os.getenv("SSE_COALESCE_MAX_CHARS", "512"))
+
+DONE_EVENT = b"data: [DONE]\n\n"
+
+_coalesced = meter.create_counter(
+    "gateway.sse.coalesced_chunks",
+    description="Upstream chunks merged into a previous frame by the coalescer",
+)
+
+Encoder = Callable[[Any], bytes]
+
+
+def _as_dict(chunk: Any) -> Any:
+    if hasattr(chunk, "model_dump"):
+        return chunk.model_dump()
+    if hasattr(chunk, "dict"):
+        return chunk.dict()
+    return chunk
+
+
+def encode_json(chunk: Any) -> bytes:
+    """Original encoder: full nested dict, then a str, per chunk."""
+    return f"data: {json.dumps(_as_dict(chunk), default=str)}\n\n".encode()
+
+
+def _orjson_event(data: Any) -> bytes:
+    return (
+        b"data: "
+        + orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS)
+        + b"\n\n"
+    )
+
+
+_TEMPLATE_SUFFIX = b'},"finish_reason":null}]}\n\n'
+
+
+def _fields(obj: Any) -> dict | None:
+    """Field values of a pydantic object, read without attribute lookups.
+
+    Missing attributes on litellm's types go through pydantic's __getattr__
+    and an AttributeError, which costs more than encoding the chunk.
+    """
+    values = getattr(obj, "__dict__", None)
+    if values is None:
+        return None
+    extra = getattr(obj, "__pydantic_extra__", None)
+    return {**values, **extra} if extra else values
+
+
+def _plain_content(chunk: Any) -> tuple[dict, Any, str] | None:
+    """(chunk fields, choice index, text) if `chunk` fits the template."""
+    fields = _fields(chunk)
+    if fields is None or fields.get("usage") is not None:
+        return None
+    choices = fields.get("choices")
+    if not choices or len(choices) != 1:
+        return None
+    choice = _fields(choices[0])
+    if (
+        choice is None
+        or choice.get("finish_reason") is not None
+        or choice.get("logprobs") is not None
+    ):
+        return None
+    delta = _fields(choice.get("delta"))
+    if delta is None:
+        return None
+    content = delta.get("content")
+    if not isinstance(content, str):
+        return None
+    # role, tool_calls, reasoning_content, ... all need the full encoder
+    if any(v is not None for k, v in delta.items() if k != "content"):
+        return None
+    return fields, choice.get("index", 0), content
+
+
+def _stream_key(fields: dict, index: Any) -> tuple:
+    """What a plain delta's frame shares with the rest of its stream."""
+    return (
+        fields.get("id"),
+        fields.get("created"),
+        fields.get("model"),
+        fields.get("system_fingerprint"),
+        index,
+    )
+
+
+class FastEncoder:
+    """Per-stream encoder that writes chunks straight to bytes.
+
+    Plain content deltas (nearly every chunk of a completion) reuse a byte
+    prefix built once per stream from id/created/model; only the content
+    string is encoded per token. Anything else (role, tool calls, finish
+    reason, usage, dicts) goes through orjson without the str round trip.
+    """
+
+    def __init__(self):
+        self._key: tuple | None = None
+        self._prefix = b""
+
+    def __call__(self, chunk: Any) -> bytes:
+        plain = _plain_content(chunk)
+        if plain is None:
+            return _orjson_event(_as_dict(chunk))
+
+        fields, index, content = plain
+        key = _stream_key(fields, index)
+        if key != self._key:
+            self._key = key
+            self._prefix = self._build_prefix(*key)
+        return self._prefix + orjson.dumps(content) + _TEMPLATE_SUFFIX
+
+    @staticmethod
+    def _build_prefix(chunk_id, created, model, fingerprint, index) -> bytes:
+        prefix = (
+            b'data: {"id":'
+            + orjson.dumps(chunk_id)
+            + b',"object":"chat.completion.chunk","created":'
+            + orjson.dumps(created)
+            + b',"model":'
+            + orjson.dumps(model)
+        )
+        if fingerprint is not None:
+            prefix += b',"system_fingerprint":' + orjson.dumps(fingerprint)
+        return (
+            prefix
+            + b',"choices":[{"index":'
+            + orjson.dumps(index)
+            + b',"delta":{"content":'
+        )
+
+
+def new_encoder(mode: str = SSE_ENCODER) -> Encoder:
+    """Returns a chunk encoder for one stream."""
+    if mode == "fast":
+        return FastEncoder()
+    return encode_json
+
+
+def coalesce_window(header: str | None) -> float | None:
+    """Parses X-Himmi-Coalesce: "on"/"true" for the default window, or a
+    window in ms. Returns None (no coalescing) when absent or off."""
+    if not header:
+        return None
+    value = header.strip().lower().removesuffix("ms")
+    if value in ("1", "on", "true", "yes"):
+        return SSE_COALESCE_WINDOW_MS
+    try:
+        window = float(value)
+    except ValueError:
+        return None
+    return window if window > 0 else None
+
+
+class _Pending:
+    """Plain deltas waiting to be sent as one frame."""
+
+    def __init__(self, chunk: Any, key: tuple, content: str, deadline: float):
+        self.chunk = chunk
+        self.key = key
+        self.parts: list[str] = [content]
+        self.size = len(content)
+        self.deadline = deadline
+
+    def add(self, content: str):
+        self.parts.append(content)
+        self.size += len(content)
+
+    def take(self) -> Any:
+        if len(self.parts) > 1:
+            # The chunk is ours by now (billing only reads usage), so the
+            # merged text is written into the first chunk of the window
+            self.chunk.choices[0].delta.content = "".join(self.parts)
+            _coalesced.add(len(self.parts) - 1)
+        return self.chunk
+
+
+async def coalesce_chunks(
+    stream_iterator: AsyncIterator,
+    window_ms: float = SSE_COALESCE_WINDOW_MS,
+    max_chars: int = SSE_COALESCE_MAX_CHARS,
+) -> AsyncIterator:
+    """Merges plain content deltas arriving within `window_ms` of each other.
+
+    A window opens at the first buffered delta and closes when it expires,
+    after `max_chars` characters of text, or when a chunk that cannot be merged (role,
+    tool calls, finish reason, usage) arrives. Nothing is held back until
+    the first token has gone out, so TTFT is unchanged.
+    """
+    window = window_ms / 1000.0
+    upstream = stream_iterator.__aiter__()
+    next_chunk: asyncio.Future | None = None
+    pending: _Pending | None = None
+    first_token_sent = False
+
+    try:
+        while True:
+            if next_chunk is None:
+                next_chunk = asyncio.ensure_future(upstream.__anext__())
+            if pending is not None:
+                # Keep waiting on the same __anext__ across flushes;
+                # cancelling it would tear down the upstream generator
+                timeout = pending.deadline - time.monotonic()
+                done, _ = await asyncio.wait({next_chunk}, timeout=max(timeout, 0))
+                if not done:
+                    chunk, pending = pending.take(), None
+                    yield chunk
+                    continue
+            try:
+                chunk = await next_chunk
+            except StopAsyncIteration:
+                break
+            finally:
+                if next_chunk.done():
+                    next_chunk = None
+
+            plain = _plain_content(chunk)
+            if plain is not None and first_token_sent:
+                fields, index, content = plain
+                key = _stream_key(fields, index)
+                if pending is not None and pending.key == key:
+                    pending.add(content)
+                else:
+                    if pending is not None:
+                        yield pending.take()
+                    pending = _Pending(chunk, key, content, time.monotonic() + window)
+                if pending.size >= max_chars:
+                    chunk, pending = pending.take(), None
+                    yield chunk
+                continue
+
+            if pending is not None:
+                flushed, pending = pending.take(), None
+                yield flushed
+            if plain is not None and plain[2]:
+                first_token_sent = True
+            yield chunk
+
+        if pending is not None:
+            yield pending.take()
+    finally:
+        if next_chunk is not None and not next_chunk.done():
+            next_chunk.cancel()
+            await asyncio.gather(next_chunk, return_exceptions=True)
+        if hasattr(upstream, "aclose"):
+            await upstream.aclose()
+
+
+async def sse_generator(
+    stream_iterator: AsyncIterator, encoder: Encoder | None = None
+) -> AsyncIterator[bytes]:
+    """Formats chunks into SSE events."""
+    encode = encoder or new_encoder()
+    try:
+        async for chunk in stream_iterator:
+            yield encode(chunk)
+    except (openai.OpenAIError, OSError) as e:
+        # Provider and transport errors; OSError covers our own timeouts and
+        # the ConnectionError of an abandoned single-flight stream
+        print(f"Streaming Error: {e}")
+        yield encode({"error": str(e)})
+
+    yield DONE_EVENT
@@ -0,0 +1,71 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from inference_gateway import auth_cache as ac
+from inference_gateway.auth_cache import AuthEntry, invalidate_api_key, resolve_api_key
+from shared.lru import TTLCache
+
+
+def test_ttl_cache_evicts_lru_and_expired():
+    evicted = []
+    cache = TTLCache(maxsize=2, ttl=60, on_evict=lambda k, v: evicted.append(k))
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # "b" is now least recently used
+    cache.set("c", 3)
+    assert evicted == ["b"]
+
+    cache.set("d", 4, ttl=-1)  # already expired
+    assert cache.get("d") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_resolve_api_key_caches_and_invalidates():
+    ac.auth_cache.clear()
+    entry = AuthEntry(user_id=1, api_key_id=2, org_id=3, disabled=False, deleted=False)
+    loader = AsyncMock(return_value=entry)
+
+    with patch.object(ac, "_load_entry", loader):
+        assert await resolve_api_key("hash") == entry
+        assert await resolve_api_key("hash") == entry
+        assert loader.await_count == 1
+
+        invalidate_api_key("hash")
+        await resolve_api_key("hash")
+        assert loader.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_resolve_api_key_caches_unknown_keys():
+    ac.auth_cache.clear()
+    loader = AsyncMock(return_value=None)
+
+    with patch.object(ac, "_load_entry", loader):
+        assert await resolve_api_key("nope") is None
+        assert await resolve_api_key("nope") is None
+        assert loader.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_key_disabled_during_load_is_not_cached_as_valid():
+    ac.auth_cache.clear()
+    entry = AuthEntry(user_id=1, api_key_id=2, org_id=3, disabled=False, deleted=False)
+    disabled = entry._replace(disabled=True)
+    release = asyncio.Event()
+
+    async def slow_load(key_hash):
+        await release.wait()
+        return entry  # read before the key was disabled
+
+    with patch.object(ac, "_load_entry", slow_load):
+        lookup = asyncio.create_task(resolve_api_key("hash"))
+        await asyncio.sleep(0)
+        invalidate_api_key("hash")  # disabled while the load is in flight
+        release.set()
+        assert await lookup == entry
+
+    with patch.object(ac, "_load_entry", AsyncMock(return_value=disabled)):
+        assert (await resolve_api_key("hash")).disabled
@@ -0,0 +1,64 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from inference_gateway import router
+from inference_gateway.auth_cache import AuthEntry
+from inference_gateway.cache_policy import CachePolicy, length_bucket
+
+SHORT = [{"role": "user", "content": "What is 2 + 2?"}]
+LONG = [{"role": "user", "content": "x" * 5000}]
+
+
+def test_length_buckets_double():
+    chars = (0, 255, 256, 511, 512, 5000)
+    assert [length_bucket(n) for n in chars] == [0, 0, 1, 1, 2, 5]
+
+
+def test_cold_segment_is_bypassed_then_probed_back():
+    policy = CachePolicy(
+        enabled=True, min_hit_rate=0.1, window=20, min_samples=10, probe_rate=0.0
+    )
+    segment = policy.decide(1, "m", LONG).segment
+    for _ in range(10):
+        assert policy.decide(1, "m", LONG).use_cache
+        policy.record(segment, False)
+
+    assert not policy.decide(1, "m", LONG).use_cache
+    # Other segments are judged separately
+    assert policy.decide(1, "m", SHORT).use_cache
+    assert policy.decide(2, "m", LONG).use_cache
+
+    policy.probe_rate = 1.0
+    decision = policy.decide(1, "m", LONG)
+    assert decision.use_cache and decision.probe
+    for _ in range(2):
+        policy.record(segment, True)  # probes start hitting
+    policy.probe_rate = 0.0
+    assert policy.decide(1, "m", LONG).use_cache
+    assert policy.stats()["bypassed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_bypassed_requests_skip_lookup_and_store():
+    policy = CachePolicy(enabled=True, min_samples=1, window=1, probe_rate=0.0)
+    entry = AuthEntry(user_id=1, api_key_id=2, org_id=3, disabled=False, deleted=False)
+    check = AsyncMock(return_value=None)
+    submit = MagicMock()
+    state = {"raw_api_key": "k", "model_slug": "m", "messages": LONG}
+
+    with (
+        patch.object(router, "cache_policy", policy),
+        patch.object(router, "resolve_api_key", AsyncMock(return_value=entry)),
+        patch.object(router, "check_cache", check),
+        patch.object(router.cache_writer, "submit", submit),
+    ):
+        first = await router.cache_lookup_node(state)  # miss, recorded
+        second = await router.cache_lookup_node(state)
+        await router.cache_store_node(
+            {**state, **second, "org_id": 3, "response_content": "answer"}
+        )
+
+    assert first == {"is_cached": False}
+    assert second == {"is_cached": False, "cache_bypassed": True}
+    check.assert_awaited_once()
+    submit.assert_not_called()
@@ -0,0 +1,62 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from inference_gateway import cache_writer as module
+from inference_gateway.cache_writer import CacheWriter
+from redis import RedisError
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+@pytest.mark.asyncio
+async def test_writes_happen_behind_the_caller():
+    writer = CacheWriter(maxsize=10, workers=2)
+    store = AsyncMock()
+
+    with patch.object(module, "store_cache", store):
+        assert writer.submit("m", MESSAGES, "hello", org_id=1)
+        store.assert_not_awaited()  # nothing is written on the caller's path
+        await writer.stop()
+
+    store.assert_awaited_once_with("m", MESSAGES, "hello", org_id=1)
+    assert writer.stats()["written"] == 1
+
+
+@pytest.mark.asyncio
+async def test_queued_key_is_deduplicated_and_overload_drops():
+    writer = CacheWriter(maxsize=2, workers=1)
+    release = asyncio.Event()
+    written = []
+
+    async def store(model, messages, response, org_id=None):
+        await release.wait()
+        written.append(response)
+
+    with patch.object(module, "store_cache", store):
+        writer.submit("m", MESSAGES, "first", org_id=1)
+        await asyncio.sleep(0)  # the worker takes it and blocks
+        writer.submit("m", MESSAGES, "second", org_id=1)
+        writer.submit("m", MESSAGES, "third", org_id=1)  # replaces "second"
+        writer.submit("m", [{"content": "other"}], "other", org_id=1)
+        assert not writer.submit("m", [{"content": "more"}], "dropped", org_id=1)
+        release.set()
+        await writer.stop()
+
+    assert written == ["first", "third", "other"]
+    stats = writer.stats()
+    assert (stats["deduped"], stats["dropped"], stats["queued"]) == (1, 1, 0)
+
+
+@pytest.mark.asyncio
+async def test_failed_write_is_counted_and_worker_survives():
+    writer = CacheWriter(maxsize=10, workers=1)
+    store = AsyncMock(side_effect=[RedisError("redis down"), None])
+
+    with patch.object(module, "store_cache", store):
+        writer.submit("m", MESSAGES, "a")
+        writer.submit("m", [{"content": "b"}], "b")
+        await writer.stop()
+
+    assert writer.stats()["failed"] == 1
+    assert writer.stats()["written"] == 1
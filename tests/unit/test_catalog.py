@@ -0,0 +1,45 @@
+from types import MappingProxyType
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from inference_gateway import catalog
+from inference_gateway.catalog import Route
+
+
+def _route(provider: str, mapping_id: int) -> Route:
+    return Route(
+        provider=provider,
+        litellm_prefix=catalog.litellm_prefix(provider),
+        model_name="gpt-4o",
+        input_cost=5.0,
+        output_cost=15.0,
+        mapping_id=mapping_id,
+        context_length=128000,
+    )
+
+
+@pytest.mark.asyncio
+async def test_refresh_swaps_snapshot_and_bumps_version():
+    routes = MappingProxyType({"openai/gpt-4o": (_route("OpenAI", 1),)})
+    with patch.object(catalog, "_build_routes", AsyncMock(return_value=routes)):
+        before = catalog.get_snapshot()
+        after = await catalog.refresh()
+
+    assert after.version == before.version + 1
+    assert catalog.lookup("openai/gpt-4o")[0].litellm_prefix == "openai"
+    assert catalog.lookup("unknown/model") == ()
+    # Old readers keep their consistent view
+    assert before.routes is not after.routes
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_previous_snapshot():
+    routes = MappingProxyType({"openai/gpt-4o": (_route("OpenAI", 1),)})
+    with patch.object(catalog, "_build_routes", AsyncMock(return_value=routes)):
+        good = await catalog.refresh()
+
+    failing = AsyncMock(side_effect=OSError("db down"))
+    with patch.object(catalog, "_build_routes", failing):
+        await catalog.handle_invalidation()
+
+    assert catalog.get_snapshot() is good
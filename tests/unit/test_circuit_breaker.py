@@ -0,0 +1,164 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from inference_gateway import circuit_breaker, router
+from inference_gateway.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    BreakerRegistry,
+    CircuitBreaker,
+)
+from upstream_fakes import ProviderError, failover_state, fake_upstream
+
+
+def _breaker(**kwargs) -> CircuitBreaker:
+    options = {
+        "window_s": 60,
+        "min_requests": 4,
+        "error_rate": 0.5,
+        "open_s": 30,
+        "probes": 2,
+    }
+    options.update(kwargs)
+    return CircuitBreaker("Groq", **options)
+
+
+def test_opens_on_error_rate_once_window_has_enough_requests():
+    breaker = _breaker()
+    for failed in (True, True, True):
+        assert not breaker.record(failed, 10)
+    assert breaker.state == CLOSED
+
+    assert breaker.record(False, 10)  # 3 of 4 failed
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_opens_on_latency_slo_violations():
+    breaker = _breaker(slow_ms=1000, slow_rate=0.5)
+    for latency in (50, 2000, 3000):
+        breaker.record(False, latency)
+    assert breaker.record(False, 4000)
+    assert "slower than 1000ms" in breaker.reason
+
+
+def test_half_open_lets_limited_trials_through_then_closes():
+    breaker = _breaker()
+    breaker.open("test")
+    with patch("time.monotonic", return_value=breaker.opened_at + 31):
+        assert breaker.allow() and breaker.allow()
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow()  # both trial slots taken
+
+        breaker.record(False, 10)
+        assert breaker.state == HALF_OPEN
+        breaker.record(False, 10)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_half_open_trial_reopens():
+    breaker = _breaker()
+    breaker.open("test")
+    with patch("time.monotonic", return_value=breaker.opened_at + 31):
+        assert breaker.allow()
+    assert breaker.record(True, 10)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_released_trial_frees_its_slot():
+    breaker = _breaker(probes=1)
+    breaker.open("test")
+    with patch("time.monotonic", return_value=breaker.opened_at + 31):
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.release()
+        assert breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_model_breaker_leaves_the_providers_other_models_alone():
+    registry = BreakerRegistry(enabled=True, shared=False)
+    route = registry._get("Groq|llama-3")
+    route.min_requests = 1
+    await registry.record("Groq", "llama-3", True, 10)
+
+    assert not registry.allow("Groq", "llama-3")
+    assert registry.allow("Groq", "mixtral")
+    assert registry.stats()["breakers"]["Groq|llama-3"]["state"] == OPEN
+
+    registry.reset("Groq|llama-3")
+    assert registry.allow("Groq", "llama-3")
+
+
+@pytest.mark.asyncio
+async def test_shared_trip_is_published_and_applied_by_other_replicas():
+    tripping = BreakerRegistry(enabled=True, shared=True)
+    tripping._get("Groq").min_requests = 1
+    with patch.object(circuit_breaker, "publish_invalidation", AsyncMock()) as publish:
+        await tripping.record("Groq", "llama-3", True, 10)
+    publish.assert_awaited_once_with("breaker", "Groq")
+
+    replica = BreakerRegistry(enabled=True, shared=True)
+    replica.handle_remote_open("Groq")
+    replica.handle_remote_open(None)  # bus reconnect
+    assert not replica.allow("Groq", "anything")
+
+
+@pytest.mark.asyncio
+async def test_failover_skips_open_provider_without_calling_it():
+    registry = BreakerRegistry(enabled=True, shared=False)
+    registry._get("Groq").open("test")
+    call, calls, _ = fake_upstream(
+        {"Amazon Bedrock": {"response_content": "ok", "usage": {}}}
+    )
+    with (
+        patch.object(router, "breakers", registry),
+        patch.object(router, "_call_upstream", call),
+        patch.object(router, "get_provider_key", AsyncMock(return_value=None)),
+    ):
+        result = await router._call_with_failover(failover_state())
+
+    assert calls == ["Amazon Bedrock"]
+    assert result["provider_info"]["name"] == "Amazon Bedrock"
+
+
+@pytest.mark.asyncio
+async def test_failover_records_only_provider_side_failures():
+    registry = BreakerRegistry(enabled=True, shared=False)
+    call, _, _ = fake_upstream({"Groq": ProviderError(400)})
+    with (
+        patch.object(router, "breakers", registry),
+        patch.object(router, "_call_upstream", call),
+    ):
+        await router._call_with_failover(failover_state())
+    assert registry.stats()["breakers"]["Groq"]["error_rate"] == 0.0
+
+    call, _, _ = fake_upstream(
+        {"Groq": ProviderError(503), "Amazon Bedrock": ProviderError(400)}
+    )
+    with (
+        patch.object(router, "breakers", registry),
+        patch.object(router, "_call_upstream", call),
+        patch.object(router, "get_provider_key", AsyncMock(return_value=None)),
+    ):
+        await router._call_with_failover(failover_state())
+    assert registry.stats()["breakers"]["Groq"]["error_rate"] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_every_breaker_open_fails_fast():
+    registry = BreakerRegistry(enabled=True, shared=False)
+    for provider in ("Groq", "Amazon Bedrock", "Ollama (Local)"):
+        registry._get(provider).open("test")
+    call, calls, _ = fake_upstream({})
+    with (
+        patch.object(router, "breakers", registry),
+        patch.object(router, "_call_upstream", call),
+    ):
+        result = await router._call_with_failover(failover_state())
+
+    assert calls == []
+    assert "circuit breaker is open" in result["error"]
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+from shared.embeddings import EmbeddingBatcher
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def embed_many(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_batch():
+    model = FakeModel()
+    batcher = EmbeddingBatcher(model.embed_many, max_batch=8, max_wait_ms=20)
+
+    vectors = await asyncio.gather(
+        *(batcher.embed(t) for t in ["a", "bb", "ccc", "bb"])
+    )
+
+    assert vectors == [[1.0], [2.0], [3.0], [2.0]]
+    # One call, and the duplicate text was embedded once
+    assert model.calls == [["a", "bb", "ccc"]]
+
+
+@pytest.mark.asyncio
+async def test_full_batch_flushes_without_waiting_and_memo_skips_model():
+    model = FakeModel()
+    batcher = EmbeddingBatcher(model.embed_many, max_batch=2, max_wait_ms=10_000)
+
+    await asyncio.wait_for(
+        asyncio.gather(batcher.embed("x"), batcher.embed("yy")), timeout=1
+    )
+    assert await batcher.embed("yy") == [2.0]
+    assert model.calls == [["x", "yy"]]
+    assert batcher.memo.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_model_errors_reach_every_waiter():
+    def broken(texts):
+        raise RuntimeError("model crashed")
+
+    batcher = EmbeddingBatcher(broken, max_wait_ms=1)
+    results = await asyncio.gather(
+        batcher.embed("a"), batcher.embed("b"), return_exceptions=True
+    )
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert not batcher._inflight
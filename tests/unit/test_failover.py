@@ -0,0 +1,103 @@
+from unittest.mock import AsyncMock, patch
+
+import aiohttp
+import httpx
+import litellm
+import pytest
+from inference_gateway import router
+from upstream_fakes import ProviderError, failover_state, fake_upstream
+
+
+@pytest.mark.asyncio
+async def test_retryable_error_fails_over_and_bills_serving_mapping():
+    call, calls, _ = fake_upstream(
+        {
+            "Groq": ProviderError(429),
+            "Amazon Bedrock": ProviderError(503),
+            "Ollama (Local)": {"response_content": "ok", "usage": {}},
+        }
+    )
+    with (
+        patch.object(router, "_call_upstream", call),
+        patch.object(router, "get_provider_key", AsyncMock(return_value=None)),
+    ):
+        result = await router._call_with_failover(failover_state())
+
+    assert calls == ["Groq", "Amazon Bedrock", "Ollama (Local)"]
+    assert result["response_content"] == "ok"
+    assert result["costs"]["mapping_id"] == 3
+    assert result["provider_info"]["name"] == "Ollama (Local)"
+
+
+@pytest.mark.asyncio
+async def test_non_retryable_error_is_returned_without_failover():
+    call, calls, _ = fake_upstream({"Groq": ProviderError(400)})
+    with patch.object(router, "_call_upstream", call):
+        result = await router._call_with_failover(failover_state())
+
+    assert calls == ["Groq"]
+    assert result["error"] == "LLM Provider Error: HTTP 400"
+
+
+@pytest.mark.asyncio
+async def test_raw_transport_and_budget_errors_are_upstream_failures():
+    request = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+    call, calls, _ = fake_upstream(
+        {
+            "Groq": httpx.ConnectError("Connection refused", request=request),
+            "Amazon Bedrock": aiohttp.ServerDisconnectedError(),
+            "Ollama (Local)": litellm.exceptions.BudgetExceededError(2.0, 1.0),
+        }
+    )
+    with (
+        patch.object(router, "_call_upstream", call),
+        patch.object(router, "get_provider_key", AsyncMock(return_value=None)),
+    ):
+        result = await router._call_with_failover(failover_state())
+
+    # Transport errors fail over; the budget error ends the request cleanly
+    assert calls == ["Groq", "Amazon Bedrock", "Ollama (Local)"]
+    assert result["error"].startswith("LLM Provider Error: Budget has been exceeded")
+
+
+@pytest.mark.asyncio
+async def test_attempt_deadline_moves_on_to_next_provider():
+    call, calls, _ = fake_upstream(
+        {"Groq": (10, None), "Amazon Bedrock": {"response_content": "ok", "usage": {}}}
+    )
+    with (
+        patch.object(router, "_call_upstream", call),
+        patch.object(router, "get_provider_key", AsyncMock(return_value="sk-aws")),
+        patch.object(router, "UPSTREAM_ATTEMPT_TIMEOUT", 0.01),
+    ):
+        result = await router._call_with_failover(failover_state())
+
+    assert calls == ["Groq", "Amazon Bedrock"]
+    assert result["provider_info"]["api_key"] == "sk-aws"
+
+
+@pytest.mark.asyncio
+async def test_stream_fails_over_before_the_first_chunk():
+    async def broken():
+        raise ProviderError(502)
+        yield  # pragma: no cover
+
+    async def healthy():
+        yield "a"
+        yield "b"
+
+    call, calls, _ = fake_upstream(
+        {
+            "Groq": {"stream_iterator": broken()},
+            "Amazon Bedrock": {"stream_iterator": healthy()},
+        }
+    )
+    with (
+        patch.object(router, "_call_upstream", call),
+        patch.object(router, "get_provider_key", AsyncMock(return_value=None)),
+    ):
+        result = await router._call_with_failover(failover_state(stream=True))
+
+    assert calls == ["Groq", "Amazon Bedrock"]
+    assert [c async for c in result["stream_iterator"]] == ["a", "b"]
+    assert result["costs"]["mapping_id"] == 2
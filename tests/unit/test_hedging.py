@@ -0,0 +1,178 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from inference_gateway import router
+from inference_gateway.circuit_breaker import BreakerRegistry
+from inference_gateway.hedging import HedgePolicy
+from inference_gateway.selection import SelectionEngine
+from upstream_fakes import ROUTES, ProviderError, failover_state, fake_upstream
+
+
+def _policy(budget=1.0, **kwargs) -> HedgePolicy:
+    engine = SelectionEngine()
+    for _ in range(4):
+        engine.observe(1, latency_ms=20)
+    options = {
+        "min_samples": 4,
+        "min_delay_ms": 1,
+        "budget_ratio": budget,
+        "engine": engine,
+    }
+    options.update(kwargs)
+    return HedgePolicy(enabled=True, **options)
+
+
+async def _run(policy, behaviour, stream=False):
+    call, calls, cancelled = fake_upstream(behaviour)
+    with (
+        patch.object(router, "hedging", policy),
+        patch.object(router, "selection", policy.engine),
+        patch.object(router, "breakers", BreakerRegistry(enabled=False)),
+        patch.object(router, "_call_upstream", call),
+        patch.object(router, "get_provider_key", AsyncMock(return_value=None)),
+    ):
+        result = await router._call_with_failover(failover_state(ROUTES[:2], stream))
+        await asyncio.sleep(0.01)  # let the loser see its cancellation
+    return result, calls, cancelled
+
+
+def test_delay_needs_samples_and_respects_the_floor():
+    policy = _policy(min_delay_ms=50)
+    assert policy.delay(1, stream=False) == pytest.approx(0.05)
+    assert policy.delay(2, stream=False) is None  # unmeasured mapping
+    disabled = HedgePolicy(enabled=False, engine=policy.engine)
+    assert disabled.delay(1, stream=False) is None
+
+
+def test_stream_delay_uses_ttft_not_response_time():
+    policy = _policy(min_delay_ms=1)
+    assert policy.delay(1, stream=True) is None  # no stream samples yet
+    for _ in range(4):
+        policy.engine.observe(1, ttft_ms=5)
+    assert policy.delay(1, stream=True) == pytest.approx(0.005)
+    assert policy.delay(1, stream=False) == pytest.approx(0.02)
+
+
+def test_budget_earns_a_share_of_requests():
+    policy = _policy(budget=0.5, budget_burst=1.0)
+    policy.deposit(7)
+    assert not policy.try_spend(7)
+    policy.deposit(7)
+    policy.deposit(7)  # capped at the burst
+    assert policy.try_spend(7)
+    assert not policy.try_spend(7)
+    assert policy.stats()["over_budget"] == 2
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_cancelled_when_backup_wins():
+    policy = _policy()
+    result, calls, cancelled = await _run(
+        policy,
+        {
+            "Groq": (5, {"response_content": "slow"}),
+            "Amazon Bedrock": (0, {"response_content": "fast"}),
+        },
+    )
+
+    assert calls == ["Groq", "Amazon Bedrock"]
+    assert result["response_content"] == "fast"
+    assert result["costs"]["mapping_id"] == 2
+    assert cancelled == ["Groq"]
+    assert policy.stats()["won"] == 1 and policy.stats()["win_rate"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged():
+    policy = _policy()
+    _, calls, _ = await _run(
+        policy, {"Groq": (0, {"response_content": "ok"}), "Amazon Bedrock": (0, {})}
+    )
+    assert calls == ["Groq"]
+    assert policy.stats()["fired"] == 0
+
+
+@pytest.mark.asyncio
+async def test_primary_can_still_win_after_hedging():
+    policy = _policy()
+    result, _, cancelled = await _run(
+        policy,
+        {
+            "Groq": (0.05, {"response_content": "primary"}),
+            "Amazon Bedrock": (5, {"response_content": "backup"}),
+        },
+    )
+    assert result["response_content"] == "primary"
+    assert cancelled == ["Amazon Bedrock"]
+    assert policy.stats()["lost"] == 1
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_without_budget():
+    policy = _policy(budget=0.0)
+    result, calls, _ = await _run(
+        policy,
+        {
+            "Groq": (0.05, {"response_content": "primary"}),
+            "Amazon Bedrock": (0, {"response_content": "backup"}),
+        },
+    )
+    assert calls == ["Groq"]
+    assert result["response_content"] == "primary"
+    assert policy.stats()["over_budget"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_backup_waits_for_primary():
+    policy = _policy()
+    result, _, _ = await _run(
+        policy,
+        {
+            "Groq": (0.05, {"response_content": "primary"}),
+            "Amazon Bedrock": (0, ProviderError(503)),
+        },
+    )
+    assert result["response_content"] == "primary"
+    assert policy.stats()["lost"] == 1
+
+
+@pytest.mark.asyncio
+async def test_both_failing_reports_the_primary_error():
+    policy = _policy()
+    result, _, _ = await _run(
+        policy,
+        {
+            "Groq": (0.05, ProviderError(502)),
+            "Amazon Bedrock": (0, ProviderError(503)),
+        },
+    )
+    assert result["error"] == "LLM Provider Error: HTTP 502"
+    assert policy.stats()["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_losing_stream_is_closed():
+    closed = []
+
+    async def stream(name, delay):
+        try:
+            await asyncio.sleep(delay)
+            yield name
+        finally:
+            closed.append(name)
+
+    policy = _policy()
+    for _ in range(4):
+        policy.engine.observe(1, ttft_ms=20)
+    result, _, _ = await _run(
+        policy,
+        {
+            "Groq": (0, {"stream_iterator": stream("groq", 5)}),
+            "Amazon Bedrock": (0, {"stream_iterator": stream("bedrock", 0)}),
+        },
+        stream=True,
+    )
+    assert [c async for c in result["stream_iterator"]] == ["bedrock"]
+    await asyncio.sleep(0)
+    assert "groq" in closed
@@ -0,0 +1,103 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from inference_gateway.leases import CreditLeaseManager
+from inference_gateway.ledger import BillingLedger
+
+
+class FakeOrgBalance:
+    """Stands in for the SELECT ... FOR UPDATE on Organization.credits."""
+
+    def __init__(self, credits: float):
+        self.credits = credits
+        self.trips = 0
+
+    async def reserve(self, manager, org_id, lease):
+        self.trips += 1
+        debt = max(-lease.remaining, 0.0)
+        granted = min(manager.lease_size, max(self.credits - debt, 0.0))
+        self.credits -= debt + granted
+        lease.remaining += debt + granted
+        return granted
+
+
+@pytest.mark.asyncio
+async def test_requests_are_authorized_locally_until_lease_runs_low():
+    manager = CreditLeaseManager(lease_size=1.0, low_watermark=0.25)
+    org = FakeOrgBalance(credits=10.0)
+
+    with patch.object(
+        CreditLeaseManager,
+        "_reserve",
+        lambda self, org_id, lease: org.reserve(self, org_id, lease),
+    ):
+        assert await manager.authorize(1)
+        for _ in range(5):
+            manager.consume(1, 0.1)
+            assert await manager.authorize(1)
+
+    assert org.trips == 1
+    assert org.credits == 9.0
+
+
+@pytest.mark.asyncio
+async def test_exhausted_org_is_rejected_and_overdraft_settled():
+    manager = CreditLeaseManager(lease_size=1.0, low_watermark=0.25)
+    org = FakeOrgBalance(credits=0.5)
+
+    with (
+        patch.object(
+            CreditLeaseManager,
+            "_reserve",
+            lambda self, org_id, lease: org.reserve(self, org_id, lease),
+        ),
+        patch("inference_gateway.leases.ledger.record", AsyncMock()) as record,
+    ):
+        assert await manager.authorize(1)
+        manager.consume(1, 0.7)  # overspend bounded by the lease
+        assert not await manager.authorize(1)
+        assert not await manager.authorize(1)  # cached as exhausted
+        await manager.release_all()
+
+    assert org.trips == 2
+    # The 0.2 overdraft was settled by the renewal, so nothing is left to return
+    assert org.credits == pytest.approx(-0.2)
+    record.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_unused_lease_of_crashed_process_is_returned_on_replay(tmp_path):
+    path = str(tmp_path / "billing.journal")
+    crashed = BillingLedger(path, flush_interval_ms=60_000)
+    manager = CreditLeaseManager(lease_size=1.0, low_watermark=0.25)
+    org = FakeOrgBalance(credits=10.0)
+
+    async def reserve(self, org_id, lease):
+        granted = await org.reserve(self, org_id, lease)
+        await crashed.record(None, None, 0.0, lease_org=org_id, held=granted)
+        return granted
+
+    with (
+        patch.object(CreditLeaseManager, "_reserve", reserve),
+        patch("inference_gateway.leases.ledger", crashed),
+        patch.object(crashed, "_write", AsyncMock()),
+    ):
+        assert await manager.authorize(1)
+        await manager.charge(1, 10, 0.25)
+        await crashed.flush()  # rotation keeps the lease in a checkpoint
+        await manager.charge(1, 10, 0.25)
+    crashed._flusher.cancel()
+    crashed._close()
+    crashed._executor.shutdown()
+
+    restarted = BillingLedger(path, flush_interval_ms=0)
+    write = AsyncMock()
+    with patch.object(restarted, "_write", write):
+        await restarted.start()
+        await restarted.flush()
+
+    # The second charge is replayed and the 0.5 never spent goes back
+    org_deltas, key_deltas = write.await_args.args
+    assert org_deltas == {1: pytest.approx(-0.5)}
+    assert key_deltas[10][0] == pytest.approx(0.25)
+    await restarted.stop()
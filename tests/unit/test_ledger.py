@@ -0,0 +1,116 @@
+import os
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from inference_gateway.ledger import BillingLedger
+
+
+@pytest.mark.asyncio
+async def test_flush_batches_deltas_and_clears_journal(tmp_path):
+    ledger = BillingLedger(str(tmp_path / "billing.journal"), flush_interval_ms=0)
+    write = AsyncMock()
+
+    with patch.object(ledger, "_write", write):
+        await ledger.record(1, 10, 0.5)
+        await ledger.record(1, 11, 0.25)
+        await ledger.record(2, 20, 1.0)
+        await ledger.flush()
+
+    org_deltas, key_deltas = write.await_args.args
+    assert org_deltas == {1: 0.75, 2: 1.0}
+    assert key_deltas[10][0] == 0.5
+    assert ledger.stats()["backlog"] == 0
+    assert not os.path.exists(ledger.flushing_path)
+    await ledger.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_survives_restart(tmp_path):
+    path = str(tmp_path / "billing.journal")
+    ledger = BillingLedger(path, flush_interval_ms=0)
+
+    with patch.object(ledger, "_write", AsyncMock(side_effect=OSError("db down"))):
+        await ledger.record(1, 10, 0.5)
+        with pytest.raises(OSError):
+            await ledger.flush()
+        await ledger.record(None, 10, 0.25)  # key-only charge
+        await ledger.stop()
+
+    # A new process replays both the failed batch and the later charge
+    restarted = BillingLedger(path, flush_interval_ms=0)
+    write = AsyncMock()
+    with patch.object(restarted, "_write", write):
+        await restarted.start()
+        assert restarted.stats()["backlog"] == 2
+        await restarted.flush()
+
+    org_deltas, key_deltas = write.await_args.args
+    assert org_deltas == {1: 0.5}
+    assert key_deltas[10][0] == 0.75
+    await restarted.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_rotation_keeps_journal_and_deltas(tmp_path):
+    path = str(tmp_path / "billing.journal")
+    ledger = BillingLedger(path, flush_interval_ms=0)
+    await ledger.record(1, 10, 0.5)
+
+    disk_error = OSError("no space left")
+    with (
+        patch("inference_gateway.ledger.os.replace", side_effect=disk_error),
+        pytest.raises(OSError),
+    ):
+        await ledger.flush()
+    assert ledger.stats()["backlog"] == 1
+    assert os.path.getsize(ledger.flushing_path) == 0
+
+    # The journal is still open, and the next flush takes both charges once
+    await ledger.record(2, 20, 1.0)
+    write = AsyncMock()
+    with patch.object(ledger, "_write", write):
+        await ledger.flush()
+    assert write.await_args.args[0] == {1: 0.5, 2: 1.0}
+    await ledger.stop()
+
+    restarted = BillingLedger(path, flush_interval_ms=0)
+    await restarted.start()
+    assert restarted.stats()["backlog"] == 0
+    await restarted.stop()
+
+
+def _crash(ledger: BillingLedger):
+    """Drops the process's files without flushing, like a killed worker."""
+    ledger._close()
+    ledger._executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_workers_journal_separately_and_adopt_dead_ones(tmp_path):
+    path = str(tmp_path / "billing.journal")
+    with patch("inference_gateway.ledger.os.getpid", return_value=111):
+        dead = BillingLedger(path, flush_interval_ms=0)
+        await dead.record(1, 10, 0.5)
+    with patch("inference_gateway.ledger.os.getpid", return_value=222):
+        alive = BillingLedger(path, flush_interval_ms=0)
+        await alive.record(2, 20, 1.0)
+    assert dead.journal_path != alive.journal_path
+    _crash(dead)
+
+    with patch("inference_gateway.ledger.os.getpid", return_value=333):
+        restarted = BillingLedger(path, flush_interval_ms=0)
+        write = AsyncMock()
+        with patch.object(restarted, "_write", write):
+            await restarted.start()
+            await restarted.flush()
+
+    # The dead worker's charge moved over; the live worker's file is its own
+    org_deltas, key_deltas = write.await_args.args
+    assert org_deltas == {1: 0.5}
+    assert key_deltas[10][0] == 0.5
+    assert not os.path.exists(dead.journal_path)
+    assert os.path.exists(alive.journal_path)
+
+    with patch.object(alive, "_write", AsyncMock()):
+        await alive.stop()
+    await restarted.stop()
@@ -0,0 +1,53 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from inference_gateway import router
+
+ROUTE = {
+    "provider_info": {"name": "OpenAI", "model_name": "gpt-4o", "api_key": None},
+    "costs": {"input": 5.0, "output": 15.0, "mapping_id": 1},
+}
+AUTH = {"user_id": 1, "api_key_id": 2, "org_id": 3, "error": None}
+STATE = {"model_slug": "openai/gpt-4o", "messages": [{"role": "user", "content": "Hi"}]}
+
+
+@pytest.mark.asyncio
+async def test_failed_auth_cancels_sibling_branches():
+    cancelled = asyncio.Event()
+
+    async def slow_cache_lookup(state):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with (
+        patch.object(router, "auth_node", AsyncMock(return_value={"error": "nope"})),
+        patch.object(router, "route_node", AsyncMock(return_value=ROUTE)),
+        patch.object(router, "cache_lookup_node", slow_cache_lookup),
+    ):
+        result = await router.prepare_node(STATE)
+
+    assert result["error"] == "nope"
+    assert result["is_cached"] is False
+    assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+async def test_branches_join_with_byok_key():
+    with (
+        patch.object(router, "auth_node", AsyncMock(return_value=AUTH)),
+        patch.object(router, "route_node", AsyncMock(return_value=ROUTE)),
+        patch.object(
+            router, "cache_lookup_node", AsyncMock(return_value={"is_cached": False})
+        ),
+        patch.object(router, "get_provider_key", AsyncMock(return_value="sk-byok")),
+    ):
+        result = await router.prepare_node(STATE)
+
+    assert result["user_id"] == 1
+    assert result["costs"]["mapping_id"] == 1
+    assert result["provider_info"]["api_key"] == "sk-byok"
+    assert result["is_cached"] is False
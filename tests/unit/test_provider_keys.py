@@ -0,0 +1,77 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from inference_gateway import provider_keys as pk
+from inference_gateway.provider_keys import get_provider_key, invalidate_provider_key
+
+
+@pytest.mark.asyncio
+async def test_negative_lookups_are_cached():
+    pk.provider_key_cache.clear()
+    loader = AsyncMock(return_value=None)
+
+    with patch.object(pk, "_load_key", loader):
+        assert await get_provider_key(1, "openai") is None
+        assert await get_provider_key(1, "openai") is None
+        assert loader.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_invalidation_wipes_plaintext():
+    pk.provider_key_cache.clear()
+    secret = bytearray(b"sk-user-secret")
+    loader = AsyncMock(return_value=secret)
+
+    with patch.object(pk, "_load_key", loader):
+        assert await get_provider_key(7, "anthropic") == "sk-user-secret"
+        invalidate_provider_key("7:anthropic")
+
+    assert secret == bytearray(len("sk-user-secret"))
+    assert len(pk.provider_key_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_key_removed_during_load_is_not_cached():
+    pk.provider_key_cache.clear()
+    release = asyncio.Event()
+
+    async def slow_load(user_id, provider):
+        await release.wait()
+        return bytearray(b"sk-old")  # read before the key was deleted
+
+    with patch.object(pk, "_load_key", slow_load):
+        lookup = asyncio.create_task(get_provider_key(7, "openai"))
+        await asyncio.sleep(0)
+        invalidate_provider_key("7:openai")
+        release.set()
+        assert await lookup == "sk-old"
+
+    with patch.object(pk, "_load_key", AsyncMock(return_value=None)):
+        assert await get_provider_key(7, "openai") is None
+
+
+@pytest.mark.asyncio
+async def test_waiter_is_unaffected_by_invalidation_after_leader_caches():
+    pk.provider_key_cache.clear()
+    release = asyncio.Event()
+
+    async def slow_load(user_id, provider):
+        await release.wait()
+        return bytearray(b"sk-user-secret")
+
+    async def lead_then_invalidate():
+        key = await get_provider_key(7, "openai")
+        # Runs before the waiter resumes: wipes the cached copy under it
+        invalidate_provider_key("7:openai")
+        return key
+
+    with patch.object(pk, "_load_key", slow_load):
+        leader = asyncio.create_task(lead_then_invalidate())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(get_provider_key(7, "openai"))
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await leader == "sk-user-secret"
+        assert await waiter == "sk-user-secret"
@@ -0,0 +1,49 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from inference_gateway.request_log import RequestLogWriter, build_log_row
+
+RESULT = {
+    "user_id": 1,
+    "api_key_id": 2,
+    "org_id": 3,
+    "model_slug": "openai/gpt-4o",
+    "provider_info": {"name": "OpenAI"},
+    "usage": {"prompt_tokens": 10, "completion_tokens": 20},
+    "costs": {"input": 5.0, "output": 15.0},
+    "latency_ms": 42,
+}
+
+
+def test_build_log_row_prices_usage():
+    row = build_log_row(RESULT)
+    assert row["cost"] == pytest.approx((10 * 5 + 20 * 15) / 1_000_000)
+    assert row["timestamp"] is not None
+    assert "id" not in row
+    assert build_log_row({**RESULT, "error": "boom"}) is None
+
+
+@pytest.mark.asyncio
+async def test_rows_are_batched_and_flushed_on_stop():
+    writer = RequestLogWriter(maxsize=100, batch_size=3, flush_ms=1000)
+    insert = AsyncMock()
+
+    with patch.object(writer, "_insert", insert):
+        for _ in range(4):
+            assert await writer.submit(build_log_row(RESULT))
+        await asyncio.sleep(0)  # let the worker take the first full batch
+        await writer.stop()
+
+    assert [len(call.args[0]) for call in insert.await_args_list] == [3, 1]
+
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_rows():
+    writer = RequestLogWriter(maxsize=1, batch_size=10, flush_ms=1000)
+
+    with patch.object(writer, "start"):  # no worker draining the queue
+        assert await writer.submit(build_log_row(RESULT))
+        assert not await writer.submit(build_log_row(RESULT))
+
+    assert writer.stats()["dropped"] == 1
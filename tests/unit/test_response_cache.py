@@ -0,0 +1,110 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from shared import cache as response_cache
+
+MESSAGES = [
+    {"role": "system", "content": "Be brief."},
+    {"role": "user", "content": "Hi"},
+]
+
+
+@pytest.fixture(autouse=True)
+def empty_l1():
+    response_cache.exact_cache.clear()
+    yield
+    response_cache.exact_cache.clear()
+
+
+def test_key_covers_model_history_and_params():
+    key = response_cache.cache_key("openai/gpt-4o", MESSAGES)
+    assert key == response_cache.cache_key("openai/gpt-4o", list(MESSAGES))
+    assert key != response_cache.cache_key("openai/gpt-4o-mini", MESSAGES)
+    assert key != response_cache.cache_key("openai/gpt-4o", MESSAGES[1:])
+    assert key != response_cache.cache_key(
+        "openai/gpt-4o", MESSAGES, {"temperature": 0}
+    )
+
+
+@pytest.mark.asyncio
+async def test_l2_hit_is_promoted_to_l1_without_semantic_search():
+    redis = MagicMock(get=AsyncMock(return_value=b"Hello!"), set=AsyncMock())
+    semantic = MagicMock(acheck=AsyncMock())
+
+    with (
+        patch.object(response_cache, "_get_client", return_value=redis),
+        patch.object(response_cache, "cache", semantic),
+    ):
+        first = await response_cache.check_cache("openai/gpt-4o", MESSAGES)
+        second = await response_cache.check_cache("openai/gpt-4o", MESSAGES)
+
+    assert first == ("Hello!", "l2")
+    assert second == ("Hello!", "l1")
+    redis.get.assert_awaited_once()
+    semantic.acheck.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_semantic_hit_is_promoted_to_both_exact_tiers():
+    redis = MagicMock(get=AsyncMock(return_value=None), set=AsyncMock())
+    redis.pipeline.return_value.__aenter__.return_value = MagicMock(execute=AsyncMock())
+    semantic = MagicMock(
+        acheck=AsyncMock(return_value=[{"response": "Hey", "key": "entry:1"}])
+    )
+
+    embedder = MagicMock(embed=AsyncMock(return_value=[0.1, 0.2]))
+
+    with (
+        patch.object(response_cache, "_get_client", return_value=redis),
+        patch.object(response_cache, "cache", semantic),
+        patch.object(response_cache, "embedder", embedder),
+    ):
+        hit = await response_cache.check_cache("openai/gpt-4o", MESSAGES, org_id=7)
+        for task in list(response_cache._background):
+            await task
+
+    assert hit == ("Hey", "semantic")
+    assert semantic.acheck.await_args.kwargs["vector"] == [0.1, 0.2]
+    key = response_cache.cache_key("openai/gpt-4o", MESSAGES, org_id=7)
+    assert response_cache.exact_cache.get(key) == "Hey"
+    redis.set.assert_awaited_once()
+    assert redis.set.await_args.args == (response_cache.EXACT_KEY_PREFIX + key, "Hey")
+
+    # Searched only within the model/org namespace and conversation context
+    search_filter = str(semantic.acheck.await_args.kwargs["filter_expression"])
+    assert "openai\\/gpt\\-4o" in search_filter
+    assert "@org:{7}" in search_filter
+    assert response_cache.context_fingerprint(MESSAGES) in search_filter
+
+
+def test_namespaces_apply_model_overrides_and_org_isolation():
+    overrides = {"openai/gpt-4o": {"ttl": 60, "distance_threshold": 0.01}}
+    with patch.object(response_cache, "CACHE_MODEL_OVERRIDES", overrides):
+        ns = response_cache.namespace("openai/gpt-4o", org_id=7)
+        other = response_cache.namespace("groq/llama-3", org_id=7)
+
+    assert (ns.ttl, ns.distance_threshold, ns.org) == (60, 0.01, "7")
+    assert other.ttl == response_cache.CACHE_SEMANTIC_TTL
+    with patch.object(response_cache, "CACHE_ISOLATE_ORGS", False):
+        assert response_cache.namespace("openai/gpt-4o", org_id=7).org == "shared"
+    assert response_cache.cache_key(
+        "openai/gpt-4o", MESSAGES, org_id=1
+    ) != response_cache.cache_key("openai/gpt-4o", MESSAGES, org_id=2)
+
+
+@pytest.mark.asyncio
+async def test_store_evicts_least_recently_used_entries_past_the_bound():
+    pipe = MagicMock(execute=AsyncMock(return_value=[0, 1, True, 12]))
+    redis = MagicMock(
+        zpopmin=AsyncMock(return_value=[(b"entry:old1", 1.0), (b"entry:old2", 2.0)]),
+        delete=AsyncMock(),
+    )
+    redis.pipeline.return_value.__aenter__.return_value = pipe
+    ns = response_cache.namespace("openai/gpt-4o")._replace(max_entries=10)
+
+    with patch.object(response_cache, "_get_client", return_value=redis):
+        evicted = await response_cache._track_and_evict(ns, "entry:new")
+
+    assert evicted == 2
+    redis.zpopmin.assert_awaited_once_with(ns.lru_key, 2)
+    redis.delete.assert_awaited_once_with(b"entry:old1", b"entry:old2")
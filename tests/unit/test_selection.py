@@ -0,0 +1,146 @@
+from unittest.mock import patch
+
+import pytest
+from inference_gateway import catalog, router
+from inference_gateway.selection import Policy, SelectionEngine
+
+
+def _route(provider: str, mapping_id: int, cost: float) -> catalog.Route:
+    return catalog.Route(
+        provider=provider,
+        litellm_prefix=catalog.litellm_prefix(provider),
+        model_name="llama-3",
+        input_cost=cost,
+        output_cost=cost,
+        mapping_id=mapping_id,
+        context_length=None,
+    )
+
+
+GROQ, BEDROCK, OLLAMA = (
+    _route("Groq", 1, 0.5),
+    _route("Amazon Bedrock", 2, 2.0),
+    _route("Ollama (Local)", 3, 0.0),
+)
+ROUTES = (GROQ, BEDROCK, OLLAMA)
+
+
+def _engine() -> SelectionEngine:
+    engine = SelectionEngine(alpha=0.5, explore_rate=0.0)
+    for _ in range(10):
+        engine.observe(1, ttft_ms=200, tokens_per_sec=500)
+        engine.observe(2, ttft_ms=400, tokens_per_sec=80)
+        engine.observe(3, ttft_ms=900, tokens_per_sec=20)
+    return engine
+
+
+def _providers(routes):
+    return [r.provider for r in routes]
+
+
+def test_policies_order_by_their_metric():
+    engine = _engine()
+    assert engine.order(ROUTES, Policy("cheapest")) == (OLLAMA, GROQ, BEDROCK)
+    assert engine.order(ROUTES, Policy("fastest")) == (GROQ, BEDROCK, OLLAMA)
+    assert engine.order(ROUTES, Policy("throughput")) == (GROQ, BEDROCK, OLLAMA)
+    assert engine.order(ROUTES, Policy("default")) == ROUTES
+
+
+def test_balanced_prefers_cheapest_route_meeting_latency_target():
+    engine = _engine()
+    # Ollama misses the 500ms target; Groq is cheaper than Bedrock
+    policy = Policy("balanced", max_cost=5.0, latency_target_ms=500)
+    assert engine.order(ROUTES, policy) == (GROQ, BEDROCK, OLLAMA)
+
+    # Under a ceiling that excludes Groq and Bedrock, only Ollama is left
+    assert engine.order(ROUTES, Policy("balanced", max_cost=0.5)) == (OLLAMA,)
+    assert engine.order(ROUTES, Policy("cheapest", max_cost=-1)) == ()
+
+
+def test_ewma_follows_recent_samples_and_percentiles_use_the_window():
+    engine = SelectionEngine(alpha=0.5, window=10)
+    for ttft in (100, 100, 1000):
+        engine.observe(7, ttft_ms=ttft)
+    assert engine.stats()["mappings"][7]["ttft_ms"] == 550
+    assert engine.percentile(7, 0.9, stream=True) == 1000
+    assert engine.percentile(8, 0.9, stream=True) is None
+
+
+def test_stream_ttft_and_non_stream_response_time_are_kept_apart():
+    engine = SelectionEngine(explore_rate=0.0)
+    # Groq starts streaming fast but is slow to finish a whole response
+    engine.observe(1, ttft_ms=100)
+    engine.observe(1, latency_ms=5000)
+    engine.observe(2, ttft_ms=300)
+    engine.observe(2, latency_ms=2000)
+
+    assert engine.samples(1, stream=True) == engine.samples(1, stream=False) == 1
+    assert engine.percentile(1, 0.9, stream=False) == 5000
+    fastest = Policy("fastest")
+    assert engine.order((GROQ, BEDROCK), fastest, stream=True) == (GROQ, BEDROCK)
+    assert engine.order((GROQ, BEDROCK), fastest, stream=False) == (BEDROCK, GROQ)
+
+
+def test_unmeasured_routes_are_tried_first_for_latency_policies():
+    engine = SelectionEngine(explore_rate=0.0)
+    engine.observe(1, ttft_ms=200)
+    assert _providers(engine.order((GROQ, BEDROCK), Policy("fastest"))) == [
+        "Amazon Bedrock",
+        "Groq",
+    ]
+
+
+def test_failing_mapping_goes_behind_healthy_ones():
+    engine = _engine()
+    for _ in range(5):
+        engine.observe_outcome(1, failed=True)
+    assert engine.order(ROUTES, Policy("fastest"))[-1] == GROQ
+
+
+@pytest.mark.asyncio
+async def test_request_policy_overrides_key_policy_in_prepare():
+    engine = _engine()
+    route = {**router._route_state(GROQ), "routes": ROUTES}
+    with patch.object(router, "selection", engine):
+        chosen = router._apply_routing_policy(
+            {"routing": {"policy": "cheapest"}},
+            {"routing_policy": {"policy": "fastest"}},
+            route,
+        )
+        assert chosen["provider_info"]["name"] == "Ollama (Local)"
+        assert chosen["costs"]["mapping_id"] == 3
+        assert chosen["routes"] == (OLLAMA, GROQ, BEDROCK)
+
+        by_key = router._apply_routing_policy(
+            {"stream": True}, {"routing_policy": {"policy": "fastest"}}, route
+        )
+        assert by_key["provider_info"]["name"] == "Groq"
+
+        # No policy anywhere: catalog order, untouched
+        assert router._apply_routing_policy({}, {}, route) is route
+
+        too_cheap = router._apply_routing_policy(
+            {"routing": {"policy": "cheapest", "max_cost": -1}}, {}, route
+        )
+        assert "cost ceiling" in too_cheap["error"]
+
+
+@pytest.mark.asyncio
+async def test_log_node_measures_throughput_after_the_first_token():
+    engine = SelectionEngine()
+    state = {
+        "start_time": router.time.time() - 5,
+        "stream": False,
+        "usage": {"completion_tokens": 100},
+        "costs": {"mapping_id": 4},
+        "upstream_ms": 2500.0,
+    }
+    with patch.object(router, "selection", engine):
+        # Without a TTFT estimate the call cannot be split
+        await router.log_node(state)
+        assert engine.stats()["mappings"] == {}
+
+        engine.observe(4, ttft_ms=500)
+        await router.log_node(state)
+    # 100 tokens over the 2s after the first one, not the 5s end to end
+    assert engine.stats()["mappings"][4]["tokens_per_sec"] == pytest.approx(50)
@@ -0,0 +1,170 @@
+import asyncio
+import time
+from types import MappingProxyType, SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from inference_gateway import main, router, shadow
+from inference_gateway.shadow import Shadow, ShadowRunner
+
+MESSAGES = [{"role": "user", "content": "Hi"}]
+
+
+def _completion(text):
+    message = SimpleNamespace(content=text)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def test_pick_samples_targets_and_honours_shadow_mode():
+    runner = ShadowRunner()
+    runner.targets = MappingProxyType(
+        {"openai/gpt-4o": (Shadow("groq/llama3-8b-8192", 0.0),)}
+    )
+    assert runner.pick("openai/gpt-4o") is None  # not sampled
+    assert runner.pick("openai/gpt-4o", forced=True).model == "groq/llama3-8b-8192"
+    assert runner.pick("anthropic/claude", forced=True) is None  # no target
+
+    runner.targets = MappingProxyType({"*": (Shadow("groq/llama3-8b-8192", 1.0),)})
+    assert runner.pick("anthropic/claude").model == "groq/llama3-8b-8192"
+    assert runner.pick("groq/llama3-8b-8192") is None  # never shadows itself
+
+
+@pytest.mark.asyncio
+async def test_shadows_run_in_background_and_pairs_are_batched():
+    runner = ShadowRunner(workers=2, batch_size=2, flush_ms=60_000)
+    target = Shadow("groq/llama3-8b-8192", 1.0)
+    inserted = []
+
+    async def flush():
+        inserted.append(list(runner._rows))
+        runner._rows = []
+
+    with (
+        patch.object(
+            shadow.litellm, "acompletion", AsyncMock(return_value=_completion("s"))
+        ),
+        patch.object(runner, "flush", flush),
+    ):
+        assert runner.submit(target, MESSAGES, "openai/gpt-4o", "p1")
+        assert runner.submit(target, MESSAGES, "openai/gpt-4o", "p2")
+        await runner._queue.join()
+
+    assert len(inserted) == 1 and len(inserted[0]) == 2
+    row = inserted[0][0]
+    assert row["prompt"] == "Hi"
+    assert (row["shadow_model"], row["shadow_response"]) == (target.model, "s")
+    assert row["created_at"] is not None
+    for task in runner._tasks:
+        task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_shadow_is_dropped_when_the_pool_is_saturated():
+    runner = ShadowRunner(workers=1, maxsize=1)
+    release = asyncio.Event()
+
+    async def slow_completion(**kwargs):
+        await release.wait()
+        return _completion("s")
+
+    with (
+        patch.object(shadow.litellm, "acompletion", slow_completion),
+        patch.object(runner, "flush", AsyncMock()),
+    ):
+        target = Shadow("groq/llama3-8b-8192", 1.0)
+        runner.submit(target, MESSAGES, "m", "a")
+        await asyncio.sleep(0)  # the worker takes the first one
+        assert runner.submit(target, MESSAGES, "m", "b")
+        assert not runner.submit(target, MESSAGES, "m", "c")
+        release.set()
+        await runner.stop()
+
+    assert runner.stats()["dropped"] == 1
+    assert runner.stats()["completed"] == 2
+
+
+@pytest.mark.asyncio
+async def test_streamed_primary_is_shadowed_after_it_finishes():
+    target = Shadow("groq/llama3-8b-8192", 1.0)
+    submit = MagicMock()
+    state = {
+        "stream_iterator": router.replay_cached_stream("openai/gpt-4o", "streamed"),
+        "start_time": time.time(),
+        "model_slug": "openai/gpt-4o",
+        "messages": MESSAGES,
+        "shadow_mode": True,
+        "cache_bypassed": True,
+    }
+
+    with (
+        patch.object(router.shadow_runner, "pick", MagicMock(return_value=target)),
+        patch.object(router.shadow_runner, "submit", submit),
+        patch.object(router.cache_writer, "submit", MagicMock()) as cache_submit,
+        patch.object(router.request_log_writer, "submit", AsyncMock()),
+    ):
+        [c async for c in router.wrap_stream_with_billing(state)]
+
+    submit.assert_called_once_with(target, MESSAGES, "openai/gpt-4o", "streamed")
+    cache_submit.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_shadow_node_reports_the_queued_shadow_model():
+    runner = ShadowRunner()
+    runner.targets = MappingProxyType(
+        {"openai/gpt-4o": (Shadow("groq/llama3-8b-8192", 0.0),)}
+    )
+    state = {
+        "model_slug": "openai/gpt-4o",
+        "messages": MESSAGES,
+        "response_content": "p",
+        "shadow_mode": True,
+    }
+    with (
+        patch.object(router, "shadow_runner", runner),
+        patch.object(runner, "submit", MagicMock(return_value=True)),
+    ):
+        update = await router.shadow_node(state)
+    assert update == {"shadow_model_slug": "groq/llama3-8b-8192"}
+
+
+@pytest.mark.asyncio
+async def test_shadow_mode_without_a_target_is_rejected():
+    runner = ShadowRunner()
+    runner.targets = MappingProxyType(
+        {"openai/gpt-4o": (Shadow("groq/llama3-8b-8192", 0.0),)}
+    )
+    result = {
+        "model_slug": "openai/gpt-4o",
+        "response_content": "p",
+        "usage": {},
+        "shadow_model_slug": "groq/llama3-8b-8192",
+    }
+    body = {"messages": MESSAGES, "shadow_mode": True}
+    headers = {"Authorization": "Bearer sk-test"}
+    ainvoke = AsyncMock(return_value=result)
+    transport = ASGITransport(app=main.app)
+    with (
+        patch.object(main, "shadow_runner", runner),
+        patch.object(main.gateway_app, "ainvoke", ainvoke),
+        patch.object(main.request_log_writer, "submit", AsyncMock()),
+        patch.object(main, "build_log_row", MagicMock()),
+    ):
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            missing = await ac.post(
+                "/v1/chat/completions",
+                json={**body, "model": "anthropic/claude"},
+                headers=headers,
+            )
+            served = await ac.post(
+                "/v1/chat/completions",
+                json={**body, "model": "openai/gpt-4o"},
+                headers=headers,
+            )
+
+    assert missing.status_code == 422
+    ainvoke.assert_awaited_once()  # only the request with a target ran
+    assert served.status_code == 200
+    assert served.json()["shadow_model"] == "groq/llama3-8b-8192"
+    assert "shadow_response" not in served.json()
@@ -0,0 +1,138 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from inference_gateway import router
+from inference_gateway.singleflight import SingleFlight
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_upstream_call():
+    flights = SingleFlight("*")
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"response_content": "hi", "usage": {"completion_tokens": 2}}
+
+    results = await asyncio.gather(*(flights.run("k", call) for _ in range(5)))
+
+    assert calls == 1
+    assert [r["response_content"] for r in results] == ["hi"] * 5
+    # Every caller gets the usage it is billed for; only followers are marked
+    assert all(r["usage"] == {"completion_tokens": 2} for r in results)
+    assert [bool(r.get("coalesced")) for r in results] == [False] + [True] * 4
+    assert flights.stats()["in_flight"] == 0
+
+    await flights.run("k", call)
+    assert calls == 2  # released once the first call returned
+
+
+@pytest.mark.asyncio
+async def test_stream_is_broadcast_to_every_subscriber():
+    flights = SingleFlight("*")
+    release = asyncio.Event()
+
+    async def upstream():
+        yield Chunk("a")
+        await release.wait()
+        yield Chunk("b")
+
+    async def call():
+        return {"stream_iterator": upstream()}
+
+    leader = await flights.run("k", call)
+    first = await leader["stream_iterator"].__anext__()
+    # Joins after the first chunk and still sees the whole stream
+    follower = await flights.run("k", call)
+    release.set()
+
+    rest = [c.text async for c in leader["stream_iterator"]]
+    followed = [c.text async for c in follower["stream_iterator"]]
+
+    assert [first.text] + rest == ["a", "b"]
+    assert followed == ["a", "b"]
+    assert follower["coalesced"] is True
+    assert flights.stats() == {
+        "orgs": "*",
+        "in_flight": 0,
+        "leaders": 1,
+        "followers": 1,
+    }
+
+
+@pytest.mark.asyncio
+async def test_leader_leaving_does_not_stop_followers():
+    flights = SingleFlight("*")
+    closed = asyncio.Event()
+
+    async def upstream():
+        try:
+            for text in "abc":
+                yield Chunk(text)
+                await asyncio.sleep(0)
+        finally:
+            closed.set()
+
+    async def call():
+        return {"stream_iterator": upstream()}
+
+    leader = await flights.run("k", call)
+    follower = await flights.run("k", call)
+    await leader["stream_iterator"].__anext__()
+    await leader["stream_iterator"].aclose()
+
+    assert [c.text async for c in follower["stream_iterator"]] == ["a", "b", "c"]
+    assert closed.is_set()
+
+
+@pytest.mark.asyncio
+async def test_users_in_one_org_do_not_share_calls():
+    served_with = []
+
+    async def call_with_failover(state):
+        # The user's own provider key, as resolved for the request
+        served_with.append(state["provider_info"]["api_key"])
+        await asyncio.sleep(0.01)
+        return {"response_content": state["provider_info"]["api_key"]}
+
+    def state(user_id):
+        return {
+            "org_id": 1,
+            "user_id": user_id,
+            "model_slug": "openai/gpt-4o",
+            "messages": [{"role": "user", "content": "Hi"}],
+            "provider_info": {"api_key": f"sk-user-{user_id}"},
+        }
+
+    with (
+        patch.object(router, "single_flight", SingleFlight("*")),
+        patch.object(router, "_call_with_failover", call_with_failover),
+    ):
+        results = await asyncio.gather(
+            router._dispatch(state(1)),
+            router._dispatch(state(2)),
+            router._dispatch(state(2)),
+        )
+
+    assert sorted(served_with) == ["sk-user-1", "sk-user-2"]
+    assert [r["response_content"] for r in results] == [
+        "sk-user-1",
+        "sk-user-2",
+        "sk-user-2",
+    ]
+
+
+def test_orgs_switch():
+    assert not SingleFlight("").enabled_for(1)
+    assert SingleFlight("*").enabled_for(1)
+    flights = SingleFlight("1, 7")
+    assert flights.enabled_for(7) and not flights.enabled_for(2)
+    assert not flights.enabled_for(None)
@@ -0,0 +1,131 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from inference_gateway import router
+from inference_gateway.singleflight import SingleFlight
+from inference_gateway.speculation import SpeculationPolicy
+
+ROUTE = {
+    "provider_info": {"name": "OpenAI", "model_name": "gpt-4o", "api_key": None},
+    "costs": {"input": 5.0, "output": 15.0, "mapping_id": 1},
+}
+AUTH = {"user_id": 1, "api_key_id": 2, "org_id": 3, "error": None}
+STATE = {"model_slug": "openai/gpt-4o", "messages": [{"role": "user", "content": "Hi"}]}
+
+
+def test_policy_adapts_to_hit_rate():
+    policy = SpeculationPolicy(enabled=True, max_hit_rate=0.2, min_samples=5, window=10)
+    for _ in range(4):
+        policy.record("m", 1, False)
+    assert not policy.should_speculate("m", 1)  # too few samples yet
+
+    policy.record("m", 1, False)
+    assert policy.should_speculate("m", 1)
+    assert not policy.should_speculate("m", 2)  # tracked per org
+
+    for _ in range(5):
+        policy.record("m", 1, True)
+    assert policy.hit_rate("m", 1) > 0.2
+    assert not policy.should_speculate("m", 1)
+
+    assert not SpeculationPolicy(enabled=False).should_speculate("m", 1)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("hit", [True, False])
+async def test_upstream_call_races_the_cache_lookup(hit):
+    policy = SpeculationPolicy(enabled=True, min_samples=1, window=1)
+    policy.record("openai/gpt-4o", 3, False)
+    upstream_started = asyncio.Event()
+    upstream_cancelled = asyncio.Event()
+
+    async def upstream(state):
+        upstream_started.set()
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            upstream_cancelled.set()
+            raise
+        return {"response_content": "fresh", "usage": {"completion_tokens": 1}}
+
+    async def cache_lookup(state):
+        await upstream_started.wait()  # the call starts before the lookup ends
+        if hit:
+            return {"is_cached": True, "response_content": "cached"}
+        return {"is_cached": False}
+
+    with (
+        patch.object(router, "speculation", policy),
+        patch.object(router, "auth_node", AsyncMock(return_value=AUTH)),
+        patch.object(router, "route_node", AsyncMock(return_value=dict(ROUTE))),
+        patch.object(router, "cache_lookup_node", cache_lookup),
+        patch.object(router, "get_provider_key", AsyncMock(return_value=None)),
+        patch.object(router, "_dispatch", upstream),
+    ):
+        result = await router.prepare_node(STATE)
+        if hit:
+            await asyncio.sleep(0)
+            assert upstream_cancelled.is_set()
+            assert "speculative_call" not in result
+            assert policy.stats()["wasted"] == 1
+        else:
+            llm = await router.call_llm_node(result)
+            assert llm["response_content"] == "fresh"
+            assert policy.stats()["used"] == 1
+
+    assert policy.hit_rate("openai/gpt-4o", 3) == (1.0 if hit else 0.0)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stream", [False, True])
+@pytest.mark.parametrize("outcome", ["cache hit", "lookup error"])
+async def test_discarded_speculative_call_stops_its_shared_flight(stream, outcome):
+    policy = SpeculationPolicy(enabled=True, min_samples=1, window=1)
+    policy.record("openai/gpt-4o", 3, False)
+    flights = SingleFlight("*")
+    upstream_started = asyncio.Event()
+    upstream_stopped = asyncio.Event()
+
+    async def chunks():
+        try:
+            while True:
+                yield {"choices": []}
+                await asyncio.sleep(0.01)
+        finally:
+            upstream_stopped.set()
+
+    async def call_with_failover(state):
+        upstream_started.set()
+        if stream:
+            return {"stream_iterator": chunks()}
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            upstream_stopped.set()
+            raise
+
+    async def cache_lookup(state):
+        await upstream_started.wait()
+        if outcome == "lookup error":
+            raise RuntimeError("cache down")
+        return {"is_cached": True, "response_content": "cached"}
+
+    with (
+        patch.object(router, "speculation", policy),
+        patch.object(router, "single_flight", flights),
+        patch.object(router, "_call_with_failover", call_with_failover),
+        patch.object(router, "auth_node", AsyncMock(return_value=AUTH)),
+        patch.object(router, "route_node", AsyncMock(return_value=dict(ROUTE))),
+        patch.object(router, "cache_lookup_node", cache_lookup),
+        patch.object(router, "get_provider_key", AsyncMock(return_value=None)),
+    ):
+        if outcome == "lookup error":
+            with pytest.raises(ExceptionGroup):
+                await router.prepare_node(STATE)
+        else:
+            await router.prepare_node(STATE)
+
+        # Nobody else joined the flight, so the upstream call is stopped
+        await asyncio.wait_for(upstream_stopped.wait(), 1)
+    assert flights.stats()["in_flight"] == 0
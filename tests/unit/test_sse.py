@@ -0,0 +1,139 @@
+import asyncio
+import json
+
+import litellm
+import pytest
+from inference_gateway.sse import (
+    SSE_COALESCE_WINDOW_MS,
+    FastEncoder,
+    coalesce_chunks,
+    coalesce_window,
+    encode_json,
+    new_encoder,
+    sse_generator,
+)
+
+
+def chunk(delta, finish_reason=None, **extra):
+    return litellm.ModelResponseStream(
+        id="chatcmpl-1",
+        created=123,
+        model="gpt-4o",
+        choices=[{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        **extra,
+    )
+
+
+def decode(event: bytes) -> dict:
+    assert event.startswith(b"data: ") and event.endswith(b"\n\n")
+    return json.loads(event[6:])
+
+
+def test_fast_encoder_matches_json_encoder_on_content_deltas():
+    encode = FastEncoder()
+    for text in ["Hello", ' "quoted"\n', "café \U0001f600", ""]:
+        c = chunk({"content": text})
+        fast, slow = decode(encode(c)), decode(encode_json(c))
+        assert fast["choices"][0]["delta"]["content"] == text
+        for field in ("id", "object", "created", "model"):
+            assert fast[field] == slow[field]
+        assert fast["choices"][0]["finish_reason"] is None
+
+
+def test_fast_encoder_falls_back_for_non_content_chunks():
+    encode = FastEncoder()
+    first = decode(encode(chunk({"role": "assistant", "content": ""})))
+    last = decode(encode(chunk({}, finish_reason="stop")))
+
+    assert first["choices"][0]["delta"]["role"] == "assistant"
+    assert last["choices"][0]["finish_reason"] == "stop"
+    assert decode(encode({"plain": "dict"})) == {"plain": "dict"}
+
+
+@pytest.mark.asyncio
+async def test_default_encoder_keeps_the_original_wire_bytes():
+    c = chunk({"content": "café"})
+
+    async def upstream():
+        yield c
+        raise ConnectionError("upstream closed")
+
+    events = [e async for e in sse_generator(upstream())]
+
+    assert new_encoder() is encode_json
+    assert events == [
+        f"data: {json.dumps(c.model_dump(), default=str)}\n\n".encode(),
+        f"data: {json.dumps({'error': 'upstream closed'})}\n\n".encode(),
+        b"data: [DONE]\n\n",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_sse_generator_reports_errors_and_terminates():
+    async def upstream():
+        yield chunk({"content": "hi"})
+        raise ConnectionError("upstream closed")
+
+    events = [e async for e in sse_generator(upstream(), FastEncoder())]
+
+    assert decode(events[0])["choices"][0]["delta"]["content"] == "hi"
+    assert decode(events[1]) == {"error": "upstream closed"}
+    assert events[-1] == b"data: [DONE]\n\n"
+
+
+async def paced(items):
+    for delay, item in items:
+        await asyncio.sleep(delay)
+        yield item
+
+
+@pytest.mark.asyncio
+async def test_coalescing_merges_deltas_within_window_but_not_first_token():
+    upstream = paced(
+        [
+            (0, chunk({"role": "assistant", "content": ""})),
+            (0, chunk({"content": "Hel"})),
+            (0, chunk({"content": "lo"})),
+            (0, chunk({"content": " wor"})),
+            (0, chunk({"content": "ld"})),
+            (0.05, chunk({"content": "!"})),
+            (0, chunk({}, finish_reason="stop")),
+        ]
+    )
+
+    out = [c async for c in coalesce_chunks(upstream, window_ms=20)]
+    texts = [c.choices[0].delta.content for c in out]
+
+    assert texts == ["", "Hel", "lo world", "!", None]
+    assert out[-1].choices[0].finish_reason == "stop"
+
+
+@pytest.mark.asyncio
+async def test_coalescing_closes_upstream_when_abandoned():
+    closed = asyncio.Event()
+
+    async def upstream():
+        try:
+            yield chunk({"content": "a"})
+            await asyncio.sleep(10)
+            yield chunk({"content": "b"})
+        finally:
+            closed.set()
+
+    stream = coalesce_chunks(upstream(), window_ms=20)
+    assert (await anext(stream)).choices[0].delta.content == "a"
+    waiting = asyncio.ensure_future(anext(stream))
+    await asyncio.sleep(0.01)
+    waiting.cancel()
+    await asyncio.gather(waiting, return_exceptions=True)
+    await stream.aclose()
+
+    assert closed.is_set()
+
+
+def test_coalesce_header_parsing():
+    assert coalesce_window(None) is None
+    assert coalesce_window("off") is None
+    assert coalesce_window("0") is None
+    assert coalesce_window("on") == SSE_COALESCE_WINDOW_MS
+    assert coalesce_window("20ms") == 20.0
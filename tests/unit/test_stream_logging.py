@@ -0,0 +1,134 @@
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from inference_gateway import router
+
+
+class Chunk:
+    def __init__(self, usage=None):
+        self.usage = usage
+
+
+async def upstream():
+    yield Chunk()
+    yield Chunk()
+    yield Chunk(usage={"prompt_tokens": 10, "completion_tokens": 20})
+
+
+@pytest.mark.asyncio
+async def test_stream_is_billed_and_logged_after_completion():
+    state = {
+        "stream_iterator": upstream(),
+        "start_time": time.time(),
+        "org_id": 3,
+        "api_key_id": 2,
+        "user_id": 1,
+        "model_slug": "openai/gpt-4o",
+        "provider_info": {"name": "OpenAI"},
+        "costs": {"input": 5.0, "output": 15.0, "mapping_id": 1},
+    }
+    billing = AsyncMock()
+    submit = AsyncMock()
+
+    with (
+        patch.object(router, "_execute_billing", billing),
+        patch.object(router.request_log_writer, "submit", submit),
+    ):
+        chunks = [c async for c in router.wrap_stream_with_billing(state)]
+
+    assert len(chunks) == 3
+    billing.assert_awaited_once()
+    row = submit.await_args.args[0]
+    assert row["completion_tokens"] == 20
+    assert row["chunk_count"] == 3
+    assert row["status_code"] == 200
+    assert row["ttft_ms"] is not None
+    assert row["stream_duration_ms"] >= row["ttft_ms"]
+
+
+@pytest.mark.asyncio
+async def test_finished_stream_is_stored_in_cache():
+    state = {
+        "stream_iterator": router.replay_cached_stream(
+            "openai/gpt-4o", "abc" * 100, 64
+        ),
+        "start_time": time.time(),
+        "model_slug": "openai/gpt-4o",
+        "messages": [{"role": "user", "content": "hi"}],
+        "org_id": 3,
+    }
+    store = MagicMock()
+
+    with (
+        patch.object(router.cache_writer, "submit", store),
+        patch.object(router.request_log_writer, "submit", AsyncMock()),
+    ):
+        chunks = [c async for c in router.wrap_stream_with_billing(state)]
+
+    assert len(chunks) == 6  # 5 text chunks + the finish chunk
+    store.assert_called_once_with(
+        "openai/gpt-4o", state["messages"], "abc" * 100, org_id=3
+    )
+
+
+@pytest.mark.asyncio
+async def test_oversized_or_broken_streams_are_not_cached():
+    async def broken():
+        async for chunk in router.replay_cached_stream("m", "partial"):
+            yield chunk
+        raise RuntimeError("upstream reset")
+
+    store = MagicMock()
+    base = {
+        "start_time": time.time(),
+        "model_slug": "m",
+        "messages": [{"content": "q"}],
+    }
+    with (
+        patch.object(router.cache_writer, "submit", store),
+        patch.object(router, "CACHE_STREAM_MAX_CHARS", 10),
+        patch.object(router.request_log_writer, "submit", AsyncMock()),
+    ):
+        state = {**base, "stream_iterator": router.replay_cached_stream("m", "x" * 11)}
+        [c async for c in router.wrap_stream_with_billing(state)]
+
+        with pytest.raises(RuntimeError):
+            state = {**base, "stream_iterator": broken()}
+            [c async for c in router.wrap_stream_with_billing(state)]
+
+    store.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_is_replayed_as_a_stream():
+    state = {
+        "is_cached": True,
+        "stream": True,
+        "response_content": "cached answer",
+        "start_time": time.time(),
+        "model_slug": "openai/gpt-4o",
+        "messages": [{"role": "user", "content": "hi"}],
+        "user_id": 1,
+        "api_key_id": 2,
+    }
+    billing = AsyncMock()
+    submit = AsyncMock()
+    store = MagicMock()
+
+    with (
+        patch.object(router, "_execute_billing", billing),
+        patch.object(router.cache_writer, "submit", store),
+        patch.object(router.request_log_writer, "submit", submit),
+    ):
+        result = await router.billing_node(state)
+        chunks = [c async for c in result["stream_iterator"]]
+
+    assert chunks[0].choices[0].delta.role == "assistant"
+    assert "".join(c.choices[0].delta.content or "" for c in chunks) == "cached answer"
+    assert chunks[-1].choices[0].finish_reason == "stop"
+    billing.assert_not_awaited()
+    store.assert_not_called()
+    row = submit.await_args.args[0]
+    assert row["is_cached"] is True
+    assert row["ttft_ms"] is not None
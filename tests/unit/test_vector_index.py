@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from shared.vector_index import LocalVectorIndex
+
+
+def unit(*values):
+    v = np.array(values, dtype=np.float32)
+    return (v / np.linalg.norm(v)).tolist()
+
+
+def test_search_is_scoped_to_tag_and_threshold():
+    index = LocalVectorIndex(dims=3, max_entries=8)
+    index.add("gpt-4o|1|ctx", "capital of France?", unit(1, 0, 0), "Paris", ttl=60)
+
+    assert index.search("gpt-4o|1|ctx", unit(1, 0.01, 0), 0.05).response == "Paris"
+    assert index.search("gpt-4o|2|ctx", unit(1, 0, 0), 0.05) is None
+    assert index.search("gpt-4o|1|ctx", unit(0, 1, 0), 0.05) is None
+
+
+def test_full_index_evicts_expired_then_least_recently_used():
+    index = LocalVectorIndex(dims=2, max_entries=2)
+    index.add("t", "a", unit(1, 0), "A", ttl=60)
+    index.add("t", "b", unit(0, 1), "B", ttl=60)
+    index.search("t", unit(1, 0), 0.01)  # "a" is now the most recently used
+
+    index.add("t", "c", unit(1, 1), "C", ttl=60)
+
+    assert len(index) == 2
+    assert index.search("t", unit(0, 1), 0.01) is None  # "b" was evicted
+    assert index.search("t", unit(1, 0), 0.01).response == "A"
+    assert index.evictions == 1
+
+
+def test_expired_entries_are_not_served():
+    index = LocalVectorIndex(dims=2, max_entries=4)
+    index.add("t", "a", unit(1, 0), "A", ttl=-1)
+
+    assert index.search("t", unit(1, 0), 0.5) is None
+    assert len(index) == 0
+
+
+@pytest.mark.asyncio
+async def test_snapshot_restores_a_warm_index(tmp_path):
+    path = str(tmp_path / "index.json")
+    index = LocalVectorIndex(dims=2, max_entries=4, snapshot_path=path)
+    index.add("t", "a", unit(1, 0), "A", ttl=60)
+    index.add("t", "b", unit(0, 1), "B", ttl=60)
+    await index.snapshot()
+    index.add("t", "c", unit(1, 1), "C", ttl=60)  # after the snapshot
+    await index.snapshot()
+
+    restored = LocalVectorIndex(dims=2, max_entries=4, snapshot_path=path)
+
+    assert len(restored) == 3
+    assert restored.search("t", unit(0, 1), 0.01).response == "B"
+    assert restored.search("t", unit(1, 1), 0.01).response == "C"
+    # Only the vector file the manifest points at is kept
+    assert len(list(tmp_path.glob("index.json.*.npy"))) == 1
+
+
+def test_hnsw_graph_serves_large_namespaces():
+    pytest.importorskip("hnswlib")
+    rng = np.random.default_rng(0)
+    index = LocalVectorIndex(dims=8, max_entries=64, graph_threshold=16)
+    vectors = rng.normal(size=(40, 8))
+    for i, v in enumerate(vectors):
+        index.add("t", f"p{i}", v.tolist(), f"r{i}", ttl=60)
+
+    assert index.stats()["graphs"] == 1
+    assert index.search("t", vectors[7].tolist(), 0.01).response == "r7"
+
+
+def test_hnsw_graph_survives_slot_reuse():
+    pytest.importorskip("hnswlib")
+    rng = np.random.default_rng(1)
+    index = LocalVectorIndex(dims=8, max_entries=24, graph_threshold=4)
+    old = rng.normal(size=(24, 8))
+    for i, v in enumerate(old):
+        index.add("t", f"p{i}", v.tolist(), f"r{i}", ttl=-1 if i % 3 else 60)
+
+    # Filling the index frees every expired slot at once; new entries and
+    # re-added ones then land in slots the graph still holds as deleted
+    new = rng.normal(size=(16, 8))
+    for round_ in range(3):
+        for i, v in enumerate(new):
+            index.add("t", f"q{i}", v.tolist(), f"s{i}.{round_}", ttl=60)
+
+    for i, v in enumerate(new):
+        assert index.search("t", v.tolist(), 0.01).response == f"s{i}.2"
+    for i in range(0, 24, 3):
+        assert index.search("t", old[i].tolist(), 0.01).response == f"r{i}"
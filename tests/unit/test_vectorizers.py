@@ -0,0 +1,38 @@
+import pytest
+from shared import vectorizers
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError, match="CACHE_VECTORIZER"):
+        vectorizers.build_vectorizer("tensorflow")
+
+
+def test_onnx_pooling_matches_sentence_transformers():
+    np = pytest.importorskip("numpy")
+
+    class FakeSession:
+        def run(self, _outputs, feeds):
+            # Two real tokens and one padding token with a huge embedding
+            return [np.array([[[1.0, 0.0], [3.0, 0.0], [100.0, 100.0]]])]
+
+    class FakeEncoding:
+        ids = (1, 2, 0)
+        attention_mask = (1, 1, 0)
+
+    class FakeTokenizer:
+        def encode_batch(self, texts):
+            return [FakeEncoding() for _ in texts]
+
+    vectorizer = vectorizers.OnnxTextVectorizer.__new__(vectorizers.OnnxTextVectorizer)
+    object.__setattr__(
+        vectorizer,
+        "__pydantic_private__",
+        {
+            "_session": FakeSession(),
+            "_tokenizer": FakeTokenizer(),
+            "_input_names": ["input_ids", "attention_mask"],
+        },
+    )
+
+    # Mean of the unmasked tokens ([2, 0]), L2-normalized
+    assert vectorizer._encode(["hi"]).tolist() == [[1.0, 0.0]]
@@ -0,0 +1,64 @@
+"""Routes and a fake upstream shared by the failover, hedging and circuit
+breaker tests."""
+
+import asyncio
+
+import openai
+from inference_gateway import catalog, router
+
+
+class ProviderError(openai.OpenAIError):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+ROUTES = tuple(
+    catalog.Route(
+        provider=provider,
+        litellm_prefix=catalog.litellm_prefix(provider),
+        model_name="llama-3",
+        input_cost=float(i),
+        output_cost=float(i),
+        mapping_id=i,
+        context_length=None,
+    )
+    for i, provider in enumerate(("Groq", "Amazon Bedrock", "Ollama (Local)"), 1)
+)
+
+
+def failover_state(routes=ROUTES, stream=False):
+    """Gateway state for `_call_with_failover`, prepared for the first route."""
+    return {
+        **router._route_state(routes[0]),
+        "routes": routes,
+        "user_id": 1,
+        "org_id": 7,
+        "model_slug": "meta/llama-3",
+        "messages": [{"role": "user", "content": "Hi"}],
+        "stream": stream,
+    }
+
+
+def fake_upstream(behaviour):
+    """Fake _call_upstream: `behaviour` maps provider -> outcome, or
+    (delay_s, outcome), where the outcome is an exception to raise or a
+    result to return. Returns the fake, the providers called and those
+    cancelled mid-delay."""
+    calls, cancelled = [], []
+
+    async def call(state):
+        provider = state["provider_info"]["name"]
+        calls.append(provider)
+        outcome = behaviour[provider]
+        delay, outcome = outcome if isinstance(outcome, tuple) else (0, outcome)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(provider)
+            raise
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return call, calls, cancelled